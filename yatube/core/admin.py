@@ -0,0 +1,23 @@
+from django.contrib import admin
+
+from .models import SlowQuery
+
+
+class SlowQueryAdmin(admin.ModelAdmin):
+    list_display = (
+        'sql', 'view', 'calls', 'total_ms', 'max_ms', 'location', 'template',
+        'last_seen',
+    )
+    list_filter = ('view',)
+    search_fields = ('sql', 'location', 'template')
+    readonly_fields = (
+        'fingerprint', 'sql', 'view', 'location', 'template', 'calls',
+        'total_ms', 'max_ms', 'last_seen',
+    )
+    empty_value_display = '-пусто-'
+
+    def has_add_permission(self, request):
+        return False
+
+
+admin.site.register(SlowQuery, SlowQueryAdmin)
@@ -0,0 +1,277 @@
+"""Двухуровневый кэш: локальный LRU процесса перед общим хранилищем.
+
+Общее хранилище — любой другой кэш из ``CACHES`` (файловый или в базе
+для локального запуска, memcached или redis в продакшене). Локальная
+копия живёт не дольше ``LOCAL_TIMEOUT`` секунд. Операции, после которых
+старое значение опасно (delete, incr, decr, clear), дописывают изменённые
+ключи в общий журнал инвалидаций. Остальные процессы читают журнал не
+чаще раза в ``SYNC_INTERVAL`` секунд и выбрасывают из локального уровня
+только эти ключи. Весь локальный уровень сбрасывается лишь после clear
+или если процесс отстал от журнала (записи вытеснены или их больше
+``LOG_LENGTH``).
+
+Пример настройки::
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.cache.TwoTierCache',
+            'OPTIONS': {'SHARED': 'shared'},
+        },
+        'shared': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': '/var/tmp/yatube_cache',
+        },
+    }
+"""
+import pickle
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from . import metrics
+
+SEQ_KEY = 'two-tier:seq'
+LOG_KEY = 'two-tier:log:{}'
+LOG_LENGTH = 1000
+LOG_TIMEOUT = 60 * 5
+# Запись журнала о clear: ключи кэша из make_key так не выглядят.
+CLEAR_ALL = '*'
+LOCAL_MAX_ENTRIES = 1000
+LOCAL_TIMEOUT = 5
+SYNC_INTERVAL = 1
+
+# Локальные хранилища общие для всех потоков процесса и, как у LocMemCache,
+# различаются по LOCATION.
+_stores = {}
+_stores_lock = Lock()
+
+
+class LocalStore:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.data = OrderedDict()
+        self.lock = Lock()
+        self.seq = None
+        self.next_sync = 0
+
+    def get(self, key):
+        with self.lock:
+            item = self.data.get(key)
+            if item is None:
+                return None
+            pickled, expires = item
+            if expires <= time.monotonic():
+                del self.data[key]
+                return None
+            self.data.move_to_end(key)
+        return pickled
+
+    def set(self, key, pickled, ttl):
+        with self.lock:
+            self.data[key] = (pickled, time.monotonic() + ttl)
+            self.data.move_to_end(key)
+            while len(self.data) > self.max_entries:
+                self.data.popitem(last=False)
+
+    def delete(self, *keys):
+        with self.lock:
+            for key in keys:
+                self.data.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+
+class TwoTierCache(BaseCache):
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._shared_alias = options['SHARED']
+        self._local_timeout = options.get('LOCAL_TIMEOUT', LOCAL_TIMEOUT)
+        self._sync_interval = options.get('SYNC_INTERVAL', SYNC_INTERVAL)
+        with _stores_lock:
+            self._local = _stores.setdefault(
+                location,
+                LocalStore(options.get('LOCAL_MAX_ENTRIES', LOCAL_MAX_ENTRIES))
+            )
+
+    @property
+    def shared(self):
+        return caches[self._shared_alias]
+
+    def _key(self, key, version):
+        return self.shared.make_key(key, version=version)
+
+    def _local_ttl(self, timeout):
+        if timeout is DEFAULT_TIMEOUT or timeout is None:
+            return self._local_timeout
+        return min(timeout, self._local_timeout)
+
+    def _remember(self, key, value, timeout, version):
+        ttl = self._local_ttl(timeout)
+        full_key = self._key(key, version)
+        if ttl <= 0:
+            self._local.delete(full_key)
+            return
+        self._local.set(
+            full_key, pickle.dumps(value, self.pickle_protocol), ttl
+        )
+
+    def _sync(self):
+        """Выбрасывает из локального уровня ключи, изменённые другими."""
+        now = time.monotonic()
+        if now < self._local.next_sync:
+            return
+        self._local.next_sync = now + self._sync_interval
+        last = self._local.seq
+        if last is not None:
+            # Обычно журнал не менялся: хватает одного обращения.
+            found = self.shared.get_many([SEQ_KEY, LOG_KEY.format(last + 1)])
+            if found == {SEQ_KEY: last} or (not found and not last):
+                return
+        seq = self.shared.get(SEQ_KEY) or 0
+        reset = last is None or not 0 <= seq - last <= LOG_LENGTH
+        if reset:
+            last = seq
+        log_keys = [LOG_KEY.format(n) for n in range(last + 1, seq + 2)]
+        entries = self.shared.get_many(log_keys)
+        if any(key not in entries for key in log_keys[:-1]):
+            reset = True
+        changed = [entries[key] for key in log_keys if key in entries]
+        # SEQ_KEY может отставать от занятых записей (см. _invalidate),
+        # поэтому журнал дочитывается дальше, пока записи идут подряд.
+        end = seq + 1 if log_keys[-1] in entries else seq
+        while end - last < LOG_LENGTH:
+            keys = self.shared.get(LOG_KEY.format(end + 1))
+            if keys is None:
+                break
+            changed.append(keys)
+            end += 1
+        if reset or any(CLEAR_ALL in keys for keys in changed):
+            self._local.clear()
+        else:
+            for keys in changed:
+                self._local.delete(*keys)
+        self._local.seq = end
+
+    def _invalidate(self, *keys):
+        """Записывает в журнал ключи (или ``CLEAR_ALL``) для других процессов.
+
+        incr у FileBasedCache — это get и set, поэтому два процесса могут
+        получить один номер. Запись занимает номер через add и при
+        коллизии берёт следующий, а читатели дочитывают журнал за
+        ``SEQ_KEY``: ключи не теряются, даже если номер в ``SEQ_KEY``
+        отстал. Читатель, увидевший номер раньше самой записи, сбросит
+        локальный уровень целиком.
+        """
+        try:
+            seq = self.shared.incr(SEQ_KEY)
+        except ValueError:
+            self.shared.add(SEQ_KEY, 0, None)
+            seq = self.shared.incr(SEQ_KEY)
+        while not self.shared.add(LOG_KEY.format(seq), keys, LOG_TIMEOUT):
+            seq += 1
+        if seq > (self.shared.get(SEQ_KEY) or 0):
+            self.shared.set(SEQ_KEY, seq, None)
+        # Свои записи процесс уже поправил сам; чужие, если они были между
+        # прошлой сверкой и этой записью, заберёт следующий _sync.
+        if self._local.seq is not None and seq == self._local.seq + 1:
+            self._local.seq = seq
+
+    def get(self, key, default=None, version=None):
+        self._sync()
+        pickled = self._local.get(self._key(key, version))
+        if pickled is not None:
+            metrics.record_cache(1, 0)
+            return pickle.loads(pickled)
+        missing = object()
+        value = self.shared.get(key, missing, version=version)
+        if value is missing:
+            metrics.record_cache(0, 1)
+            return default
+        metrics.record_cache(1, 0)
+        self._remember(key, value, DEFAULT_TIMEOUT, version)
+        return value
+
+    def get_many(self, keys, version=None):
+        self._sync()
+        keys = list(keys)
+        found = {}
+        misses = []
+        for key in keys:
+            pickled = self._local.get(self._key(key, version))
+            if pickled is None:
+                misses.append(key)
+            else:
+                found[key] = pickle.loads(pickled)
+        if misses:
+            fetched = self.shared.get_many(misses, version=version)
+            for key, value in fetched.items():
+                self._remember(key, value, DEFAULT_TIMEOUT, version)
+            found.update(fetched)
+        metrics.record_cache(len(found), len(keys) - len(found))
+        return found
+
+    def has_key(self, key, version=None):
+        self._sync()
+        if self._local.get(self._key(key, version)) is not None:
+            return True
+        return self.shared.has_key(key, version=version)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.shared.add(key, value, timeout, version=version)
+        if added:
+            self._remember(key, value, timeout, version)
+        return added
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set(key, value, timeout, version=version)
+        self._remember(key, value, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.shared.set_many(data, timeout, version=version)
+        for key, value in data.items():
+            if key not in failed:
+                self._remember(key, value, timeout, version)
+        return failed
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.shared.touch(key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        self.shared.delete(key, version=version)
+        full_key = self._key(key, version)
+        self._local.delete(full_key)
+        self._invalidate(full_key)
+
+    def delete_many(self, keys, version=None):
+        self.shared.delete_many(keys, version=version)
+        full_keys = [self._key(key, version) for key in keys]
+        self._local.delete(*full_keys)
+        self._invalidate(*full_keys)
+
+    def incr(self, key, delta=1, version=None):
+        value = self.shared.incr(key, delta, version=version)
+        full_key = self._key(key, version)
+        self._local.delete(full_key)
+        self._invalidate(full_key)
+        return value
+
+    def clear(self):
+        # Номер журнала переживает очистку, иначе отсчёт начнётся заново
+        # и другие процессы примут новые записи за уже прочитанные.
+        seq = self.shared.get(SEQ_KEY)
+        self.shared.clear()
+        if seq is not None:
+            self.shared.add(SEQ_KEY, seq, None)
+        self._local.clear()
+        self._invalidate(CLEAR_ALL)
+
+    def close(self, **kwargs):
+        self.shared.close(**kwargs)
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from core import profiling
+
+
+class Command(BaseCommand):
+    help = 'Выдаёт подписанное значение заголовка X-Profile'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--mode',
+            choices=profiling.MODES,
+            default=profiling.CPROFILE,
+            help='cprofile — pstats и стеки, sample — только стеки'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(profiling.make_token(options['mode']))
@@ -0,0 +1,205 @@
+"""Метрики запросов в памяти процесса в текстовом формате Prometheus.
+
+``MetricsMiddleware`` заводит на время запроса объект ``RequestStats``;
+обёртка ``execute`` соединений, шаблонный бэкенд ``TimedDjangoTemplates``
+и кэш ``TwoTierCache`` дописывают в него время SQL, рендеринга и
+попадания в кэш, а медленные SQL-запросы передаёт в ``core.slow_queries``.
+В конце запроса всё складывается в гистограммы по имени view. Гистограммы
+у каждого процесса свои: при нескольких воркерах Prometheus опрашивает
+каждый из них.
+"""
+import bisect
+import threading
+import time
+
+from django.template.backends.django import DjangoTemplates
+from django.template.backends.django import Template as DjangoTemplate
+
+from . import slow_queries
+
+PREFIX = 'yatube'
+DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+UNRESOLVED = 'unresolved'
+
+_state = threading.local()
+
+
+class RequestStats:
+    __slots__ = (
+        'request', 'queries', 'db_time', 'template_time', 'cache_hits',
+        'cache_misses',
+    )
+
+    def __init__(self, request=None):
+        self.request = request
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.db_time += duration
+            self.queries += 1
+            slow_queries.observe(sql, duration, self.view_name())
+
+    def view_name(self):
+        match = getattr(self.request, 'resolver_match', None)
+        return match.view_name if match else UNRESOLVED
+
+
+def current():
+    return getattr(_state, 'stats', None)
+
+
+def activate(stats):
+    _state.stats = stats
+
+
+def record_template(duration):
+    stats = current()
+    if stats is not None:
+        stats.template_time += duration
+
+
+def record_cache(hits, misses):
+    stats = current()
+    if stats is not None:
+        stats.cache_hits += hits
+        stats.cache_misses += misses
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def lines(self, name, labels):
+        total = 0
+        for bound, count in zip((*self.buckets, '+Inf'), self.counts):
+            total += count
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {total}'
+        yield f'{name}_sum{{{labels}}} {self.sum}'
+        yield f'{name}_count{{{labels}}} {total}'
+
+
+# Гистограммы: имя метрики, описание, границы, поле наблюдения.
+HISTOGRAMS = (
+    ('request_duration_seconds', 'Полное время запроса',
+     DURATION_BUCKETS, 'wall_time'),
+    ('db_queries', 'Число SQL-запросов на запрос',
+     QUERY_BUCKETS, 'queries'),
+    ('db_duration_seconds', 'Время SQL-запросов',
+     DURATION_BUCKETS, 'db_time'),
+    ('template_duration_seconds', 'Время рендеринга шаблонов',
+     DURATION_BUCKETS, 'template_time'),
+)
+COUNTERS = (
+    ('cache_hits_total', 'Попадания в кэш', 'cache_hits'),
+    ('cache_misses_total', 'Промахи кэша', 'cache_misses'),
+)
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {}
+            self.counters = {}
+            self.responses = {}
+
+    def observe(self, view, status, wall_time, stats):
+        values = {
+            'wall_time': wall_time,
+            'queries': stats.queries,
+            'db_time': stats.db_time,
+            'template_time': stats.template_time,
+            'cache_hits': stats.cache_hits,
+            'cache_misses': stats.cache_misses,
+        }
+        with self.lock:
+            for name, _, buckets, field in HISTOGRAMS:
+                histogram = self.histograms.get((name, view))
+                if histogram is None:
+                    histogram = Histogram(buckets)
+                    self.histograms[(name, view)] = histogram
+                histogram.observe(values[field])
+            for name, _, field in COUNTERS:
+                key = (name, view)
+                self.counters[key] = self.counters.get(key, 0) + values[field]
+            key = (view, status)
+            self.responses[key] = self.responses.get(key, 0) + 1
+
+    def render(self):
+        lines = []
+        with self.lock:
+            for name, help_text, _, _ in HISTOGRAMS:
+                lines.append(f'# HELP {PREFIX}_{name} {help_text}')
+                lines.append(f'# TYPE {PREFIX}_{name} histogram')
+                for (metric, view), histogram in sorted(
+                    self.histograms.items(), key=lambda item: item[0]
+                ):
+                    if metric == name:
+                        lines.extend(histogram.lines(
+                            f'{PREFIX}_{name}', f'view="{escape(view)}"'
+                        ))
+            for name, help_text, _ in COUNTERS:
+                lines.append(f'# HELP {PREFIX}_{name} {help_text}')
+                lines.append(f'# TYPE {PREFIX}_{name} counter')
+                for (metric, view), value in sorted(self.counters.items()):
+                    if metric == name:
+                        lines.append(
+                            f'{PREFIX}_{name}{{view="{escape(view)}"}} {value}'
+                        )
+            name = f'{PREFIX}_responses_total'
+            lines.append(f'# HELP {name} Ответы по view и статусу')
+            lines.append(f'# TYPE {name} counter')
+            for (view, status), value in sorted(self.responses.items()):
+                lines.append(
+                    f'{name}{{view="{escape(view)}",status="{status}"}} '
+                    f'{value}'
+                )
+        return '\n'.join(lines) + '\n'
+
+
+def escape(value):
+    return value.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+registry = Registry()
+
+
+class TimedTemplate(DjangoTemplate):
+    def render(self, context=None, request=None):
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            record_template(time.perf_counter() - started)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """Шаблонный бэкенд Django, который замеряет время рендеринга."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return TimedTemplate(template.template, self)
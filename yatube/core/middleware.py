@@ -0,0 +1,60 @@
+import logging
+import time
+from contextlib import ExitStack
+
+from django.db import connections
+from django.utils.deprecation import MiddlewareMixin
+
+from . import metrics, profiling, slow_queries
+
+logger = logging.getLogger(__name__)
+
+
+class MetricsMiddleware:
+    """Собирает метрики запроса по имени view, например ``posts:index``.
+
+    После ответа сбрасывает накопленный журнал медленных запросов в базу.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = metrics.RequestStats(request)
+        metrics.activate(stats)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(stats.execute_wrapper)
+                    )
+                response = self.get_response(request)
+        finally:
+            metrics.activate(None)
+        metrics.registry.observe(
+            stats.view_name(),
+            response.status_code,
+            time.perf_counter() - started,
+            stats,
+        )
+        try:
+            slow_queries.recorder.flush_if_due()
+        except Exception:
+            # Ответ уже готов: сбой журнала не должен превращаться в 500.
+            logger.exception('Не удалось сохранить медленные запросы')
+        return response
+
+
+class ProfilerMiddleware(MiddlewareMixin):
+    """Запускает view под профилировщиком по запросу или выборке.
+
+    Стоит последним в ``MIDDLEWARE``, чтобы остальные ``process_view``
+    успели отработать до профилирования.
+    """
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        mode = profiling.requested_mode(request)
+        if mode is None:
+            return None
+        return profiling.run(request, mode, view_func, view_args, view_kwargs)
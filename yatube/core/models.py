@@ -0,0 +1,67 @@
+from django.db import models
+
+
+class SlowQuery(models.Model):
+    """Сводка по медленным SQL-запросам с одинаковым отпечатком."""
+    fingerprint = models.CharField(
+        max_length=32,
+        unique=True,
+        verbose_name='Отпечаток'
+    )
+    sql = models.TextField(verbose_name='Нормализованный SQL')
+    view = models.CharField(
+        max_length=200,
+        blank=True,
+        verbose_name='View'
+    )
+    location = models.CharField(
+        max_length=300,
+        blank=True,
+        verbose_name='Строка кода'
+    )
+    template = models.CharField(
+        max_length=300,
+        blank=True,
+        verbose_name='Строка шаблона'
+    )
+    calls = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Вызовов'
+    )
+    total_ms = models.FloatField(
+        default=0,
+        verbose_name='Суммарное время, мс'
+    )
+    max_ms = models.FloatField(
+        default=0,
+        verbose_name='Максимальное время, мс'
+    )
+    last_seen = models.DateTimeField(verbose_name='Последний раз')
+
+    def __str__(self):
+        return self.sql[:80]
+
+    class Meta:
+        ordering = ['-total_ms']
+        verbose_name = 'Медленный запрос'
+        verbose_name_plural = 'Медленные запросы'
+
+
+class StoredFile(models.Model):
+    """Сколько строк ссылается на файл в хранилище по содержимому."""
+    name = models.CharField(
+        max_length=255,
+        unique=True,
+        verbose_name='Имя файла'
+    )
+    refs = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Ссылок'
+    )
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        verbose_name = 'Файл'
+        verbose_name_plural = 'Файлы'
@@ -0,0 +1,215 @@
+"""Профилирование отдельных запросов без передеплоя.
+
+Запрос профилируется, если в нём есть подписанный заголовок
+``X-Profile`` (значение выдаёт ``manage.py profile_token``), если staff
+добавил к адресу ``?_profile=cprofile`` или ``?_profile=sample``, или если
+его выбрала случайная выборка 1 из ``PROFILER_SAMPLE_RATE`` среди view из
+``PROFILER_SAMPLE_VIEWS``. Режим ``cprofile`` сохраняет pstats и свёрнутые
+стеки от сэмплера, режим ``sample`` — только свёрнутые стеки, зато почти
+без накладных расходов. Профили лежат в ``PROFILER_DIR``; старше
+``PROFILER_KEEP`` последних удаляются.
+"""
+import cProfile
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core import signing
+from django.utils import timezone
+
+CPROFILE = 'cprofile'
+SAMPLE = 'sample'
+MODES = (CPROFILE, SAMPLE)
+
+HEADER = 'HTTP_X_PROFILE'
+QUERY_FLAG = '_profile'
+SALT = 'core.profiling'
+TOKEN_MAX_AGE = 60 * 60
+KEEP = 50
+SAMPLE_INTERVAL = 0.005
+
+# Расширения файлов профиля и их MIME-типы для скачивания.
+FILES = {
+    'prof': 'application/octet-stream',
+    'collapsed': 'text/plain; charset=utf-8',
+    'json': 'application/json',
+}
+NAME = re.compile(r'^[\w.-]+$')
+
+
+def profiles_dir():
+    return getattr(
+        settings, 'PROFILER_DIR',
+        os.path.join(tempfile.gettempdir(), 'yatube_profiles'),
+    )
+
+
+def make_token(mode=CPROFILE):
+    return signing.dumps(mode, salt=SALT)
+
+
+def token_mode(token):
+    max_age = getattr(settings, 'PROFILER_TOKEN_MAX_AGE', TOKEN_MAX_AGE)
+    try:
+        mode = signing.loads(token, salt=SALT, max_age=max_age)
+    except signing.BadSignature:
+        return None
+    return mode if mode in MODES else None
+
+
+def requested_mode(request):
+    """Режим профилирования запроса или ``None``."""
+    token = request.META.get(HEADER)
+    if token:
+        return token_mode(token)
+    flag = request.GET.get(QUERY_FLAG)
+    if flag is not None and request.user.is_staff:
+        return flag if flag in MODES else CPROFILE
+    rate = getattr(settings, 'PROFILER_SAMPLE_RATE', 0)
+    views = getattr(settings, 'PROFILER_SAMPLE_VIEWS', ())
+    match = request.resolver_match
+    if rate and (not views or match.view_name in views):
+        if random.randrange(rate) == 0:
+            return SAMPLE
+    return None
+
+
+class Sampler:
+    """Раз в ``interval`` секунд снимает стек потока запроса."""
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                filename = os.path.basename(code.co_filename)
+                stack.append(
+                    f'{code.co_name} ({filename}:{code.co_firstlineno})'
+                )
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def collapsed(self):
+        """Формат flamegraph.pl и speedscope: ``стек;стек количество``."""
+        return ''.join(
+            f'{stack} {count}\n' for stack, count in self.stacks.items()
+        )
+
+
+def run(request, mode, view, args, kwargs):
+    """Выполняет view под профилировщиком и сохраняет профиль."""
+    profiler = cProfile.Profile() if mode == CPROFILE else None
+    interval = getattr(settings, 'PROFILER_SAMPLE_INTERVAL', SAMPLE_INTERVAL)
+    started = time.perf_counter()
+    response = None
+    try:
+        with Sampler(threading.get_ident(), interval) as sampler:
+            if profiler is None:
+                response = view(request, *args, **kwargs)
+            else:
+                response = profiler.runcall(view, request, *args, **kwargs)
+    finally:
+        name = save(request, mode, response, profiler, sampler, started)
+    response['X-Profile-Id'] = name
+    return response
+
+
+def save(request, mode, response, profiler, sampler, started):
+    directory = profiles_dir()
+    os.makedirs(directory, exist_ok=True)
+    now = timezone.now()
+    view_name = request.resolver_match.view_name
+    name = '{}-{}'.format(
+        now.strftime('%Y%m%d-%H%M%S-%f'), re.sub(r'\W', '_', view_name)
+    )
+    meta = {
+        'name': name,
+        'created': now.isoformat(),
+        'path': request.get_full_path(),
+        'view': view_name,
+        'mode': mode,
+        'status': response.status_code if response is not None else None,
+        'duration_ms': round((time.perf_counter() - started) * 1000, 3),
+        'samples': sum(sampler.stacks.values()),
+    }
+    base = os.path.join(directory, name)
+    if profiler is not None:
+        profiler.dump_stats(f'{base}.prof')
+    with open(f'{base}.collapsed', 'w', encoding='utf-8') as file:
+        file.write(sampler.collapsed())
+    # Метаданные пишутся последними: по ним профиль считается готовым.
+    with open(f'{base}.json', 'w', encoding='utf-8') as file:
+        json.dump(meta, file, ensure_ascii=False)
+    prune(directory)
+    return name
+
+
+def prune(directory):
+    """Кольцевой буфер: удаляет всё, кроме последних ``PROFILER_KEEP``."""
+    keep = getattr(settings, 'PROFILER_KEEP', KEEP)
+    names = sorted(
+        entry.name[:-len('.json')] for entry in os.scandir(directory)
+        if entry.name.endswith('.json')
+    )
+    for name in names[:-keep] if keep else names:
+        for extension in FILES:
+            try:
+                os.remove(os.path.join(directory, f'{name}.{extension}'))
+            except FileNotFoundError:
+                pass
+
+
+def profiles():
+    """Метаданные сохранённых профилей, новые первыми."""
+    directory = profiles_dir()
+    if not os.path.isdir(directory):
+        return []
+    found = []
+    for entry in os.scandir(directory):
+        if not entry.name.endswith('.json'):
+            continue
+        try:
+            with open(entry.path, encoding='utf-8') as file:
+                meta = json.load(file)
+        except (OSError, ValueError):
+            continue
+        meta['files'] = [
+            extension for extension in FILES
+            if os.path.exists(os.path.join(
+                directory, f'{meta["name"]}.{extension}'
+            ))
+        ]
+        found.append(meta)
+    return sorted(found, key=lambda meta: meta['name'], reverse=True)
+
+
+def profile_path(name, extension):
+    """Путь к файлу профиля или ``None``, если имя недопустимо."""
+    if extension not in FILES or not NAME.match(name):
+        return None
+    path = os.path.join(profiles_dir(), f'{name}.{extension}')
+    return path if os.path.exists(path) else None
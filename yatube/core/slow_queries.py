@@ -0,0 +1,214 @@
+"""Журнал медленных SQL-запросов.
+
+Обёртка ``execute`` из ``core.metrics`` передаёт сюда запросы дольше
+``SLOW_QUERY_THRESHOLD_MS``. Запрос пишется в лог вместе с отпечатком
+(SQL без значений), именем view, строкой кода проекта и строкой шаблона,
+из которых он был вызван. Сводка по отпечаткам копится в памяти и не чаще
+раза в ``SLOW_QUERY_FLUSH_INTERVAL`` секунд сбрасывается в ``SlowQuery``,
+где остаются ``SLOW_QUERY_TOP`` отпечатков с наибольшим суммарным
+временем.
+"""
+import hashlib
+import logging
+import os
+import re
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+THRESHOLD_MS = 100
+TOP = 50
+FLUSH_INTERVAL = 10
+
+# Модули, которые сами участвуют в замере и не считаются источником.
+OWN_FILES = ('metrics.py', 'middleware.py', 'slow_queries.py')
+
+STRINGS = re.compile(r"'(?:[^']|'')*'")
+NUMBERS = re.compile(r'\b\d+(?:\.\d+)?\b')
+PLACEHOLDER_LISTS = re.compile(r'\((?:\s*(?:%s|\?)\s*,)+\s*(?:%s|\?)\s*\)')
+SPACES = re.compile(r'\s+')
+
+
+def threshold_ms():
+    return getattr(settings, 'SLOW_QUERY_THRESHOLD_MS', THRESHOLD_MS)
+
+
+def top_size():
+    return getattr(settings, 'SLOW_QUERY_TOP', TOP)
+
+
+def flush_interval():
+    return getattr(settings, 'SLOW_QUERY_FLUSH_INTERVAL', FLUSH_INTERVAL)
+
+
+def normalize(sql):
+    """SQL без литералов и с одним ``(...)`` вместо списка параметров."""
+    sql = STRINGS.sub('?', sql)
+    sql = NUMBERS.sub('?', sql)
+    sql = PLACEHOLDER_LISTS.sub('(...)', sql)
+    return SPACES.sub(' ', sql).strip()
+
+
+def fingerprint(normalized):
+    return hashlib.md5(normalized.encode()).hexdigest()
+
+
+def _project_file(filename):
+    base = os.path.join(settings.BASE_DIR, '')
+    return (
+        filename.startswith(base)
+        and 'site-packages' not in filename
+        and not (
+            os.path.dirname(filename) == os.path.join(base, 'core')
+            and os.path.basename(filename) in OWN_FILES
+        )
+    )
+
+
+def origin():
+    """Строка кода проекта и строка шаблона, откуда пришёл запрос."""
+    location = template = ''
+    frame = sys._getframe(1)
+    while frame is not None and not (location and template):
+        code = frame.f_code
+        if not template and code.co_name == 'render_annotated':
+            # Самый внутренний узел шаблона, например {{ post.author }}.
+            node = frame.f_locals.get('self')
+            token = getattr(node, 'token', None)
+            source = getattr(node, 'origin', None)
+            if token is not None and source is not None:
+                template = f'{source.template_name}:{token.lineno}'
+        if not location and _project_file(code.co_filename):
+            path = os.path.relpath(code.co_filename, settings.BASE_DIR)
+            location = f'{path}:{frame.f_lineno} in {code.co_name}'
+        frame = frame.f_back
+    return location, template
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.totals = {}
+            self.pending = {}
+            self.next_flush = 0
+
+    def record(self, sql, duration_ms, view):
+        normalized = normalize(sql)
+        key = fingerprint(normalized)
+        location, template = origin()
+        logger.warning(
+            'Медленный запрос %.1f мс [%s] view=%s %s %s: %s',
+            duration_ms, key[:12], view, location, template, normalized
+        )
+        now = timezone.now()
+        with self.lock:
+            for store in (self.totals, self.pending):
+                entry = store.setdefault(key, {
+                    'sql': normalized, 'calls': 0, 'total_ms': 0.0,
+                    'max_ms': 0.0,
+                })
+                entry['calls'] += 1
+                entry['total_ms'] += duration_ms
+                entry['max_ms'] = max(entry['max_ms'], duration_ms)
+                entry.update(
+                    view=view, location=location, template=template,
+                    last_seen=now,
+                )
+            self._trim()
+
+    def _trim(self):
+        """Держит в памяти не больше удвоенного top-N отпечатков."""
+        limit = top_size()
+        if len(self.totals) <= limit * 2:
+            return
+        ranked = sorted(
+            self.totals, key=lambda key: self.totals[key]['total_ms'],
+            reverse=True,
+        )
+        for key in ranked[limit:]:
+            del self.totals[key]
+            self.pending.pop(key, None)
+
+    def top(self, limit=None):
+        with self.lock:
+            ranked = sorted(
+                self.totals.items(),
+                key=lambda item: item[1]['total_ms'],
+                reverse=True,
+            )
+        return ranked[:limit or top_size()]
+
+    def flush_if_due(self):
+        if self.pending and time.monotonic() >= self.next_flush:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            self.next_flush = time.monotonic() + flush_interval()
+        if pending:
+            save(pending)
+
+
+def _increment(queryset, entry, changes):
+    return queryset.update(
+        calls=F('calls') + entry['calls'],
+        total_ms=F('total_ms') + entry['total_ms'],
+        max_ms=Greatest(F('max_ms'), entry['max_ms']),
+        **changes,
+    )
+
+
+def save(pending):
+    from .models import SlowQuery
+
+    for key, entry in pending.items():
+        changes = {
+            'view': entry['view'][:200],
+            'location': entry['location'][:300],
+            'template': entry['template'][:300],
+            'last_seen': entry['last_seen'],
+        }
+        rows = SlowQuery.objects.filter(fingerprint=key)
+        if _increment(rows, entry, changes):
+            continue
+        try:
+            with transaction.atomic():
+                SlowQuery.objects.create(
+                    fingerprint=key,
+                    sql=entry['sql'],
+                    calls=entry['calls'],
+                    total_ms=entry['total_ms'],
+                    max_ms=entry['max_ms'],
+                    **changes,
+                )
+        except IntegrityError:
+            # Другой процесс успел создать строку: повторяем обновление.
+            _increment(rows, entry, changes)
+    keep = list(SlowQuery.objects.order_by('-total_ms').values_list(
+        'pk', flat=True
+    )[:top_size()])
+    SlowQuery.objects.exclude(pk__in=keep).delete()
+
+
+recorder = Recorder()
+
+
+def observe(sql, duration, view):
+    """Вызывается для каждого запроса; медленные передаёт в журнал."""
+    limit = threshold_ms()
+    duration_ms = duration * 1000
+    if limit is not None and duration_ms >= limit:
+        recorder.record(sql, duration_ms, view)
@@ -0,0 +1,138 @@
+"""Файловое хранилище, в котором имя файла — хеш его содержимого.
+
+``posts/photo.jpg`` сохраняется как ``posts/ab/cd/abcd…ef.jpg``: первые
+символы SHA-256 раскладывают файлы по вложенным каталогам, чтобы ни в
+одном не копились сотни тысяч записей. Одинаковые загрузки получают одно
+имя и хранятся один раз. Сколько строк ссылается на файл, считает
+``StoredFile``: ``acquire`` и ``release`` вызываются из сигналов модели,
+и файл удаляется после фиксации транзакции, когда ссылок не осталось.
+"""
+import hashlib
+import os
+import posixpath
+import time
+
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils.crypto import get_random_string
+from django.utils.deconstruct import deconstructible
+
+DEPTH = 2
+WIDTH = 2
+CHUNK_SIZE = 64 * 1024
+PARTIAL_SUFFIX = '.part'
+
+
+def file_digest(content):
+    """SHA-256 содержимого, читается кусками."""
+    digest = hashlib.sha256()
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    for chunk in content.chunks(CHUNK_SIZE):
+        digest.update(chunk)
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    return digest.hexdigest()
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    def __init__(self, location=None, base_url=None,
+                 file_permissions_mode=None, directory_permissions_mode=None,
+                 depth=DEPTH, width=WIDTH):
+        super().__init__(
+            location, base_url, file_permissions_mode,
+            directory_permissions_mode,
+        )
+        self.depth = depth
+        self.width = width
+
+    def hashed_name(self, name, digest):
+        """``каталог/ab/cd/хеш.расширение`` для исходного имени."""
+        directory = posixpath.dirname(name)
+        extension = posixpath.splitext(name)[1].lower()
+        shards = [
+            digest[level * self.width:(level + 1) * self.width]
+            for level in range(self.depth)
+        ]
+        return posixpath.join(directory, *shards, digest + extension)
+
+    def is_hashed(self, name):
+        """Лежит ли файл уже по адресу своего содержимого."""
+        parts = name.split('/')
+        if len(parts) < self.depth + 1:
+            return False
+        digest = posixpath.splitext(parts[-1])[0]
+        shards = parts[-self.depth - 1:-1]
+        return len(digest) == 64 and shards == [
+            digest[level * self.width:(level + 1) * self.width]
+            for level in range(self.depth)
+        ]
+
+    def _save(self, name, content):
+        name = self.hashed_name(name, file_digest(content))
+        if self.exists(name):
+            # Свежая дата защищает файл от gc_media и от удаления после
+            # release, пока ссылка нового владельца ещё не зафиксирована.
+            now = time.time()
+            os.utime(self.path(name), (now, now))
+            return name
+        # Пишем во временный файл и переименовываем: параллельная загрузка
+        # того же содержимого просто перезапишет файл тем же самым.
+        partial = super()._save(
+            f'{name}.{get_random_string(8)}{PARTIAL_SUFFIX}', content
+        )
+        os.replace(self.path(partial), self.path(name))
+        return name
+
+    def get_available_name(self, name, max_length=None):
+        # Настоящее имя выбирает _save по содержимому.
+        return name
+
+
+def acquire(name, storage):
+    """Ещё одна ссылка на файл."""
+    from .models import StoredFile
+
+    if not name or not storage.is_hashed(name):
+        return
+    rows = StoredFile.objects.filter(name=name)
+    if rows.update(refs=F('refs') + 1):
+        return
+    try:
+        with transaction.atomic():
+            StoredFile.objects.create(name=name, refs=1)
+    except IntegrityError:
+        rows.update(refs=F('refs') + 1)
+
+
+def release(name, storage):
+    """Минус одна ссылка; без ссылок файл удаляется после коммита.
+
+    Файлы не по адресу содержимого и файлы, которых нет в ``StoredFile``
+    (загружены до подсчёта ссылок), не трогаем.
+    """
+    from .models import StoredFile
+
+    if not name or not storage.is_hashed(name):
+        return
+    rows = StoredFile.objects.filter(name=name)
+    if not rows.update(refs=F('refs') - 1):
+        return
+    if not rows.filter(refs__lte=0).delete()[0]:
+        return
+    released = time.time()
+
+    def remove():
+        # За время до коммита файл могли загрузить снова: ссылка уже
+        # зафиксирована или _save только что обновил дату файла.
+        if rows.filter(refs__gt=0).exists():
+            return
+        try:
+            if os.path.getmtime(storage.path(name)) >= released:
+                return
+        except FileNotFoundError:
+            return
+        storage.delete(name)
+    transaction.on_commit(remove)
@@ -0,0 +1,383 @@
+import json
+import pstats
+import re
+import shutil
+import tempfile
+import threading
+import time
+from unittest import mock
+
+from django.core.cache import cache, caches
+from django.db import DatabaseError, connection
+from django.template import Context, Template
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from core import metrics, profiling, slow_queries
+from core.cache import LOG_KEY, SEQ_KEY
+from core.models import SlowQuery
+from posts.models import Post, User
+
+TWO_TIER = {
+    'BACKEND': 'core.cache.TwoTierCache',
+    'OPTIONS': {
+        'SHARED': 'shared',
+        'LOCAL_MAX_ENTRIES': 2,
+        'LOCAL_TIMEOUT': 60,
+        'SYNC_INTERVAL': 0,
+    },
+}
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'two-tier-tests',
+    },
+    # Два алиаса с разными локальными уровнями изображают два воркера.
+    'worker_a': {**TWO_TIER, 'LOCATION': 'worker-a'},
+    'worker_b': {**TWO_TIER, 'LOCATION': 'worker-b'},
+})
+class TwoTierCacheTests(TestCase):
+    def setUp(self):
+        self.shared = caches['shared']
+        self.worker_a = caches['worker_a']
+        self.worker_b = caches['worker_b']
+        self.worker_a.clear()
+        # Оба воркера сверяются с журналом после очистки.
+        self.worker_a.get('sync')
+        self.worker_b.get('sync')
+
+    def test_read_is_served_from_local_tier(self):
+        """Прочитанное значение не идёт повторно в общее хранилище."""
+        self.worker_a.set('key', 'value')
+        self.shared.set('key', 'changed behind the back')
+        self.assertEqual(self.worker_a.get('key'), 'value')
+        self.assertEqual(self.worker_b.get('key'), 'changed behind the back')
+
+    def test_local_tier_is_lru(self):
+        """Локальный уровень вытесняет давно не читанные ключи."""
+        self.worker_a.set('first', 1)
+        self.worker_a.set('second', 2)
+        self.worker_a.get('first')
+        self.worker_a.set('third', 3)
+        self.shared.set('first', 'shared')
+        self.shared.set('second', 'shared')
+        self.assertEqual(self.worker_a.get('first'), 1)
+        self.assertEqual(self.worker_a.get('second'), 'shared')
+
+    def test_delete_invalidates_other_workers(self):
+        """Удаление в одном воркере видно в другом."""
+        self.worker_a.set('key', 'value')
+        self.assertEqual(self.worker_b.get('key'), 'value')
+        self.worker_a.delete('key')
+        self.assertIsNone(self.worker_b.get('key'))
+
+    def test_incr_invalidates_other_workers(self):
+        """Счётчики версий через incr сразу видны другим воркерам."""
+        self.worker_a.set('generation', 1)
+        self.assertEqual(self.worker_b.get('generation'), 1)
+        self.assertEqual(self.worker_a.incr('generation'), 2)
+        self.assertEqual(self.worker_b.get('generation'), 2)
+
+    def test_delete_keeps_other_local_keys(self):
+        """Другие воркеры выбрасывают только изменённый ключ."""
+        self.worker_a.set('changed', 1)
+        self.worker_a.set('untouched', 1)
+        self.assertEqual(self.worker_b.get('changed'), 1)
+        self.assertEqual(self.worker_b.get('untouched'), 1)
+        self.shared.set('untouched', 'shared')
+        self.worker_a.delete('changed')
+        self.assertIsNone(self.worker_b.get('changed'))
+        self.assertEqual(self.worker_b.get('untouched'), 1)
+
+    def test_clear_resets_other_workers(self):
+        self.worker_a.set('key', 'value')
+        self.assertEqual(self.worker_b.get('key'), 'value')
+        self.worker_a.clear()
+        self.assertIsNone(self.worker_b.get('key'))
+
+    def test_missing_log_entry_resets_local_tier(self):
+        """Если журнал вытеснен, локальный уровень сбрасывается целиком."""
+        self.worker_a.set('key', 'value')
+        self.assertEqual(self.worker_b.get('key'), 'value')
+        self.shared.set('key', 'changed')
+        self.worker_a.delete('other')
+        self.shared.delete(LOG_KEY.format(self.shared.get(SEQ_KEY)))
+        self.assertEqual(self.worker_b.get('key'), 'changed')
+
+    def test_log_slot_collision_keeps_both_entries(self):
+        """Один номер от неатомарного incr: вторая запись берёт следующий."""
+        self.worker_a.set('first', 1)
+        self.worker_a.set('second', 1)
+        self.assertEqual(self.worker_b.get_many(['first', 'second']), {
+            'first': 1, 'second': 1,
+        })
+        self.shared.set_many({'first': 'shared', 'second': 'shared'})
+        seq = self.shared.get(SEQ_KEY)
+        # Другой воркер уже занял следующий номер, но SEQ_KEY не сдвинул.
+        self.shared.add(
+            LOG_KEY.format(seq + 1), (self.shared.make_key('first'),)
+        )
+        self.worker_a.delete('unrelated')
+        self.assertEqual(self.shared.get(SEQ_KEY), seq + 2)
+        self.assertEqual(self.worker_b.get('first'), 'shared')
+        self.assertEqual(self.worker_b.get('second'), 1)
+
+    def test_entries_past_seq_are_read(self):
+        self.worker_a.set('key', 'value')
+        self.assertEqual(self.worker_b.get('key'), 'value')
+        self.shared.set('key', 'changed')
+        seq = self.shared.get(SEQ_KEY)
+        self.shared.add(
+            LOG_KEY.format(seq + 1), (self.shared.make_key('key'),)
+        )
+        self.assertEqual(self.worker_b.get('key'), 'changed')
+
+    def test_get_many_merges_tiers(self):
+        self.worker_a.set('local', 1)
+        self.shared.set('shared', 2)
+        self.assertEqual(
+            self.worker_a.get_many(['local', 'shared', 'missing']),
+            {'local': 1, 'shared': 2},
+        )
+
+    def test_add_does_not_override(self):
+        self.worker_a.set('key', 'value')
+        self.assertFalse(self.worker_b.add('key', 'other'))
+        self.assertEqual(self.worker_b.get('key'), 'value')
+
+
+class MetricsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.staff = User.objects.create_user(username='Staff', is_staff=True)
+        cls.user = User.objects.create_user(username='Author1')
+        Post.objects.create(text='Test post text', author=cls.user)
+
+    def setUp(self):
+        metrics.registry.reset()
+
+    def staff_metrics(self):
+        client = Client()
+        client.force_login(self.staff)
+        return client.get(reverse('metrics')).content.decode()
+
+    def test_request_is_recorded_per_view(self):
+        self.client.get(reverse('posts:index'))
+        body = self.staff_metrics()
+        self.assertIn(
+            'yatube_request_duration_seconds_count{view="posts:index"} 1',
+            body
+        )
+        self.assertIn(
+            'yatube_responses_total{view="posts:index",status="200"} 1', body
+        )
+        queries = re.search(
+            r'yatube_db_queries_sum\{view="posts:index"\} (\S+)', body
+        )
+        self.assertGreater(float(queries.group(1)), 0)
+        rendering = re.search(
+            r'yatube_template_duration_seconds_sum'
+            r'\{view="posts:index"\} (\S+)',
+            body
+        )
+        self.assertGreater(float(rendering.group(1)), 0)
+
+    def test_cache_hits_and_misses(self):
+        stats = metrics.RequestStats()
+        metrics.activate(stats)
+        try:
+            cache.set('metrics-key', 1)
+            cache.get('metrics-key')
+            cache.get('missing-key')
+        finally:
+            metrics.activate(None)
+        self.assertEqual((stats.cache_hits, stats.cache_misses), (1, 1))
+
+    def test_metrics_are_protected(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_token(self):
+        response = self.client.get(
+            reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret'
+        )
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(
+            reverse('metrics'), HTTP_AUTHORIZATION='Bearer wrong'
+        )
+        self.assertEqual(response.status_code, 403)
+
+    def test_histogram_buckets(self):
+        histogram = metrics.Histogram((1, 5))
+        for value in (0, 1, 3, 10):
+            histogram.observe(value)
+        lines = list(histogram.lines('name', 'view="v"'))
+        self.assertEqual(lines[:3], [
+            'name_bucket{view="v",le="1"} 2',
+            'name_bucket{view="v",le="5"} 3',
+            'name_bucket{view="v",le="+Inf"} 4',
+        ])
+
+
+class SlowQueryTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Author1')
+        Post.objects.create(text='Test post text', author=cls.user)
+
+    def setUp(self):
+        slow_queries.recorder.reset()
+
+    def test_normalize(self):
+        self.assertEqual(
+            slow_queries.normalize(
+                "SELECT * FROM t WHERE a = 'x' AND b IN (%s, %s, %s)\n"
+                "  LIMIT 21"
+            ),
+            'SELECT * FROM t WHERE a = ? AND b IN (...) LIMIT ?',
+        )
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=0)
+    def test_slow_queries_are_attributed_and_saved(self):
+        with self.assertLogs('core.slow_queries', 'WARNING'):
+            self.client.get(reverse('posts:index'))
+        saved = SlowQuery.objects.filter(view='posts:index')
+        self.assertTrue(saved.exists())
+        self.assertTrue(
+            saved.filter(location__startswith='posts/').exists()
+        )
+        top = slow_queries.recorder.top()
+        self.assertEqual(
+            top[0][1]['total_ms'],
+            max(entry['total_ms'] for _, entry in top),
+        )
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=0)
+    def test_template_line(self):
+        """Ленивая загрузка из шаблона указывает на строку шаблона."""
+        post = Post.objects.only('pk', 'text').get()
+        template = Template('{{ post.author.username }}')
+        stats = metrics.RequestStats()
+        with connection.execute_wrapper(stats.execute_wrapper):
+            with self.assertLogs('core.slow_queries', 'WARNING'):
+                template.render(Context({'post': post}))
+        entries = [entry for _, entry in slow_queries.recorder.top()]
+        self.assertTrue(
+            any(entry['template'].endswith(':1') for entry in entries)
+        )
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=0)
+    def test_failed_flush_keeps_response(self):
+        with mock.patch.object(
+            slow_queries, 'save', side_effect=DatabaseError
+        ), self.assertLogs('core.middleware', 'ERROR'):
+            with self.assertLogs('core.slow_queries', 'WARNING'):
+                response = self.client.get(reverse('posts:index'))
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(SLOW_QUERY_TOP=1)
+    def test_database_keeps_top(self):
+        for duration in (5, 1, 3):
+            slow_queries.recorder.record(
+                f'SELECT {duration} FROM t{duration}', duration, 'view'
+            )
+        slow_queries.recorder.flush()
+        self.assertEqual(SlowQuery.objects.count(), 1)
+        self.assertEqual(SlowQuery.objects.get().total_ms, 5)
+
+
+class ProfilerTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.staff = User.objects.create_user(username='Staff', is_staff=True)
+        cls.user = User.objects.create_user(username='Author1')
+        cls.post = Post.objects.create(text='Test post text', author=cls.user)
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.settings_override = override_settings(PROFILER_DIR=directory)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        self.staff_client = Client()
+        self.staff_client.force_login(self.staff)
+
+    def test_plain_request_is_not_profiled(self):
+        response = self.client.get(reverse('posts:index'))
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(profiling.profiles(), [])
+
+    def test_signed_header(self):
+        response = self.client.get(
+            reverse('posts:index'),
+            HTTP_X_PROFILE=profiling.make_token(profiling.CPROFILE),
+        )
+        name = response['X-Profile-Id']
+        [profile] = profiling.profiles()
+        self.assertEqual(profile['name'], name)
+        self.assertEqual(profile['view'], 'posts:index')
+        self.assertEqual(profile['files'], ['prof', 'collapsed', 'json'])
+        pstats.Stats(profiling.profile_path(name, 'prof'))
+
+    def test_forged_header_and_non_staff_flag_are_ignored(self):
+        self.client.get(reverse('posts:index'), HTTP_X_PROFILE='forged')
+        self.client.force_login(self.user)
+        self.client.get(reverse('posts:index'), {'_profile': 'cprofile'})
+        self.assertEqual(profiling.profiles(), [])
+
+    def test_staff_flag_and_download(self):
+        response = self.staff_client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+            {'_profile': 'sample'},
+        )
+        name = response['X-Profile-Id']
+        listing = self.staff_client.get(reverse('profiles'))
+        self.assertContains(listing, name)
+        download = self.staff_client.get(reverse(
+            'profile_download', kwargs={'name': name, 'extension': 'json'}
+        ))
+        self.assertEqual(
+            json.loads(b''.join(download.streaming_content))['mode'],
+            'sample',
+        )
+        anonymous = self.client.get(reverse(
+            'profile_download', kwargs={'name': name, 'extension': 'json'}
+        ))
+        self.assertEqual(anonymous.status_code, 302)
+
+    @override_settings(
+        PROFILER_SAMPLE_RATE=1, PROFILER_SAMPLE_VIEWS=('posts:profile',)
+    )
+    def test_random_sampling_limited_to_views(self):
+        self.client.get(reverse('posts:index'))
+        self.client.get(
+            reverse('posts:profile', kwargs={'username': 'Author1'})
+        )
+        self.assertEqual(
+            [profile['view'] for profile in profiling.profiles()],
+            ['posts:profile'],
+        )
+
+    @override_settings(PROFILER_KEEP=2)
+    def test_ring_buffer(self):
+        for _ in range(3):
+            self.staff_client.get(reverse('posts:index'), {'_profile': ''})
+        self.assertEqual(len(profiling.profiles()), 2)
+
+    def test_sampler_collapsed_stacks(self):
+        with profiling.Sampler(threading.get_ident(), 0.001) as sampler:
+            deadline = time.monotonic() + 0.05
+            while time.monotonic() < deadline:
+                pass
+        line = sampler.collapsed().splitlines()[0]
+        stack, count = line.rsplit(' ', 1)
+        self.assertIn('test_sampler_collapsed_stacks', stack)
+        self.assertGreater(int(count), 0)
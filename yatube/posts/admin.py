@@ -5,6 +5,7 @@ from .models import Post
 from .models import Group
 from .models import Comment
 from .models import Follow
+from . import search
 
 
 class PostAdmin(admin.ModelAdmin):
@@ -14,6 +15,11 @@ class PostAdmin(admin.ModelAdmin):
     list_editable = ('group',)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        return search.get_backend().filter(queryset, search_term), False
+
 
 class GroupAdmin(admin.ModelAdmin):
     list_display = ('pk', 'title', 'description')
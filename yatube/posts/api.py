@@ -0,0 +1,276 @@
+"""JSON API для чтения лент, постов, комментариев, групп и подписчиков.
+
+Ответы собираются из словарей без форм и шаблонов; если установлен
+``orjson``, сериализует он. Списки листаются курсорами ``CursorPaginator``,
+``fields=id,text`` оставляет в объектах только перечисленные поля, а
+условные GET обслуживает ``http_cache`` — так же, как HTML-страницы.
+Каждый ответ выполняет постоянное число SQL-запросов.
+"""
+import json
+from datetime import datetime
+
+from django.http import HttpResponse
+from django.views.decorators.http import require_safe
+
+from . import feed_cache, http_cache, threads, timeline
+from .models import FEED_FIELDS, Comment, Follow, Group, Post, User
+from .utils import CURSOR_PARAM, CursorPaginator, InvalidCursor
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+FIELDS_PARAM = 'fields'
+LIMIT_PARAM = 'limit'
+
+POST_FIELDS = {
+    'id': lambda post: post.pk,
+    'text': lambda post: post.text,
+    'pub_date': lambda post: post.pub_date,
+    'author': lambda post: post.author.username,
+    'group': lambda post: post.group.slug if post.group_id else None,
+    'image': lambda post: post.image.url if post.image else None,
+    'comment_count': lambda post: post.comment_count,
+}
+COMMENT_FIELDS = {
+    'id': lambda comment: comment.pk,
+    'post': lambda comment: comment.post_id,
+    'author': lambda comment: comment.author.username,
+    'text': lambda comment: comment.text,
+    'created': lambda comment: comment.created,
+    'parent': lambda comment: comment.parent_id,
+    'depth': lambda comment: comment.depth,
+    'reply_count': lambda comment: comment.reply_count,
+}
+GROUP_FIELDS = {
+    'id': lambda group: group.pk,
+    'slug': lambda group: group.slug,
+    'title': lambda group: group.title,
+    'description': lambda group: group.description,
+}
+USER_FIELDS = {
+    'id': lambda follow: follow.user_id,
+    'username': lambda follow: follow.user.username,
+    'first_name': lambda follow: follow.user.first_name,
+    'last_name': lambda follow: follow.user.last_name,
+}
+
+
+class BadRequest(Exception):
+    pass
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} не сериализуется в JSON')
+
+
+def dumps(data):
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(
+        data, ensure_ascii=False, separators=(',', ':'), default=_default
+    ).encode()
+
+
+def json_response(data, status=200):
+    return HttpResponse(
+        dumps(data), status=status, content_type='application/json'
+    )
+
+
+def error(message, status):
+    return json_response({'detail': message}, status=status)
+
+
+def selected_fields(request, available):
+    """Поля из ``fields=``; по умолчанию все."""
+    requested = request.GET.get(FIELDS_PARAM)
+    if not requested:
+        return list(available.items())
+    names = [name.strip() for name in requested.split(',') if name.strip()]
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        raise BadRequest(f'Неизвестные поля: {", ".join(unknown)}')
+    return [(name, available[name]) for name in names]
+
+
+def serialize(obj, fields):
+    return {name: getter(obj) for name, getter in fields}
+
+
+def page_size(request):
+    try:
+        size = int(request.GET.get(LIMIT_PARAM, PAGE_SIZE))
+    except ValueError:
+        raise BadRequest('limit должен быть числом')
+    return min(max(size, 1), MAX_PAGE_SIZE)
+
+
+def link(request, cursor):
+    if cursor is None:
+        return None
+    params = request.GET.copy()
+    params[CURSOR_PARAM] = cursor
+    return f'{request.path}?{params.urlencode()}'
+
+
+def page_response(request, queryset, available,
+                  ordering=('-pub_date', '-pk'), paginator_class=None):
+    """Страница списка по курсору: один запрос к базе.
+
+    ``paginator_class(size)`` подменяет ``CursorPaginator`` по
+    ``queryset``, если страница собирается иначе.
+    """
+    try:
+        fields = selected_fields(request, available)
+        if paginator_class is None:
+            paginator = CursorPaginator(
+                queryset, page_size(request), ordering
+            )
+        else:
+            paginator = paginator_class(page_size(request))
+        page = paginator.cursor_page(request.GET.get(CURSOR_PARAM))
+    except BadRequest as bad:
+        return error(str(bad), 400)
+    except InvalidCursor:
+        return error('Недопустимый курсор', 400)
+    return json_response({
+        'results': [serialize(obj, fields) for obj in page],
+        'next': link(request, page.next_cursor),
+        'previous': link(request, page.previous_cursor),
+    })
+
+
+def not_found():
+    return error('Не найдено', 404)
+
+
+def feed_posts():
+    return Post.objects.for_feed().only(*FEED_FIELDS, 'comment_count')
+
+
+@require_safe
+@http_cache.conditional_page(http_cache.index_state)
+def posts(request):
+    return page_response(request, feed_posts(), POST_FIELDS)
+
+
+@require_safe
+@http_cache.conditional_page(http_cache.post_state)
+def post(request, post_id):
+    found = feed_posts().filter(pk=post_id).first()
+    if found is None:
+        return not_found()
+    try:
+        fields = selected_fields(request, POST_FIELDS)
+    except BadRequest as bad:
+        return error(str(bad), 400)
+    return json_response(serialize(found, fields))
+
+
+@require_safe
+@http_cache.conditional_page(http_cache.post_state)
+def comments(request, post_id):
+    if not Post.objects.filter(pk=post_id).exists():
+        return not_found()
+    queryset = Comment.objects.filter(post_id=post_id).select_related(
+        'author'
+    ).only(*threads.FIELDS)
+    return page_response(
+        request, queryset, COMMENT_FIELDS, ordering=('-created', '-pk')
+    )
+
+
+def groups_state(request):
+    return http_cache.Freshness(['groups'], [feed_cache.POSTS], None)
+
+
+@require_safe
+@http_cache.conditional_page(groups_state)
+def groups(request):
+    return page_response(
+        request, Group.objects.all(), GROUP_FIELDS, ordering=('pk',)
+    )
+
+
+@require_safe
+@http_cache.conditional_page(http_cache.group_state)
+def group_posts(request, slug):
+    group_id = Group.objects.filter(slug=slug).values_list(
+        'pk', flat=True
+    ).first()
+    if group_id is None:
+        return not_found()
+    return page_response(
+        request, feed_posts().filter(group_id=group_id), POST_FIELDS
+    )
+
+
+@require_safe
+@http_cache.conditional_page(http_cache.profile_state)
+def user_posts(request, username):
+    author_id = User.objects.filter(username=username).values_list(
+        'pk', flat=True
+    ).first()
+    if author_id is None:
+        return not_found()
+    return page_response(
+        request, feed_posts().filter(author_id=author_id), POST_FIELDS
+    )
+
+
+def followers_state(request, username):
+    author_id = User.objects.filter(username=username).values_list(
+        'pk', flat=True
+    ).first()
+    if author_id is None:
+        return None
+    return http_cache.Freshness(
+        [f'followers:{author_id}'],
+        [feed_cache.followers_scope(author_id)],
+        None,
+    )
+
+
+@require_safe
+@http_cache.conditional_page(followers_state)
+def followers(request, username):
+    author_id = User.objects.filter(username=username).values_list(
+        'pk', flat=True
+    ).first()
+    if author_id is None:
+        return not_found()
+    queryset = Follow.objects.filter(author_id=author_id).select_related(
+        'user'
+    ).only(
+        'id', 'user', 'user__username', 'user__first_name', 'user__last_name'
+    )
+    return page_response(request, queryset, USER_FIELDS, ordering=('-pk',))
+
+
+def follow_state(request):
+    if not request.user.is_authenticated:
+        return None
+    return http_cache.Freshness(
+        [f'follow:{request.user.pk}'],
+        [feed_cache.POSTS, feed_cache.follow_scope(request.user.pk)],
+        None,
+    )
+
+
+@require_safe
+@http_cache.conditional_page(follow_state)
+def follow_feed(request):
+    if not request.user.is_authenticated:
+        return error('Нужна авторизация', 401)
+    return page_response(
+        request, None, POST_FIELDS,
+        paginator_class=lambda size: timeline.TimelinePaginator(
+            request.user, size, feed_posts()
+        ),
+    )
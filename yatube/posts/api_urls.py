@@ -0,0 +1,20 @@
+from django.urls import path
+
+from . import api
+
+app_name = 'api_v1'
+
+urlpatterns = [
+    path('posts/', api.posts, name='posts'),
+    path('posts/<int:post_id>/', api.post, name='post'),
+    path('posts/<int:post_id>/comments/', api.comments, name='comments'),
+    path('follow/', api.follow_feed, name='follow'),
+    path('groups/', api.groups, name='groups'),
+    path('groups/<slug:slug>/posts/', api.group_posts, name='group_posts'),
+    path('users/<str:username>/posts/', api.user_posts, name='user_posts'),
+    path(
+        'users/<str:username>/followers/',
+        api.followers,
+        name='followers'
+    ),
+]
@@ -0,0 +1,216 @@
+"""Нагрузочный прогон маршрутов ``posts`` через тестовый клиент Django.
+
+Каждый маршрут запрашивается несколькими потоками, у каждого свой клиент
+и своё соединение с базой. Запросы, которые пишут в базу, выполняются в
+транзакции с откатом, поэтому прогон не меняет данные и не сбрасывает
+кэш лент. Для маршрута считаются перцентили задержки, пропускная
+способность и число SQL-запросов; результат сравнивается с сохранённым
+JSON-базисом.
+"""
+import math
+import statistics
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .models import Follow, Group, Post, User
+
+# Адрес не из INTERNAL_IPS, чтобы не рисовалась панель отладки.
+REMOTE_ADDR = '10.0.0.1'
+THRESHOLD = 0.2
+
+# auth — нужен вход, write — запрос меняет данные и откатывается.
+Route = namedtuple('Route', 'name method url data auth write')
+
+
+class BenchmarkError(Exception):
+    pass
+
+
+def routes(fixture):
+    post_id = {'post_id': fixture['post'].pk}
+    author = {'username': fixture['author'].username}
+    # Подписка на того, на кого читатель ещё не подписан.
+    stranger = {'username': fixture['stranger'].username}
+    found = [
+        Route('index', 'get', reverse('posts:index'), None, False, False),
+        Route('profile', 'get', reverse('posts:profile', kwargs=author),
+              None, False, False),
+        Route('post_detail', 'get',
+              reverse('posts:post_detail', kwargs=post_id),
+              None, False, False),
+        Route('follow_index', 'get', reverse('posts:follow_index'),
+              None, True, False),
+        Route('post_create', 'post', reverse('posts:post_create'),
+              {'text': 'Benchmark post'}, True, True),
+        Route('add_comment', 'post',
+              reverse('posts:add_comment', kwargs=post_id),
+              {'text': 'Benchmark comment'}, True, True),
+        Route('profile_follow', 'get',
+              reverse('posts:profile_follow', kwargs=stranger),
+              None, True, True),
+        Route('profile_unfollow', 'get',
+              reverse('posts:profile_unfollow', kwargs=author),
+              None, True, True),
+    ]
+    if fixture['group'] is not None:
+        slug = {'slug': fixture['group'].slug}
+        found.insert(1, Route(
+            'group_list', 'get', reverse('posts:group_list', kwargs=slug),
+            None, False, False,
+        ))
+    return found
+
+
+def load_fixture(username=None):
+    """Читатель с подписками, его автор, свежий пост и группа."""
+    if username:
+        reader = User.objects.filter(username=username).first()
+        if reader is None:
+            raise BenchmarkError(f'Пользователь {username} не найден.')
+    else:
+        reader = User.objects.annotate(
+            follows=Count('follower')
+        ).order_by('-follows', 'pk').first()
+    post = Post.objects.order_by('-pub_date', '-pk').first()
+    if reader is None or post is None:
+        raise BenchmarkError('Нет данных: сначала выполните seed_yatube.')
+    followed = Follow.objects.filter(user=reader).values('author')
+    author = User.objects.filter(pk__in=followed).first() or post.author
+    stranger = User.objects.exclude(pk__in=followed).exclude(
+        pk=reader.pk
+    ).first() or author
+    return {
+        'reader': reader,
+        'author': author,
+        'stranger': stranger,
+        'post': post,
+        'group': Group.objects.filter(posts__isnull=False).first(),
+    }
+
+
+def host():
+    for name in settings.ALLOWED_HOSTS:
+        if '*' not in name:
+            return name.lstrip('.')
+    return 'localhost'
+
+
+def make_client(route, reader):
+    client = Client(REMOTE_ADDR=REMOTE_ADDR, HTTP_HOST=host())
+    if route.auth:
+        client.force_login(reader)
+    return client
+
+
+def timed_request(client, route):
+    """Время запроса в миллисекундах и число SQL-запросов."""
+    with CaptureQueriesContext(connection) as queries:
+        started = time.perf_counter()
+        if route.write:
+            # Поколения лент сдвигаются после коммита, поэтому откат не
+            # сбрасывает кэш.
+            with transaction.atomic():
+                response = getattr(client, route.method)(
+                    route.url, route.data
+                )
+                transaction.set_rollback(True)
+        else:
+            response = getattr(client, route.method)(route.url, route.data)
+        elapsed = (time.perf_counter() - started) * 1000
+    if response.status_code >= 400:
+        raise BenchmarkError(
+            f'{route.name}: ответ {response.status_code} на {route.url}'
+        )
+    return elapsed, len(queries)
+
+
+def worker(client, route, requests):
+    try:
+        return [timed_request(client, route) for _ in range(requests)]
+    finally:
+        # Соединения рабочих потоков сами не закрываются.
+        if threading.current_thread() is not threading.main_thread():
+            connections.close_all()
+
+
+def percentile(values, share):
+    """Перцентиль по ближайшему рангу для отсортированного списка."""
+    if not values:
+        return 0.0
+    rank = max(math.ceil(share * len(values)), 1)
+    return values[rank - 1]
+
+
+def summarize(samples, wall_time):
+    latencies = sorted(latency for latency, _ in samples)
+    return {
+        'requests': len(samples),
+        'p50_ms': round(percentile(latencies, 0.50), 3),
+        'p95_ms': round(percentile(latencies, 0.95), 3),
+        'p99_ms': round(percentile(latencies, 0.99), 3),
+        'mean_ms': round(statistics.mean(latencies), 3),
+        'throughput_rps': round(len(samples) / wall_time, 1),
+        'queries': max(queries for _, queries in samples),
+    }
+
+
+def run_route(route, reader, requests, concurrency, warmup=0):
+    if route.write and connection.vendor == 'sqlite':
+        # У SQLite один писатель: параллельные записи упадут с блокировкой.
+        concurrency = 1
+    # Сессии создаются заранее, чтобы потоки не писали в базу при входе.
+    clients = [make_client(route, reader) for _ in range(concurrency)]
+    if warmup:
+        worker(clients[0], route, warmup)
+    started = time.perf_counter()
+    if concurrency <= 1:
+        samples = worker(clients[0], route, requests)
+    else:
+        shares = [
+            requests // concurrency + (number < requests % concurrency)
+            for number in range(concurrency)
+        ]
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            parts = pool.map(worker, clients, [route] * concurrency, shares)
+            samples = [sample for part in parts for sample in part]
+    return summarize(samples, time.perf_counter() - started)
+
+
+def run(fixture, requests, concurrency, warmup=0, only=None):
+    return {
+        route.name: run_route(
+            route, fixture['reader'], requests, concurrency, warmup
+        )
+        for route in routes(fixture)
+        if not only or route.name in only
+    }
+
+
+def compare(results, baseline, threshold=THRESHOLD):
+    """Маршруты, у которых p95 вырос больше порога или стало больше SQL."""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        limit = previous['p95_ms'] * (1 + threshold)
+        if current['p95_ms'] > limit:
+            regressions.append(
+                f'{name}: p95 {current["p95_ms"]} мс, '
+                f'базис {previous["p95_ms"]} мс'
+            )
+        if current['queries'] > previous['queries']:
+            regressions.append(
+                f'{name}: запросов {current["queries"]}, '
+                f'базис {previous["queries"]}'
+            )
+    return regressions
@@ -0,0 +1,65 @@
+"""Кэш готовой разметки карточек постов.
+
+Карточка (автор, дата, миниатюра, текст, ссылка на группу) одинакова во
+всех лентах, поэтому кэшируется отдельно от страниц: ключ — id поста и
+его ``modified``. Страница ленты достаёт карточки одним ``get_many`` и
+рендерит только промахи; фрагмент страницы целиком по-прежнему лежит в
+кэше ленты, а при его сборке заново карточки берутся готовыми.
+
+Правка поста меняет ``modified`` сама. Смена имени автора, слага группы
+или удаление группы «трогают» ``modified`` всех их постов (``touch``),
+поэтому старые карточки перестают читаться, а не удаляются. Карточку с
+ещё не готовой миниатюрой не кэшируем, чтобы не закрепить заглушку.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.safestring import mark_safe
+
+from . import thumbnails
+from .models import Post
+
+TEMPLATE = 'includes/post.html'
+# Меняется вместе с разметкой карточки: старые ключи просто не читаются.
+VERSION = 1
+CARD_CACHE_TIMEOUT = 60 * 60 * 24
+CARD_KEY = 'card:{}:{}:{}'
+
+
+def timeout():
+    return getattr(settings, 'POST_CARD_CACHE_TIMEOUT', CARD_CACHE_TIMEOUT)
+
+
+def card_key(post):
+    return CARD_KEY.format(
+        VERSION, post.pk, format(post.modified.timestamp(), '.6f')
+    )
+
+
+def cacheable(post):
+    return not post.image or thumbnails.lookup(post.image, 'feed') is not None
+
+
+def render(posts):
+    """Разметка карточек ``posts`` в том же порядке."""
+    posts = list(posts)
+    keys = [card_key(post) for post in posts]
+    found = cache.get_many(keys)
+    cards = []
+    missing = {}
+    for post, key in zip(posts, keys):
+        card = found.get(key)
+        if card is None:
+            card = render_to_string(TEMPLATE, {'post': post})
+            if cacheable(post):
+                missing[key] = card
+        cards.append(mark_safe(card))
+    if missing:
+        cache.set_many(missing, timeout())
+    return cards
+
+
+def touch(**filters):
+    """Сдвигает ``modified`` у постов: их карточки соберутся заново."""
+    return Post.objects.filter(**filters).update(modified=timezone.now())
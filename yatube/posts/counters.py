@@ -0,0 +1,161 @@
+"""Денормализованные счётчики постов, подписчиков, комментариев и ответов,
+а также числа постов всего и в каждой группе (``RowCount``).
+
+Сигналы меняют счётчики одним ``UPDATE ... SET x = x + 1``, поэтому
+параллельные запросы не теряют инкременты. ``recount_all`` пересчитывает
+всё набором ``UPDATE`` с подзапросами и исправляет накопившийся дрейф.
+"""
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Comment, Follow, Post, RowCount, User, UserStats
+
+POSTS_KEY = 'posts'
+
+# Счётчик пользователя: (поле UserStats, модель, поле-ссылка на пользователя).
+USER_COUNTERS = (
+    ('posts_count', 'Post', 'author'),
+    ('followers_count', 'Follow', 'author'),
+    ('following_count', 'Follow', 'user'),
+)
+
+
+def _count_subquery(model, field, outer):
+    counted = model.objects.filter(
+        **{field: OuterRef(outer)}
+    ).order_by().values(field).annotate(total=Count('pk')).values('total')
+    return Coalesce(Subquery(counted), 0)
+
+
+def change_user_counter(user_id, field, delta):
+    """Сдвигает счётчик пользователя.
+
+    Отсутствующая строка создаётся только при увеличении: уменьшения
+    приходят и из каскадного удаления самого пользователя.
+    """
+    updated = UserStats.objects.filter(user_id=user_id).update(
+        **{field: F(field) + delta}
+    )
+    if not updated and delta > 0:
+        recount_user(user_id)
+
+
+def change_comment_count(post_id, delta):
+    Post.objects.filter(pk=post_id).update(
+        comment_count=F('comment_count') + delta
+    )
+
+
+def group_key(group_id):
+    return f'group:{group_id}'
+
+
+def change_row_count(key, delta):
+    updated = RowCount.objects.filter(key=key).update(
+        value=F('value') + delta
+    )
+    if not updated:
+        recount_rows(key)
+
+
+def change_post_counts(group_id, delta):
+    """Сдвигает общее число постов и число постов группы."""
+    change_row_count(POSTS_KEY, delta)
+    if group_id is not None:
+        change_row_count(group_key(group_id), delta)
+
+
+def drop_row_count(key):
+    RowCount.objects.filter(key=key).delete()
+
+
+def recount_rows(key):
+    """Точное число постов выборки ``key``."""
+    posts = Post.objects.all()
+    if key != POSTS_KEY:
+        posts = posts.filter(group_id=int(key.split(':', 1)[1]))
+    row, _ = RowCount.objects.update_or_create(
+        key=key, defaults={'value': posts.count()}
+    )
+    return row.value
+
+
+def recount_row_counts():
+    """Пересчитывает ``RowCount``, возвращает число исправленных строк."""
+    posts = Post.objects.order_by()
+    actual = {POSTS_KEY: posts.count()}
+    for row in posts.exclude(group__isnull=True).values('group').annotate(
+        total=Count('pk')
+    ):
+        actual[group_key(row['group'])] = row['total']
+    stored = dict(RowCount.objects.values_list('key', 'value'))
+    if stored == actual:
+        return 0
+    RowCount.objects.all().delete()
+    RowCount.objects.bulk_create(
+        RowCount(key=key, value=value)
+        for key, value in actual.items()
+    )
+    return len(set(stored.items()) ^ set(actual.items()))
+
+
+def recount_user(user_id):
+    """Точные счётчики одного пользователя."""
+    if not User.objects.filter(pk=user_id).exists():
+        return None
+    models = {'Post': Post, 'Follow': Follow}
+    values = {
+        field: models[model].objects.filter(**{link: user_id}).count()
+        for field, model, link in USER_COUNTERS
+    }
+    stats, _ = UserStats.objects.update_or_create(
+        user_id=user_id, defaults=values
+    )
+    return stats
+
+
+def stats_for(user):
+    """Счётчики пользователя; отсутствующая строка создаётся на лету."""
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        return recount_user(user.pk)
+
+
+def followers_count(user_id):
+    """Актуальное число подписчиков без обращения к кэшу экземпляра."""
+    count = UserStats.objects.filter(user_id=user_id).values_list(
+        'followers_count', flat=True
+    ).first()
+    if count is None:
+        stats = recount_user(user_id)
+        count = stats.followers_count if stats else 0
+    return count
+
+
+def recount_all():
+    """Пересчитывает все счётчики, возвращает число исправленных строк."""
+    models = {'Comment': Comment, 'Follow': Follow, 'Post': Post}
+    missing = User.objects.filter(
+        stats__isnull=True
+    ).values_list('pk', flat=True)
+    UserStats.objects.bulk_create(
+        (UserStats(user_id=user_id) for user_id in missing.iterator()),
+        batch_size=1000,
+    )
+    repaired = {}
+    for field, model, link in USER_COUNTERS:
+        actual = _count_subquery(models[model], link, 'user_id')
+        repaired[field] = UserStats.objects.exclude(
+            **{field: actual}
+        ).update(**{field: actual})
+    actual = _count_subquery(Comment, 'post', 'pk')
+    repaired['comment_count'] = Post.objects.exclude(
+        comment_count=actual
+    ).update(comment_count=actual)
+    actual = _count_subquery(Comment, 'parent', 'pk')
+    repaired['reply_count'] = Comment.objects.exclude(
+        reply_count=actual
+    ).update(reply_count=actual)
+    repaired['row_counts'] = recount_row_counts()
+    return repaired
@@ -0,0 +1,126 @@
+"""Оценка числа постов в ленте без ``COUNT(*)`` по всей таблице.
+
+Стратегия выбирается настройкой ``POSTS_COUNT_STRATEGY``; ``auto`` берёт
+статистику планировщика на PostgreSQL и таблицу ``RowCount`` на SQLite.
+``table`` читает число, которое сигналы поддерживают в ``RowCount``.
+``statistics`` берёт ``reltuples`` из ``pg_class`` для всей таблицы
+постов, а для групп — тот же ``RowCount``. ``cached`` отдаёт точный
+``COUNT(*)`` из кэша и пересчитывает устаревшее значение в фоновом
+потоке, пока читатели получают прежнее.
+"""
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+from . import counters
+from .models import Post, RowCount
+
+POSTS = counters.POSTS_KEY
+CACHE_KEY = 'counts:{}'
+CACHE_MAX_AGE = 5 * 60
+
+Estimate = namedtuple('Estimate', 'value exact')
+
+
+def group_scope(group_id):
+    return counters.group_key(group_id)
+
+
+def scope_queryset(scope):
+    if scope == POSTS:
+        return Post.objects.all()
+    return Post.objects.filter(group_id=int(scope.split(':', 1)[1]))
+
+
+class TableCounts:
+    def estimate(self, scope):
+        value = RowCount.objects.filter(key=scope).values_list(
+            'value', flat=True
+        ).first()
+        if value is None:
+            value = counters.recount_rows(scope)
+        return Estimate(value, True)
+
+
+class StatisticsCounts(TableCounts):
+    def estimate(self, scope):
+        if scope != POSTS:
+            return super().estimate(scope)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples FROM pg_class WHERE relname = %s',
+                [Post._meta.db_table],
+            )
+            row = cursor.fetchone()
+        # До первого ANALYZE reltuples равен -1 (или 0 на старых версиях).
+        if row is None or row[0] <= 0:
+            return super().estimate(scope)
+        return Estimate(int(row[0]), False)
+
+
+class CachedCounts:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = set()
+        self.executor = None
+
+    def estimate(self, scope):
+        cached = cache.get(CACHE_KEY.format(scope))
+        if cached is None:
+            return Estimate(self.refresh(scope), True)
+        value, counted_at = cached
+        max_age = getattr(settings, 'POSTS_COUNT_CACHE_MAX_AGE', CACHE_MAX_AGE)
+        if time.time() - counted_at > max_age:
+            self.refresh_later(scope)
+        return Estimate(value, False)
+
+    def refresh(self, scope):
+        value = scope_queryset(scope).count()
+        cache.set(CACHE_KEY.format(scope), (value, time.time()), None)
+        return value
+
+    def refresh_later(self, scope):
+        with self.lock:
+            if scope in self.pending:
+                return
+            self.pending.add(scope)
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=1)
+        self.executor.submit(self._refresh_in_background, scope)
+
+    def _refresh_in_background(self, scope):
+        try:
+            self.refresh(scope)
+        finally:
+            with self.lock:
+                self.pending.discard(scope)
+            connection.close()
+
+
+STRATEGIES = {
+    'table': TableCounts(),
+    'statistics': StatisticsCounts(),
+    'cached': CachedCounts(),
+}
+
+
+def get_strategy():
+    name = getattr(settings, 'POSTS_COUNT_STRATEGY', 'auto')
+    if name == 'auto':
+        if connection.vendor == 'postgresql':
+            name = 'statistics'
+        elif connection.vendor == 'sqlite':
+            name = 'table'
+        else:
+            name = 'cached'
+    return STRATEGIES[name]
+
+
+def estimate(scope):
+    """Число постов выборки ``scope`` и признак, точное ли оно."""
+    return get_strategy().estimate(scope)
@@ -0,0 +1,101 @@
+"""Потоковая выгрузка постов автора в JSONL или CSV.
+
+Посты и комментарии читаются двумя курсорами ``.iterator()`` в одном
+порядке ``post_id`` и склеиваются слиянием, поэтому в памяти одновременно
+лежат только текущий пост и его комментарии, сколько бы постов ни было
+у автора.
+"""
+import csv
+import json
+
+from .models import Comment, Post
+
+JSONL = 'jsonl'
+CSV = 'csv'
+FORMATS = {
+    JSONL: 'application/x-ndjson; charset=utf-8',
+    CSV: 'text/csv; charset=utf-8',
+}
+CHUNK_SIZE = 2000
+CSV_COLUMNS = (
+    'type', 'id', 'post_id', 'created', 'author', 'group', 'text', 'image',
+)
+
+
+def _image_url(post, absolute_url):
+    if not post.image:
+        return None
+    return absolute_url(post.image.url) if absolute_url else post.image.url
+
+
+def records(author, images=False, comments=False, absolute_url=None):
+    """Посты автора по возрастанию id; комментарии вложены в пост."""
+    posts = Post.objects.filter(author=author).select_related('group').only(
+        'id', 'text', 'pub_date', 'image', 'group', 'group__slug'
+    ).order_by('pk').iterator(chunk_size=CHUNK_SIZE)
+    comment_rows = iter(())
+    if comments:
+        comment_rows = Comment.objects.filter(
+            post__author=author
+        ).select_related('author').only(
+            'id', 'post', 'text', 'created', 'author', 'author__username'
+        ).order_by('post_id', 'pk').iterator(chunk_size=CHUNK_SIZE)
+    pending = next(comment_rows, None)
+    for post in posts:
+        record = {
+            'id': post.pk,
+            'pub_date': post.pub_date.isoformat(),
+            'group': post.group.slug if post.group_id else None,
+            'text': post.text,
+        }
+        if images:
+            record['image'] = _image_url(post, absolute_url)
+        if comments:
+            record['comments'] = []
+            # Комментарии постов, которых уже нет в выборке, пропускаем.
+            while pending is not None and pending.post_id <= post.pk:
+                if pending.post_id == post.pk:
+                    record['comments'].append({
+                        'id': pending.pk,
+                        'author': pending.author.username,
+                        'created': pending.created.isoformat(),
+                        'text': pending.text,
+                    })
+                pending = next(comment_rows, None)
+        yield record
+
+
+def jsonl(records):
+    for record in records:
+        yield json.dumps(record, ensure_ascii=False) + '\n'
+
+
+class _Echo:
+    """Файл для csv.writer, который просто возвращает строку."""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(records, author):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_COLUMNS)
+    for record in records:
+        yield writer.writerow((
+            'post', record['id'], record['id'], record['pub_date'],
+            author.username, record['group'], record['text'],
+            record.get('image') or '',
+        ))
+        for comment in record.get('comments', ()):
+            yield writer.writerow((
+                'comment', comment['id'], record['id'], comment['created'],
+                comment['author'], '', comment['text'], '',
+            ))
+
+
+def stream(author, export_format=JSONL, **options):
+    """Строки выгрузки в выбранном формате."""
+    rows = records(author, **options)
+    if export_format == CSV:
+        return csv_lines(rows, author)
+    return jsonl(rows)
@@ -0,0 +1,99 @@
+"""Ключи фрагментного кэша лент.
+
+Ключ фрагмента собирается из имени ленты, номера страницы или курсора
+(прочие параметры запроса на фрагмент не влияют), пользователя для
+персональных лент и счётчиков поколений. Сигналы на Post, Comment и
+Follow увеличивают нужный счётчик после коммита, поэтому старые
+фрагменты перестают читаться сразу, а не по истечении TTL.
+Вместе со счётчиком запоминается время изменения: по нему строится
+заголовок Last-Modified.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .utils import CURSOR_PARAM, PAGE_PARAM
+
+FEED_CACHE_TIMEOUT = 60 * 5
+GENERATION_KEY = 'feed:generation:{}'
+CHANGED_KEY = 'feed:changed:{}'
+
+POSTS = 'posts'
+# Параметры запроса, от которых зависит содержимое фрагмента.
+KEY_PARAMS = (CURSOR_PARAM, PAGE_PARAM)
+
+
+def follow_scope(user_id):
+    return f'follow:{user_id}'
+
+
+def comments_scope(post_id):
+    return f'comments:{post_id}'
+
+
+def followers_scope(author_id):
+    return f'followers:{author_id}'
+
+
+def timeout():
+    return getattr(settings, 'FEED_CACHE_TIMEOUT', FEED_CACHE_TIMEOUT)
+
+
+def generations(scopes):
+    keys = [GENERATION_KEY.format(scope) for scope in scopes]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            cache.add(key, 1, None)
+    return [found.get(key, 1) for key in keys]
+
+
+def changed_at(scopes):
+    """Время последнего изменения любой из областей (Unix time).
+
+    Если отметки нет (кэш очищен), изменением считается текущий момент.
+    """
+    keys = [CHANGED_KEY.format(scope) for scope in scopes]
+    found = cache.get_many(keys)
+    now = time.time()
+    for key in keys:
+        if key not in found:
+            cache.add(key, now, None)
+    return max(found.get(key, now) for key in keys)
+
+
+def bump(scope):
+    """Сдвигает поколение ``scope`` после фиксации текущей транзакции.
+
+    Сдвиг до коммита позволил бы параллельному читателю собрать старое
+    тело страницы уже под новым поколением, и оно жило бы до следующего
+    сдвига или TTL.
+    """
+    transaction.on_commit(lambda: _bump(scope))
+
+
+def _bump(scope):
+    cache.set(CHANGED_KEY.format(scope), time.time(), None)
+    key = GENERATION_KEY.format(scope)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 2, None)
+
+
+def fragment_context(name, request, *scopes):
+    """Переменные для ``{% cache feed_cache_timeout ... feed_cache_key %}``."""
+    parts = [name]
+    parts.extend(
+        f'{param}={request.GET.get(param, "")}' for param in KEY_PARAMS
+    )
+    parts.extend(
+        f'{scope}={value}'
+        for scope, value in zip(scopes, generations(scopes))
+    )
+    return {
+        'feed_cache_timeout': timeout(),
+        'feed_cache_key': '|'.join(parts),
+    }
@@ -0,0 +1,105 @@
+"""Персональные фрагменты поверх общего для всех кэша страницы.
+
+Тело страницы (профиль, пост, ленты) одинаково для всех читателей и
+кэшируется один раз. Там, где нужно что-то своё для читателя (кнопка
+подписки, ссылка «редактировать запись», форма комментария,
+переключатель лент), шаблон оставляет метку ``{% hole %}`` —
+HTML-комментарий с именем фрагмента и аргументами. Декоратор ``filled``
+после рендеринга заменяет метки фрагментами, отрисованными для текущего
+запроса. Текст пользователей экранируется, поэтому подделать метку
+из содержимого поста нельзя.
+"""
+import re
+from functools import wraps
+from urllib.parse import quote, unquote
+
+from django.template.loader import render_to_string
+
+from .forms import CommentForm
+from .models import Follow
+
+MARKER = '<!--hole:{}-->'
+PATTERN = re.compile(r'<!--hole:([a-z_]+)((?::[^:>]*)*)-->')
+
+renderers = {}
+
+
+def register(name):
+    def decorator(renderer):
+        renderers[name] = renderer
+        return renderer
+    return decorator
+
+
+def marker(name, *args):
+    """Метка фрагмента ``name``; аргументы приходят рендереру строками."""
+    if name not in renderers:
+        raise ValueError(f'Неизвестный фрагмент: {name}')
+    return MARKER.format(
+        ''.join([name, *(':' + quote(str(arg), safe='') for arg in args)])
+    )
+
+
+def fill(request, content):
+    """Подставляет в ``content`` фрагменты для ``request``."""
+    def replace(match):
+        args = [unquote(arg) for arg in match.group(2).split(':')[1:]]
+        return renderers[match.group(1)](request, *args)
+    return PATTERN.sub(replace, content)
+
+
+def filled(view):
+    """Декоратор view: заполняет метки в готовом HTML-ответе."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        response = view(request, *args, **kwargs)
+        if (
+            response.status_code == 200
+            and not response.streaming
+            and response.get('Content-Type', '').startswith('text/html')
+        ):
+            response.content = fill(
+                request, response.content.decode(response.charset)
+            )
+        return response
+    return wrapper
+
+
+@register('switcher')
+def switcher(request, active=''):
+    return render_to_string(
+        'posts/includes/switcher.html', {active: True} if active else {},
+        request,
+    )
+
+
+@register('follow_button')
+def follow_button(request, author_id, username):
+    following = request.user.is_authenticated and Follow.objects.filter(
+        user=request.user, author_id=author_id
+    ).exists()
+    return render_to_string('posts/includes/follow_button.html', {
+        'username': username,
+        'following': following,
+    }, request)
+
+
+@register('edit_link')
+def edit_link(request, post_id, author_id):
+    if str(request.user.pk) != author_id:
+        return ''
+    return render_to_string(
+        'posts/includes/edit_link.html', {'post_id': post_id}, request
+    )
+
+
+@register('comment_form')
+def comment_form(request, post_id):
+    if not request.user.is_authenticated:
+        return ''
+    reply_to = request.GET.get('reply_to', '')
+    return render_to_string('posts/includes/comment_form.html', {
+        'post_id': post_id,
+        'form': CommentForm(),
+        'reply_to': int(reply_to) if reply_to.isdigit() else None,
+    }, request)
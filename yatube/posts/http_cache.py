@@ -0,0 +1,142 @@
+"""Условные GET-запросы для лент и страницы поста.
+
+До вызова view выполняется один дешёвый запрос свежести: последний
+``pub_date`` ленты или последний комментарий поста. Вместе со счётчиками
+поколений ``feed_cache`` он даёт ETag и Last-Modified; если клиент прислал
+совпадающие If-None-Match или If-Modified-Since, ответ 304 уходит без
+запроса ленты и рендеринга шаблона.
+"""
+import hashlib
+import math
+from collections import namedtuple
+from functools import wraps
+
+from django.conf import settings
+from django.contrib import messages
+from django.db.models import Max
+from django.utils.cache import (
+    get_conditional_response, patch_cache_control, patch_vary_headers
+)
+from django.utils.http import http_date, quote_etag
+
+from . import feed_cache
+from .models import Group, Post, User
+
+PAGE_MAX_AGE = 60
+
+# parts — всё, от чего зависит страница, scopes — области feed_cache,
+# latest — время последней записи в ленте или ``None``.
+Freshness = namedtuple('Freshness', 'parts scopes latest')
+
+
+def page_max_age():
+    return getattr(settings, 'PAGE_CACHE_MAX_AGE', PAGE_MAX_AGE)
+
+
+def viewer_parts(request):
+    if not request.user.is_authenticated:
+        return ['anonymous']
+    # В форме комментария есть CSRF-токен, привязанный к cookie.
+    return [
+        f'user={request.user.pk}',
+        request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''),
+    ]
+
+
+def validators(request, state):
+    generations = feed_cache.generations(state.scopes)
+    parts = [*state.parts, *viewer_parts(request), request.GET.urlencode()]
+    parts.extend(str(value) for value in generations)
+    etag = hashlib.md5('|'.join(map(str, parts)).encode()).hexdigest()
+    last_modified = feed_cache.changed_at(state.scopes)
+    if state.latest is not None:
+        last_modified = max(last_modified, state.latest.timestamp())
+    return quote_etag(etag), math.ceil(last_modified)
+
+
+def patch_response(request, response, etag, last_modified):
+    response.setdefault('ETag', etag)
+    response.setdefault('Last-Modified', http_date(last_modified))
+    patch_vary_headers(response, ('Cookie',))
+    if request.user.is_authenticated:
+        patch_cache_control(response, private=True, no_cache=True)
+    else:
+        patch_cache_control(response, public=True, max_age=page_max_age())
+    return response
+
+
+def conditional_page(freshness):
+    """Декоратор view с ответом 304 по данным ``freshness``.
+
+    ``freshness(request, *args, **kwargs)`` возвращает ``Freshness`` или
+    ``None``, если объекта нет: тогда 404 отдаёт сама view.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            # Уведомление после редиректа иначе ушло бы в ответ 304.
+            if request.method not in ('GET', 'HEAD') or len(
+                messages.get_messages(request)
+            ):
+                return view(request, *args, **kwargs)
+            state = freshness(request, *args, **kwargs)
+            if state is None:
+                return view(request, *args, **kwargs)
+            etag, last_modified = validators(request, state)
+            response = get_conditional_response(
+                request, etag=etag, last_modified=last_modified
+            )
+            if response is None:
+                response = view(request, *args, **kwargs)
+            if response.status_code in (200, 304):
+                patch_response(request, response, etag, last_modified)
+            return response
+        return wrapper
+    return decorator
+
+
+def index_state(request):
+    latest = Post.objects.aggregate(latest=Max('pub_date'))['latest']
+    return Freshness(['index', latest], [feed_cache.POSTS], latest)
+
+
+def group_state(request, slug):
+    found = Group.objects.filter(slug=slug).annotate(
+        latest=Max('posts__pub_date')
+    ).values_list('pk', 'latest').first()
+    if found is None:
+        return None
+    pk, latest = found
+    return Freshness([f'group:{pk}', latest], [feed_cache.POSTS], latest)
+
+
+def profile_state(request, username):
+    found = User.objects.filter(username=username).annotate(
+        latest=Max('posts__pub_date')
+    ).values_list(
+        'pk', 'latest', 'stats__followers_count', 'stats__following_count'
+    ).first()
+    if found is None:
+        return None
+    pk, latest, followers, following = found
+    scopes = [feed_cache.POSTS]
+    if request.user.is_authenticated:
+        # Кнопка «Подписаться» зависит от подписок читателя.
+        scopes.append(feed_cache.follow_scope(request.user.pk))
+    return Freshness(
+        [f'profile:{pk}', latest, followers, following], scopes, latest
+    )
+
+
+def post_state(request, post_id):
+    found = Post.objects.filter(pk=post_id).order_by().annotate(
+        latest_comment=Max('comments__created')
+    ).values_list('pub_date', 'latest_comment').first()
+    if found is None:
+        return None
+    latest = max(value for value in found if value is not None)
+    return Freshness(
+        [f'post:{post_id}', latest],
+        [feed_cache.POSTS, feed_cache.comments_scope(post_id)],
+        latest,
+    )
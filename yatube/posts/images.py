@@ -0,0 +1,123 @@
+"""Приём картинок постов: проверка по заголовку и ужатая мастер-копия.
+
+Загрузка целиком пишется во временный файл (``FILE_UPLOAD_HANDLERS``),
+размеры читаются из заголовка, и слишком большие по числу пикселей
+картинки отклоняются до декодирования. JPEG
+декодируется в режиме ``draft`` сразу в уменьшенном масштабе, поэтому
+память ограничена размером мастер-копии, а не оригинала. Сохраняется
+перекодированная копия не больше ``POST_IMAGE_MAX_SIZE`` по длинной
+стороне, повёрнутая по EXIF и без метаданных. Подменяет загрузку
+``PostForm.clean_image``.
+"""
+import os
+import warnings
+from io import BytesIO
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps, features
+
+MAX_SIZE = 2048
+MAX_PIXELS = 50_000_000
+MAX_BYTES = 20 * 1024 * 1024
+FORMAT = 'WEBP'
+QUALITY = 85
+
+ACCEPTED_FORMATS = ('JPEG', 'PNG', 'GIF', 'WEBP', 'BMP', 'TIFF')
+EXTENSIONS = {'JPEG': '.jpg', 'WEBP': '.webp'}
+
+
+def config():
+    """Размеры, формат и качество мастер-копии из настроек."""
+    image_format = getattr(settings, 'POST_IMAGE_FORMAT', FORMAT).upper()
+    if image_format == 'WEBP' and not features.check('webp'):
+        image_format = 'JPEG'
+    return {
+        'max_size': getattr(settings, 'POST_IMAGE_MAX_SIZE', MAX_SIZE),
+        'max_pixels': getattr(settings, 'POST_IMAGE_MAX_PIXELS', MAX_PIXELS),
+        'max_bytes': getattr(settings, 'POST_IMAGE_MAX_BYTES', MAX_BYTES),
+        'format': image_format,
+        'quality': getattr(settings, 'POST_IMAGE_QUALITY', QUALITY),
+    }
+
+
+def _open(upload, max_pixels):
+    upload.seek(0)
+    try:
+        # Pillow предупреждает о бомбе только после открытия; превращаем
+        # предупреждение в ошибку, чтобы не дойти до декодирования.
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', Image.DecompressionBombWarning)
+            image = Image.open(upload)
+    except (Image.DecompressionBombWarning, Image.DecompressionBombError):
+        raise ValidationError(
+            'Картинка слишком большая.', code='image_too_large'
+        )
+    except (OSError, SyntaxError, ValueError):
+        raise ValidationError(
+            'Загрузите картинку. Файл не является картинкой или повреждён.',
+            code='invalid_image',
+        )
+    if image.format not in ACCEPTED_FORMATS:
+        raise ValidationError(
+            'Формат картинки не поддерживается.', code='invalid_image'
+        )
+    width, height = image.size
+    if width * height > max_pixels:
+        raise ValidationError(
+            'Картинка слишком большая: %(width)s×%(height)s.',
+            code='image_too_large',
+            params={'width': width, 'height': height},
+        )
+    return image
+
+
+def _flatten(image, image_format):
+    """Приводит режим к тому, что умеет целевой формат."""
+    has_alpha = image.mode in ('RGBA', 'LA') or (
+        image.mode == 'P' and 'transparency' in image.info
+    )
+    if image_format == 'WEBP':
+        return image.convert('RGBA' if has_alpha else 'RGB')
+    if not has_alpha:
+        return image.convert('RGB')
+    image = image.convert('RGBA')
+    background = Image.new('RGB', image.size, (255, 255, 255))
+    background.paste(image, mask=image.getchannel('A'))
+    return background
+
+
+def ingest(upload):
+    """Проверяет загрузку и возвращает мастер-копию как ``ContentFile``."""
+    options = config()
+    if upload.size > options['max_bytes']:
+        raise ValidationError(
+            'Файл слишком большой.', code='image_too_large'
+        )
+    image = _open(upload, options['max_pixels'])
+    limit = options['max_size']
+    try:
+        if image.format == 'JPEG':
+            image.draft('RGB', (limit, limit))
+        image.thumbnail((limit, limit), Image.LANCZOS)
+        image = ImageOps.exif_transpose(image)
+        icc_profile = image.info.get('icc_profile')
+        image = _flatten(image, options['format'])
+        buffer = BytesIO()
+        # EXIF в save не передаём: мастер-копия остаётся без метаданных.
+        image.save(
+            buffer,
+            options['format'],
+            quality=options['quality'],
+            icc_profile=icc_profile,
+        )
+    except (OSError, SyntaxError, ValueError):
+        raise ValidationError(
+            'Загрузите картинку. Файл не является картинкой или повреждён.',
+            code='invalid_image',
+        )
+    stem = os.path.splitext(os.path.basename(upload.name))[0] or 'image'
+    return ContentFile(
+        buffer.getvalue(), name=stem + EXTENSIONS[options['format']]
+    )
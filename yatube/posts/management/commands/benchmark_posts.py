@@ -0,0 +1,102 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from posts import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет задержку, пропускную способность и число SQL-запросов '
+        'маршрутов posts и сравнивает их с базисом'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests', type=int, default=50,
+            help='Запросов на маршрут'
+        )
+        parser.add_argument(
+            '--concurrency', type=int, default=4,
+            help='Число параллельных потоков'
+        )
+        parser.add_argument(
+            '--warmup', type=int, default=5,
+            help='Запросов на прогрев перед замером'
+        )
+        parser.add_argument(
+            '--route', action='append', dest='routes',
+            help='Замерить только этот маршрут (можно повторять)'
+        )
+        parser.add_argument(
+            '--username',
+            help='Читатель для ленты подписок (по умолчанию пользователь '
+                 'с наибольшим числом подписок)'
+        )
+        parser.add_argument(
+            '--save', metavar='PATH',
+            help='Сохранить результат в JSON как новый базис'
+        )
+        parser.add_argument(
+            '--baseline', metavar='PATH',
+            help='Сравнить с сохранённым базисом'
+        )
+        parser.add_argument(
+            '--threshold', type=float, default=benchmark.THRESHOLD,
+            help='Допустимый рост p95 относительно базиса (0.2 — на 20%%)'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            fixture = benchmark.load_fixture(options['username'])
+            results = benchmark.run(
+                fixture,
+                options['requests'],
+                options['concurrency'],
+                options['warmup'],
+                options['routes'],
+            )
+        except benchmark.BenchmarkError as error:
+            raise CommandError(error)
+        self.report(results)
+        if options['save']:
+            self.save(options, results)
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as file:
+                baseline = json.load(file)['routes']
+            regressions = benchmark.compare(
+                results, baseline, options['threshold']
+            )
+            if regressions:
+                raise CommandError(
+                    'Регрессия производительности:\n' + '\n'.join(regressions)
+                )
+            self.stdout.write(self.style.SUCCESS('Регрессий нет'))
+
+    def report(self, results):
+        self.stdout.write(
+            f'{"маршрут":<18}{"p50":>9}{"p95":>9}{"p99":>9}'
+            f'{"rps":>9}{"SQL":>6}'
+        )
+        for name, result in results.items():
+            self.stdout.write(
+                f'{name:<18}{result["p50_ms"]:>9.2f}{result["p95_ms"]:>9.2f}'
+                f'{result["p99_ms"]:>9.2f}{result["throughput_rps"]:>9.1f}'
+                f'{result["queries"]:>6}'
+            )
+
+    def save(self, options, results):
+        data = {
+            'meta': {
+                'created': timezone.now().isoformat(),
+                'database': connection.vendor,
+                'requests': options['requests'],
+                'concurrency': options['concurrency'],
+            },
+            'routes': results,
+        }
+        with open(options['save'], 'w', encoding='utf-8') as file:
+            json.dump(data, file, ensure_ascii=False, indent=2)
+        self.stdout.write(f'Базис сохранён в {options["save"]}')
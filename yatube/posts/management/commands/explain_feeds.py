@@ -0,0 +1,90 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import timeline
+from posts.models import Comment, Follow, Group, Post, User
+from posts.utils import CursorPaginator
+from posts.views import (
+    COMMENT_ORDERING, FIRST_TEN_POSTS, comments_paginator,
+)
+
+
+class Command(BaseCommand):
+    help = 'Печатает планы запросов, которые выполняют ленты постов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--username',
+            help='Автор для профиля (по умолчанию автор последнего поста)'
+        )
+        parser.add_argument(
+            '--reader',
+            help='Пользователь для ленты подписок (по умолчанию любой '
+                 'пользователь с подписками)'
+        )
+        parser.add_argument(
+            '--analyze',
+            action='store_true',
+            help='Выполнить запросы и показать реальное время (PostgreSQL)'
+        )
+
+    def handle(self, *args, **options):
+        latest = Post.objects.order_by('-pub_date', '-pk').first()
+        if latest is None:
+            raise CommandError('Нет постов: сначала заполните базу.')
+        author = self.get_user(options['username']) or latest.author
+        reader = self.get_user(options['reader'])
+        if reader is None:
+            follow = Follow.objects.select_related('user').first()
+            reader = follow.user if follow else author
+        group = Group.objects.filter(posts__isnull=False).first()
+        explain_options = {'analyze': True} if options['analyze'] else {}
+
+        for name, queryset in self.feed_queries(latest, author, reader, group):
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write(str(queryset.query))
+            self.stdout.write(queryset.explain(**explain_options))
+            self.stdout.write('')
+
+    def get_user(self, username):
+        if not username:
+            return None
+        try:
+            return User.objects.get(username=username)
+        except User.DoesNotExist:
+            raise CommandError(f'Пользователь {username} не найден.')
+
+    def feed_queries(self, latest, author, reader, group):
+        def first_page(posts):
+            return CursorPaginator(posts, FIRST_TEN_POSTS).page_queryset()
+
+        index = CursorPaginator(Post.objects.for_feed(), FIRST_TEN_POSTS)
+        cursor_values = [latest.pub_date, latest.pk]
+        yield 'posts:index', index.page_queryset()
+        yield 'posts:index (cursor)', index.page_queryset(cursor_values)
+        if group is not None:
+            yield 'posts:group_list', first_page(
+                Post.objects.for_feed().filter(group=group)
+            )
+        yield 'posts:profile', first_page(
+            Post.objects.for_feed().filter(author=author)
+        )
+        yield 'posts:profile (following)', Follow.objects.filter(
+            user=reader, author=author
+        )
+        entries, pending = timeline.TimelinePaginator(
+            reader, FIRST_TEN_POSTS
+        ).parts()
+        yield 'posts:follow_index (timeline)', entries
+        yield 'posts:follow_index (not fanned out)', pending
+        comments = comments_paginator(latest.pk)
+        yield 'posts:post_detail (comments)', comments.page_queryset()
+        root = Comment.objects.filter(
+            post=latest, parent__isnull=True
+        ).order_by(*COMMENT_ORDERING).first()
+        if root is not None:
+            yield 'posts:post_detail (comments, cursor)', (
+                comments.page_queryset([root.created, root.pk])
+            )
+        yield 'fan-out (followers)', Follow.objects.filter(
+            author=author
+        ).values_list('user_id', flat=True)
@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import export
+from posts.models import User
+
+
+class Command(BaseCommand):
+    help = 'Выгружает посты автора в JSONL или CSV, не загружая их в память'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help='Автор постов')
+        parser.add_argument(
+            '--format',
+            choices=tuple(export.FORMATS),
+            default=export.JSONL,
+            help='Формат выгрузки'
+        )
+        parser.add_argument(
+            '--images',
+            action='store_true',
+            help='Добавить адреса картинок'
+        )
+        parser.add_argument(
+            '--comments',
+            action='store_true',
+            help='Добавить комментарии'
+        )
+        parser.add_argument(
+            '--base-url',
+            default='',
+            help='Префикс для адресов картинок, например https://example.com'
+        )
+        parser.add_argument(
+            '--output',
+            help='Файл для выгрузки (по умолчанию стандартный вывод)'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            author = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(
+                f'Пользователь {options["username"]} не найден.'
+            )
+        base_url = options['base_url'].rstrip('/')
+        lines = export.stream(
+            author,
+            options['format'],
+            images=options['images'],
+            comments=options['comments'],
+            absolute_url=(lambda url: base_url + url) if base_url else None,
+        )
+        if options['output']:
+            with open(
+                options['output'], 'w', encoding='utf-8', newline=''
+            ) as file:
+                file.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
@@ -0,0 +1,150 @@
+import hashlib
+import os
+import time
+import zlib
+
+from django.core.management.base import BaseCommand, CommandError
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.images import ImageFile
+
+from core.models import StoredFile
+from posts import thumbnails
+from posts.models import Post
+
+DELETE_BATCH = 1000
+
+
+def fingerprint(name):
+    """Компактный ключ пути: 12 байт вместо строки целиком."""
+    return hashlib.blake2b(name.encode(), digest_size=12).digest()
+
+
+def partition(name, partitions):
+    return zlib.crc32(name.encode()) % partitions
+
+
+def walk(location, root):
+    """Файлы под ``root`` как (имя от MEDIA_ROOT, путь, stat) через scandir."""
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            entries = os.scandir(os.path.join(location, directory))
+        except FileNotFoundError:
+            continue
+        with entries:
+            for entry in entries:
+                name = f'{directory}/{entry.name}'
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(name)
+                elif entry.is_file(follow_symlinks=False):
+                    yield name, entry.path, entry.stat(follow_symlinks=False)
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет картинки постов и миниатюры, на которые не ссылается '
+        'ни один пост'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать, что будет удалено'
+        )
+        parser.add_argument(
+            '--grace',
+            type=int,
+            default=60 * 60,
+            help='Не трогать файлы моложе стольких секунд (загрузки в пути)'
+        )
+        parser.add_argument(
+            '--partitions',
+            type=int,
+            default=1,
+            help='Число проходов: память под ссылки делится на это число'
+        )
+
+    def handle(self, *args, **options):
+        if options['partitions'] < 1:
+            raise CommandError('--partitions должно быть не меньше 1.')
+        self.verbosity = options['verbosity']
+        storage = Post._meta.get_field('image').storage
+        upload_to = Post._meta.get_field('image').upload_to.strip('/')
+        roots = (upload_to, thumbnail_settings.THUMBNAIL_PREFIX.strip('/'))
+        cutoff = time.time() - options['grace']
+        started = time.monotonic()
+        self.stats = {'scanned': 0, 'orphans': 0, 'bytes': 0, 'refs': 0}
+        for part in range(options['partitions']):
+            referenced = self.referenced(part, options['partitions'])
+            self.stats['refs'] += len(referenced)
+            orphans = []
+            for root in roots:
+                for name, path, stat in walk(storage.location, root):
+                    if partition(name, options['partitions']) != part:
+                        continue
+                    self.stats['scanned'] += 1
+                    if stat.st_mtime > cutoff:
+                        continue
+                    if fingerprint(name) in referenced:
+                        continue
+                    self.stats['orphans'] += 1
+                    self.stats['bytes'] += stat.st_size
+                    orphans.append((name, path, root == upload_to))
+                    if len(orphans) >= DELETE_BATCH:
+                        self.remove(orphans, storage, options['dry_run'])
+                        orphans = []
+            self.remove(orphans, storage, options['dry_run'])
+            del referenced
+        self.report(time.monotonic() - started, options['dry_run'])
+
+    def referenced(self, part, partitions):
+        """Ключи картинок постов этого прохода и их миниатюр."""
+        referenced = set()
+        names = Post.objects.exclude(image='').exclude(
+            image__isnull=True
+        ).values_list('image', flat=True).order_by().iterator()
+        for name in names:
+            candidates = [name]
+            for geometry, variant_options in thumbnails.variants().values():
+                _, thumbnail, _ = thumbnails.backend.prepare(
+                    thumbnails.source(name), geometry, **variant_options
+                )
+                candidates.append(thumbnail.name)
+            for candidate in candidates:
+                if partition(candidate, partitions) == part:
+                    referenced.add(fingerprint(candidate))
+        return referenced
+
+    def remove(self, orphans, storage, dry_run):
+        if self.verbosity >= 2:
+            for name, _, _ in orphans:
+                self.stdout.write(name)
+        if dry_run or not orphans:
+            return
+        originals = []
+        for name, path, is_original in orphans:
+            if is_original:
+                originals.append(name)
+                default.kvstore.delete(thumbnails.source(name))
+            else:
+                default.kvstore.delete(
+                    ImageFile(name, default.storage), delete_thumbnails=False
+                )
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        StoredFile.objects.filter(name__in=originals).delete()
+
+    def report(self, elapsed, dry_run):
+        stats = self.stats
+        action = 'Будет удалено' if dry_run else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(
+            f'Просмотрено файлов: {stats["scanned"]}, '
+            f'ссылок: {stats["refs"]}, {action}: {stats["orphans"]} '
+            f'({stats["bytes"] / 1024 / 1024:.1f} МБ) за {elapsed:.1f} с, '
+            f'{stats["scanned"] / elapsed if elapsed else 0:.0f} файлов/с'
+        ))
@@ -0,0 +1,116 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from core.models import StoredFile
+from posts import feed_cache
+from posts.models import Post
+
+
+def move(storage, row):
+    """Копирует файл по адресу содержимого; ``None``, если файла нет."""
+    pk, name = row
+    if storage.is_hashed(name):
+        return pk, name, name
+    if not storage.exists(name):
+        return pk, name, None
+    with storage.open(name) as file:
+        return pk, name, storage.save(name, file)
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит картинки постов в хранилище по содержимому '
+        'и пересчитывает ссылки на файлы'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Число потоков для копирования (по умолчанию по числу ядер)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Сколько постов обновлять в одной транзакции'
+        )
+        parser.add_argument(
+            '--keep-originals',
+            action='store_true',
+            help='Не удалять файлы из старого расположения'
+        )
+
+    def handle(self, *args, **options):
+        storage = Post._meta.get_field('image').storage
+        rows = Post.objects.exclude(image='').exclude(
+            image__isnull=True
+        ).values_list('pk', 'image').order_by('pk').iterator()
+        stats = {'moved': 0, 'hashed': 0, 'missing': 0}
+        with ThreadPoolExecutor(options['workers']) as pool:
+            batch = []
+            for row in rows:
+                batch.append(row)
+                if len(batch) >= options['batch_size']:
+                    self.migrate(pool, storage, batch, stats, options)
+                    batch = []
+            if batch:
+                self.migrate(pool, storage, batch, stats, options)
+        files = self.recount(storage, options['batch_size'])
+        feed_cache.bump(feed_cache.POSTS)
+        self.stdout.write(self.style.SUCCESS(
+            f'Перенесено: {stats["moved"]}, уже на месте: {stats["hashed"]}, '
+            f'не найдено: {stats["missing"]}, файлов: {files}. '
+            f'Миниатюры создаст regenerate_thumbnails.'
+        ))
+
+    def migrate(self, pool, storage, batch, stats, options):
+        moved = []
+        for pk, old, new in pool.map(partial(move, storage), batch):
+            if new is None:
+                stats['missing'] += 1
+            elif new == old:
+                stats['hashed'] += 1
+            else:
+                moved.append((pk, old, new))
+        if not moved:
+            return
+        now = timezone.now()
+        with transaction.atomic():
+            # modified сдвигаем, чтобы карточки постов собрались заново.
+            Post.objects.bulk_update(
+                [Post(pk=pk, image=new, modified=now) for pk, _, new in moved],
+                ['image', 'modified'],
+            )
+        stats['moved'] += len(moved)
+        if options['keep_originals']:
+            return
+        old_names = {old for _, old, _ in moved}
+        # Файл мог достаться нескольким постам, не все из которых в пачке.
+        still_used = set(Post.objects.filter(
+            image__in=old_names
+        ).values_list('image', flat=True))
+        for name in old_names - still_used:
+            storage.delete(name)
+
+    def recount(self, storage, batch_size):
+        counts = Post.objects.exclude(image='').exclude(
+            image__isnull=True
+        ).values('image').annotate(refs=Count('pk')).order_by().iterator()
+        with transaction.atomic():
+            StoredFile.objects.all().delete()
+            StoredFile.objects.bulk_create(
+                (
+                    StoredFile(name=row['image'], refs=row['refs'])
+                    for row in counts if storage.is_hashed(row['image'])
+                ),
+                batch_size=batch_size,
+            )
+        return StoredFile.objects.count()
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from posts.counters import recount_all
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает денормализованные счётчики и исправляет дрейф'
+
+    def handle(self, *args, **options):
+        repaired = recount_all()
+        for field, rows in repaired.items():
+            self.stdout.write(f'{field}: исправлено строк {rows}')
+        self.stdout.write(self.style.SUCCESS('Счётчики пересчитаны'))
@@ -0,0 +1,56 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import feed_cache, thumbnails
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Создаёт миниатюры для всех картинок постов в пуле процессов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Число процессов (по умолчанию по числу ядер)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Сколько картинок отправлять в пул за раз'
+        )
+
+    def handle(self, *args, **options):
+        names = Post.objects.exclude(image='').exclude(
+            image__isnull=True
+        ).values_list('image', flat=True).order_by().iterator()
+        started = time.monotonic()
+        images = variants = 0
+        with thumbnails.make_executor(options['workers']) as pool:
+            batch = []
+            for name in names:
+                batch.append(name)
+                if len(batch) >= options['batch_size']:
+                    variants += self.render(pool, batch)
+                    images += len(batch)
+                    batch = []
+            if batch:
+                variants += self.render(pool, batch)
+                images += len(batch)
+        feed_cache.bump(feed_cache.POSTS)
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Картинок: {images}, миниатюр: {variants}, '
+            f'{images / elapsed if elapsed else 0:.1f} картинок/с'
+        ))
+
+    def render(self, pool, names):
+        done = 0
+        for rendered in pool.map(thumbnails.render_variants, names):
+            thumbnails.register_variants(rendered, invalidate=False)
+            done += len(rendered)
+        return done
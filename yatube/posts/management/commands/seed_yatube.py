@@ -0,0 +1,310 @@
+import io
+import itertools
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+from PIL import Image
+
+from core.models import StoredFile
+from posts import counters, feed_cache, search, timeline
+from posts.models import Comment, Follow, Group, Post, User
+
+WORDS = (
+    'лента', 'пост', 'автор', 'группа', 'подписка', 'комментарий', 'день',
+    'город', 'книга', 'музыка', 'кино', 'путешествие', 'код', 'кофе',
+    'утро', 'вечер', 'новости', 'фото', 'лето', 'зима', 'море', 'горы',
+    'друзья', 'работа', 'проект', 'идея', 'вопрос', 'ответ', 'история',
+    'сегодня', 'вчера', 'завтра', 'очень', 'снова', 'наконец', 'просто',
+    'новый', 'старый', 'большой', 'маленький', 'хороший', 'странный',
+    'читать', 'писать', 'смотреть', 'думать', 'ехать', 'готовить', 'учить',
+)
+SEED_IMAGES = 8
+
+
+@contextmanager
+def explicit_dates(*fields):
+    """Разрешает bulk_create записать свои даты в поля с auto_now_add."""
+    saved = [field.auto_now_add for field in fields]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, value in zip(fields, saved):
+            field.auto_now_add = value
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет базу синтетическими пользователями, группами, постами, '
+        'подписками и комментариями'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users', type=int, default=1000,
+            help='Число пользователей'
+        )
+        parser.add_argument(
+            '--groups', type=int, default=20,
+            help='Число групп'
+        )
+        parser.add_argument(
+            '--posts-per-user', type=float, default=20,
+            help='Среднее число постов у пользователя'
+        )
+        parser.add_argument(
+            '--follows-per-user', type=float, default=20,
+            help='Среднее число подписок у пользователя'
+        )
+        parser.add_argument(
+            '--follower-alpha', type=float, default=1.1,
+            help='Показатель степенного закона популярности авторов'
+        )
+        parser.add_argument(
+            '--comments-per-post', type=float, default=3,
+            help='Среднее число комментариев у поста'
+        )
+        parser.add_argument(
+            '--image-ratio', type=float, default=0.1,
+            help='Доля постов с картинкой'
+        )
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help='За сколько дней распределить даты публикаций'
+        )
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Зерно генератора: одинаковое зерно даёт одинаковые данные'
+        )
+        parser.add_argument(
+            '--prefix', default='seed',
+            help='Префикс имён пользователей и адресов групп'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Строк в одном INSERT'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=50000,
+            help='Строк в одной транзакции'
+        )
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.rng = random.Random(options['seed'])
+        self.now = timezone.now()
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=f'{prefix}_').exists():
+            raise CommandError(
+                f'Пользователи с префиксом {prefix} уже есть: '
+                f'укажите другой --prefix.'
+            )
+        started = time.monotonic()
+        total = 0
+        with explicit_dates(
+            Post._meta.get_field('pub_date'),
+            Comment._meta.get_field('created'),
+        ):
+            for name, stage in (
+                ('Пользователи', self.create_users),
+                ('Группы', self.create_groups),
+                ('Посты', self.create_posts),
+                ('Подписки', self.create_follows),
+                ('Комментарии', self.create_comments),
+            ):
+                total += self.timed(name, stage)
+        self.timed('Счётчики', self.finish)
+        # Рассылка по лентам смотрит на уже пересчитанных подписчиков.
+        total += self.timed('Ленты подписок', timeline.fan_out_pending)
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Всего строк: {total}, {total / elapsed:.0f} строк/с'
+        ))
+
+    def timed(self, name, stage):
+        started = time.monotonic()
+        rows = stage() or 0
+        elapsed = time.monotonic() - started
+        rate = rows / elapsed if elapsed else 0
+        self.stdout.write(f'{name}: {rows} строк за {elapsed:.1f} с, '
+                          f'{rate:.0f} строк/с')
+        return rows
+
+    def write(self, model, objects, **kwargs):
+        """Пишет объекты пачками bulk_create, по транзакции на чанк."""
+        written = 0
+        objects = iter(objects)
+        while True:
+            chunk = list(itertools.islice(objects, self.options['chunk_size']))
+            if not chunk:
+                return written
+            # Django 2.2 не ограничивает явный batch_size лимитами базы.
+            batch_size = min(
+                self.options['batch_size'],
+                connection.ops.bulk_batch_size(
+                    model._meta.concrete_fields, chunk
+                ),
+            )
+            with transaction.atomic():
+                model.objects.bulk_create(
+                    chunk, batch_size=max(batch_size, 1), **kwargs
+                )
+            written += len(chunk)
+
+    def spread(self, mean):
+        """Случайное число со средним ``mean``."""
+        return self.rng.randint(0, round(mean * 2))
+
+    def text(self, low, high):
+        return ' '.join(
+            self.rng.choices(WORDS, k=self.rng.randint(low, high))
+        ).capitalize()
+
+    def create_users(self):
+        password = make_password(None)
+        prefix = self.options['prefix']
+        written = self.write(User, (
+            User(username=f'{prefix}_{number}', password=password)
+            for number in range(self.options['users'])
+        ))
+        self.user_ids = list(User.objects.filter(
+            username__startswith=f'{prefix}_'
+        ).order_by('pk').values_list('pk', flat=True))
+        return written
+
+    def create_groups(self):
+        prefix = self.options['prefix']
+        written = self.write(Group, (
+            Group(
+                title=f'Группа {number}',
+                slug=f'{prefix}-{number}',
+                description=self.text(5, 20),
+            )
+            for number in range(self.options['groups'])
+        ))
+        self.group_ids = list(Group.objects.filter(
+            slug__startswith=f'{prefix}-'
+        ).order_by('pk').values_list('pk', flat=True))
+        return written
+
+    def seed_images(self):
+        """Несколько картинок, на которые ссылаются посты с изображением."""
+        storage = Post._meta.get_field('image').storage
+        names = []
+        for number in range(SEED_IMAGES):
+            name = f'posts/{self.options["prefix"]}_{number}.jpg'
+            color = tuple(self.rng.randrange(256) for _ in range(3))
+            if not storage.exists(name):
+                buffer = io.BytesIO()
+                Image.new('RGB', (1200, 800), color).save(buffer, 'JPEG')
+                name = storage.save(name, ContentFile(buffer.getvalue()))
+            names.append(name)
+        return names
+
+    def create_posts(self):
+        images = self.seed_images() if self.options['image_ratio'] else []
+        self.first_post_id = (
+            Post.objects.order_by('-pk').values_list('pk', flat=True).first()
+            or 0
+        )
+        period = self.options['days'] * 24 * 60 * 60
+
+        def posts():
+            for author_id in self.user_ids:
+                for _ in range(self.spread(self.options['posts_per_user'])):
+                    image = None
+                    if self.rng.random() < self.options['image_ratio']:
+                        image = self.rng.choice(images)
+                    group_id = None
+                    if self.group_ids and self.rng.random() < 0.5:
+                        group_id = self.rng.choice(self.group_ids)
+                    yield Post(
+                        text=self.text(5, 60),
+                        author_id=author_id,
+                        group_id=group_id,
+                        image=image,
+                        pub_date=self.now - timedelta(
+                            seconds=self.rng.randrange(period)
+                        ),
+                    )
+        written = self.write(Post, posts())
+        self.acquire_images()
+        return written
+
+    def acquire_images(self):
+        """Ссылки ``StoredFile`` на картинки: bulk_create их не ведёт."""
+        counts = Post.objects.filter(pk__gt=self.first_post_id).exclude(
+            image=''
+        ).exclude(image__isnull=True).values('image').annotate(
+            refs=Count('pk')
+        ).order_by()
+        with transaction.atomic():
+            for row in counts:
+                rows = StoredFile.objects.filter(name=row['image'])
+                if not rows.update(refs=F('refs') + row['refs']):
+                    StoredFile.objects.create(
+                        name=row['image'], refs=row['refs']
+                    )
+
+    def create_follows(self):
+        """Подписки со степенным распределением популярности авторов."""
+        authors = self.user_ids[:]
+        self.rng.shuffle(authors)
+        weights = list(itertools.accumulate(
+            1 / rank ** self.options['follower_alpha']
+            for rank in range(1, len(authors) + 1)
+        ))
+
+        def follows():
+            for user_id in self.user_ids:
+                wanted = min(
+                    self.spread(self.options['follows_per_user']),
+                    len(authors) - 1,
+                )
+                chosen = set()
+                # Выборка с возвращением: дубликаты и себя отбрасываем.
+                for _ in range(wanted * 3):
+                    if len(chosen) >= wanted:
+                        break
+                    author_id = self.rng.choices(
+                        authors, cum_weights=weights
+                    )[0]
+                    if author_id != user_id:
+                        chosen.add(author_id)
+                for author_id in sorted(chosen):
+                    yield Follow(user_id=user_id, author_id=author_id)
+        return self.write(Follow, follows(), ignore_conflicts=True)
+
+    def create_comments(self):
+        posts = Post.objects.filter(pk__gt=self.first_post_id).order_by(
+            'pk'
+        ).values_list('pk', 'pub_date')
+
+        def comments():
+            for post_id, pub_date in posts.iterator():
+                for _ in range(self.spread(self.options['comments_per_post'])):
+                    delay = timedelta(
+                        seconds=self.rng.randrange(7 * 24 * 60 * 60)
+                    )
+                    yield Comment(
+                        post_id=post_id,
+                        author_id=self.rng.choice(self.user_ids),
+                        text=self.text(1, 20),
+                        created=min(pub_date + delay, self.now),
+                    )
+        return self.write(Comment, comments())
+
+    def finish(self):
+        """bulk_create не шлёт сигналы: пересчитываем то, что они ведут."""
+        counters.recount_all()
+        search.get_backend().rebuild()
+        feed_cache.bump(feed_cache.POSTS)
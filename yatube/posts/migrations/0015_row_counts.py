@@ -0,0 +1,41 @@
+# Generated by Django 2.2.16 on 2026-10-18 02:43
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_row_counts(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    RowCount = apps.get_model('posts', 'RowCount')
+    posts = Post.objects.order_by()
+    rows = [RowCount(key='posts', value=posts.count())]
+    rows.extend(
+        RowCount(key=f'group:{row["group"]}', value=row['total'])
+        for row in posts.exclude(group__isnull=True).values(
+            'group'
+        ).annotate(total=Count('pk'))
+    )
+    RowCount.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0014_comment_threads'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RowCount',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True, verbose_name='Выборка')),
+                ('value', models.BigIntegerField(default=0, verbose_name='Число строк')),
+            ],
+            options={
+                'verbose_name': 'Число строк',
+                'verbose_name_plural': 'Числа строк',
+            },
+        ),
+        migrations.RunPython(fill_row_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,77 @@
+import itertools
+
+from django.conf import settings
+from django.db import migrations, models, transaction
+from django.db.models import Count, OuterRef, Subquery
+
+BATCH_SIZE = 1000
+
+
+def fill_timelines(apps, schema_editor):
+    """Дата поста в старых записях и рассылка ещё не разосланных постов.
+
+    Посты авторов с подписчиками больше ``TIMELINE_FANOUT_LIMIT``
+    остаются неразосланными, как и при публикации.
+    """
+    Follow = apps.get_model('posts', 'Follow')
+    Post = apps.get_model('posts', 'Post')
+    TimelineEntry = apps.get_model('posts', 'TimelineEntry')
+    TimelineEntry.objects.update(pub_date=Subquery(
+        Post.objects.filter(pk=OuterRef('post_id')).values('pub_date')[:1]
+    ))
+    limit = getattr(settings, 'TIMELINE_FANOUT_LIMIT', 1000)
+    celebrities = Follow.objects.values('author_id').annotate(
+        followers=Count('id')
+    ).filter(followers__gt=limit).values('author_id')
+    authors = Post.objects.filter(fanout=False).exclude(
+        author_id__in=celebrities
+    ).values_list('author_id', flat=True).distinct().order_by()
+    for author_id in authors.iterator():
+        posts = list(Post.objects.filter(
+            author_id=author_id, fanout=False
+        ).values_list('pk', 'pub_date'))
+        followers = list(Follow.objects.filter(
+            author_id=author_id
+        ).values_list('user_id', flat=True))
+        # Пары пост × подписчик не собираются в память целиком.
+        entries = (
+            TimelineEntry(user_id=user_id, post_id=pk, pub_date=pub_date)
+            for pk, pub_date in posts
+            for user_id in followers
+        )
+        with transaction.atomic():
+            while True:
+                batch = list(itertools.islice(entries, BATCH_SIZE))
+                if not batch:
+                    break
+                TimelineEntry.objects.bulk_create(
+                    batch, ignore_conflicts=True
+                )
+            Post.objects.filter(
+                author_id=author_id, fanout=False
+            ).update(fanout=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0017_follow_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='timelineentry',
+            name='pub_date',
+            field=models.DateTimeField(null=True, verbose_name='Дата публикации поста'),
+        ),
+        migrations.RunPython(fill_timelines, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='timelineentry',
+            name='pub_date',
+            field=models.DateTimeField(verbose_name='Дата публикации поста'),
+        ),
+        migrations.AddIndex(
+            model_name='timelineentry',
+            index=models.Index(fields=['user', '-pub_date', '-post'], name='timeline_user_pub_date_idx'),
+        ),
+    ]
@@ -1,8 +1,18 @@
 from django.db import models
 from django.contrib.auth import get_user_model
 
+from core.storage import ContentAddressedStorage
+
 User = get_user_model()
 
+# Поля, которые нужны для отрисовки поста в ленте.
+FEED_FIELDS = (
+    'id', 'text', 'pub_date', 'modified', 'image', 'fanout',
+    'author', 'author__username',
+    'author__first_name', 'author__last_name',
+    'group', 'group__title', 'group__slug',
+)
+
 
 class Group(models.Model):
     title = models.CharField(max_length=200, verbose_name='Название группы')
@@ -13,6 +23,16 @@ class Group(models.Model):
         return self.title
 
 
+class PostQuerySet(models.QuerySet):
+    def for_feed(self):
+        """Посты для лент: автор и группа одним запросом."""
+        return self.select_related('author', 'group').only(*FEED_FIELDS)
+
+    def for_detail(self):
+        """Пост для отдельной страницы; комментарии листаются отдельно."""
+        return self.select_related('author__stats', 'group')
+
+
 class Post(models.Model):
     text = models.TextField(
         verbose_name='Текст поста',
@@ -22,6 +42,10 @@ class Post(models.Model):
         auto_now_add=True,
         verbose_name='Дата публикации'
     )
+    modified = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата изменения'
+    )
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -39,15 +63,42 @@ class Post(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        storage=ContentAddressedStorage(),
         blank=True,
         null=True
     )
+    fanout = models.BooleanField(
+        default=False,
+        editable=False,
+        verbose_name='Разослан по лентам подписчиков'
+    )
+
+    comment_count = models.IntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Число комментариев'
+    )
+
+    objects = PostQuerySet.as_manager()
 
     def __str__(self):
         return self.text[:15]
 
     class Meta:
         ordering = ['-pub_date']
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'], name='post_pub_date_idx'
+            ),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='post_author_pub_date_idx'
+            ),
+            models.Index(
+                fields=['group', '-pub_date', '-id'],
+                name='post_group_pub_date_idx'
+            ),
+        ]
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
 
@@ -72,12 +123,53 @@ class Comment(models.Model):
         verbose_name='Дата и время публикации',
         auto_now_add=True
     )
+    parent = models.ForeignKey(
+        'self',
+        on_delete=models.CASCADE,
+        related_name='replies',
+        blank=True, null=True,
+        editable=False,
+        verbose_name='Ответ на'
+    )
+    thread = models.ForeignKey(
+        'self',
+        on_delete=models.CASCADE,
+        related_name='+',
+        blank=True, null=True,
+        editable=False,
+        verbose_name='Корень ветки'
+    )
+    path = models.CharField(
+        max_length=64,
+        blank=True,
+        default='',
+        editable=False,
+        verbose_name='Путь в ветке'
+    )
+    depth = models.PositiveSmallIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Глубина'
+    )
+    reply_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Число ответов'
+    )
 
     def __str__(self):
         return self.text[:15]
 
     class Meta:
         ordering = ['-created']
+        indexes = [
+            models.Index(
+                fields=['post', '-created'], name='comment_post_created_idx'
+            ),
+            models.Index(
+                fields=['thread', 'path'], name='comment_thread_path_idx'
+            ),
+        ]
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
 
@@ -98,3 +190,101 @@ class Follow(models.Model):
 
     class Meta:
         unique_together = [['user', 'author']]
+        indexes = [
+            models.Index(
+                fields=['author', 'user'], name='follow_author_user_idx'
+            ),
+        ]
+
+
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(
+        User,
+        related_name='timeline',
+        verbose_name='Владелец ленты',
+        on_delete=models.CASCADE
+    )
+    post = models.ForeignKey(
+        Post,
+        related_name='timeline_entries',
+        verbose_name='Пост',
+        on_delete=models.CASCADE
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации поста'
+    )
+
+    class Meta:
+        unique_together = [['user', 'post']]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-post'],
+                name='timeline_user_pub_date_idx'
+            ),
+        ]
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи лент'
+
+
+class UserStats(models.Model):
+    """Счётчики пользователя, которые поддерживаются сигналами."""
+    user = models.OneToOneField(
+        User,
+        related_name='stats',
+        verbose_name='Пользователь',
+        on_delete=models.CASCADE
+    )
+    posts_count = models.IntegerField(
+        default=0,
+        verbose_name='Число постов'
+    )
+    followers_count = models.IntegerField(
+        default=0,
+        verbose_name='Число подписчиков'
+    )
+    following_count = models.IntegerField(
+        default=0,
+        verbose_name='Число подписок'
+    )
+
+    class Meta:
+        verbose_name = 'Счётчики пользователя'
+        verbose_name_plural = 'Счётчики пользователей'
+
+
+class RowCount(models.Model):
+    """Число строк в выборке (все посты, посты группы), которое
+    поддерживается сигналами вместо ``COUNT(*)``."""
+    key = models.CharField(
+        max_length=64,
+        unique=True,
+        verbose_name='Выборка'
+    )
+    value = models.BigIntegerField(
+        default=0,
+        verbose_name='Число строк'
+    )
+
+    def __str__(self):
+        return f'{self.key}: {self.value}'
+
+    class Meta:
+        verbose_name = 'Число строк'
+        verbose_name_plural = 'Числа строк'
+
+
+class SearchTerm(models.Model):
+    """Запись обратного индекса для переносимого поиска по постам."""
+    term = models.CharField(max_length=64, verbose_name='Слово')
+    post = models.ForeignKey(
+        Post,
+        related_name='search_terms',
+        verbose_name='Пост',
+        on_delete=models.CASCADE
+    )
+    weight = models.IntegerField(verbose_name='Число вхождений')
+
+    class Meta:
+        unique_together = [['term', 'post']]
+        verbose_name = 'Слово поискового индекса'
+        verbose_name_plural = 'Поисковый индекс'
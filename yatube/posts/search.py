@@ -0,0 +1,225 @@
+"""Полнотекстовый поиск по постам.
+
+Бэкенд выбирается настройкой ``POSTS_SEARCH_BACKEND``: ``auto`` берёт
+FTS5 на SQLite и ``tsvector`` с GIN-индексом на PostgreSQL, на остальных
+базах работает обратный индекс в таблице ``SearchTerm``. Все бэкенды
+возвращают queryset постов с аннотацией ``search_rank``: чем больше,
+тем релевантнее.
+"""
+import re
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count, FloatField, OuterRef, Subquery, Sum
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast
+
+from .models import Post, SearchTerm
+
+FTS_TABLE = 'posts_post_fts'
+PG_INDEX = 'posts_post_text_search_idx'
+PG_CONFIG = 'russian'
+TERM_LENGTH = 64
+BATCH_SIZE = 1000
+
+RANK = 'search_rank'
+ORDERING = ('-' + RANK, '-pk')
+
+_fts_available = None
+
+
+def tokenize(text):
+    return [
+        word[:TERM_LENGTH] for word in re.findall(r'\w+', text.lower())
+    ]
+
+
+def pg_config():
+    config = getattr(settings, 'POSTS_SEARCH_CONFIG', PG_CONFIG)
+    if not re.fullmatch(r'\w+', config):
+        raise ValueError(f'Недопустимая конфигурация поиска: {config}')
+    return config
+
+
+class PythonBackend:
+    """Обратный индекс, который строится на Python и хранится в базе."""
+
+    def index(self, post):
+        SearchTerm.objects.filter(post_id=post.pk).delete()
+        SearchTerm.objects.bulk_create(
+            SearchTerm(term=term, post_id=post.pk, weight=weight)
+            for term, weight in Counter(tokenize(post.text)).items()
+        )
+
+    def remove(self, post_id):
+        SearchTerm.objects.filter(post_id=post_id).delete()
+
+    def rebuild(self):
+        SearchTerm.objects.all().delete()
+        batch = []
+        posts = Post.objects.order_by().values_list('pk', 'text')
+        for post_id, text in posts.iterator():
+            batch.extend(
+                SearchTerm(term=term, post_id=post_id, weight=weight)
+                for term, weight in Counter(tokenize(text)).items()
+            )
+            if len(batch) >= BATCH_SIZE:
+                SearchTerm.objects.bulk_create(batch)
+                batch = []
+        SearchTerm.objects.bulk_create(batch)
+
+    def _matches(self, query):
+        terms = set(tokenize(query))
+        if not terms:
+            return None
+        return SearchTerm.objects.filter(term__in=terms).values(
+            'post'
+        ).annotate(matched=Count('term')).filter(matched=len(terms))
+
+    def filter(self, queryset, query):
+        matches = self._matches(query)
+        if matches is None:
+            return queryset.none()
+        return queryset.filter(pk__in=matches.values('post'))
+
+    def search(self, queryset, query):
+        matches = self._matches(query)
+        if matches is None:
+            return queryset.none()
+        score = matches.filter(post=OuterRef('pk')).annotate(
+            score=Sum('weight')
+        ).values('score')
+        return queryset.filter(pk__in=matches.values('post')).annotate(
+            **{RANK: Cast(Subquery(score), FloatField())}
+        )
+
+
+class SQLiteFTSBackend:
+    """Виртуальная таблица FTS5, rowid которой совпадает с id поста."""
+
+    def index(self, post):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post.pk]
+            )
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, text) VALUES (%s, %s)',
+                [post.pk, post.text],
+            )
+
+    def remove(self, post_id):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post_id]
+            )
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, text) '
+                f'SELECT id, text FROM {Post._meta.db_table}'
+            )
+
+    def _match(self, query):
+        terms = tokenize(query)
+        if not terms:
+            return None
+        return ' '.join(f'"{term}"' for term in terms)
+
+    def filter(self, queryset, query):
+        match = self._match(query)
+        if match is None:
+            return queryset.none()
+        return queryset.extra(
+            where=[
+                f'{Post._meta.db_table}.id IN (SELECT rowid FROM {FTS_TABLE} '
+                f'WHERE {FTS_TABLE} MATCH %s)'
+            ],
+            params=[match],
+        )
+
+    def search(self, queryset, query):
+        match = self._match(query)
+        if match is None:
+            return queryset.none()
+        rank = RawSQL(
+            f'SELECT -bm25({FTS_TABLE}) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s '
+            f'AND rowid = {Post._meta.db_table}.id',
+            [match],
+            output_field=FloatField(),
+        )
+        return self.filter(queryset, query).annotate(**{RANK: rank})
+
+
+class PostgresBackend:
+    """``to_tsvector`` по тексту поста с GIN-индексом по тому же выражению.
+
+    Индекс обновляется самой базой, поэтому index/remove ничего не делают.
+    """
+
+    def index(self, post):
+        pass
+
+    def remove(self, post_id):
+        pass
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'REINDEX INDEX {PG_INDEX}')
+
+    def _vector(self):
+        return (
+            f"to_tsvector('{pg_config()}'::regconfig, "
+            f'{Post._meta.db_table}.text)'
+        )
+
+    def _query(self):
+        return f"plainto_tsquery('{pg_config()}'::regconfig, %s)"
+
+    def filter(self, queryset, query):
+        if not tokenize(query):
+            return queryset.none()
+        return queryset.extra(
+            where=[f'{self._vector()} @@ {self._query()}'], params=[query]
+        )
+
+    def search(self, queryset, query):
+        rank = RawSQL(
+            f'ts_rank({self._vector()}, {self._query()})',
+            [query],
+            output_field=FloatField(),
+        )
+        return self.filter(queryset, query).annotate(**{RANK: rank})
+
+
+def fts_available():
+    global _fts_available
+    if _fts_available is None:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT 1 FROM sqlite_master WHERE name = %s', [FTS_TABLE]
+            )
+            _fts_available = cursor.fetchone() is not None
+    return _fts_available
+
+
+def get_backend():
+    name = getattr(settings, 'POSTS_SEARCH_BACKEND', 'auto')
+    if name == 'auto':
+        if connection.vendor == 'postgresql':
+            name = 'postgres'
+        elif connection.vendor == 'sqlite' and fts_available():
+            name = 'fts'
+        else:
+            name = 'python'
+    return BACKENDS[name]
+
+
+BACKENDS = {
+    'python': PythonBackend(),
+    'fts': SQLiteFTSBackend(),
+    'postgres': PostgresBackend(),
+}
@@ -0,0 +1,230 @@
+from django.db.models.signals import (
+    post_delete, post_save, pre_delete, pre_save,
+)
+from django.dispatch import receiver
+
+from core import storage
+
+from . import (
+    cards, counters, feed_cache, search, thumbnails, threads, timeline,
+)
+from .models import Comment, Follow, Group, Post, User, UserStats
+
+
+@receiver(post_save, sender=Post)
+def post_created(sender, instance, created, **kwargs):
+    if created:
+        timeline.fan_out_post(instance)
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    if created:
+        timeline.backfill(instance)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    timeline.remove(instance)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_feeds(sender, **kwargs):
+    feed_cache.bump(feed_cache.POSTS)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comments(sender, instance, **kwargs):
+    feed_cache.bump(feed_cache.comments_scope(instance.post_id))
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_follow_feed(sender, instance, **kwargs):
+    feed_cache.bump(feed_cache.follow_scope(instance.user_id))
+    feed_cache.bump(feed_cache.followers_scope(instance.author_id))
+
+
+# Поля автора и группы, которые выводит карточка поста.
+CARD_USER_FIELDS = ('username', 'first_name', 'last_name')
+CARD_GROUP_FIELDS = ('slug',)
+
+
+def _card_fields_before(sender, instance, fields, update_fields):
+    instance._card_fields = None
+    if instance.pk is None:
+        return
+    if update_fields is not None and not set(fields) & set(update_fields):
+        return
+    instance._card_fields = sender.objects.filter(pk=instance.pk).values(
+        *fields
+    ).first()
+
+
+def _card_fields_changed(instance, fields):
+    previous = getattr(instance, '_card_fields', None)
+    return previous is not None and any(
+        previous[field] != getattr(instance, field) for field in fields
+    )
+
+
+@receiver(pre_save, sender=User)
+def author_changing(sender, instance, update_fields=None, **kwargs):
+    _card_fields_before(sender, instance, CARD_USER_FIELDS, update_fields)
+
+
+@receiver(post_save, sender=User)
+def author_cards_expired(sender, instance, created, **kwargs):
+    if not created and _card_fields_changed(instance, CARD_USER_FIELDS):
+        cards.touch(author=instance)
+        feed_cache.bump(feed_cache.POSTS)
+
+
+@receiver(pre_save, sender=Group)
+def group_changing(sender, instance, update_fields=None, **kwargs):
+    _card_fields_before(sender, instance, CARD_GROUP_FIELDS, update_fields)
+
+
+@receiver(post_save, sender=Group)
+def group_cards_expired(sender, instance, created, **kwargs):
+    if not created and _card_fields_changed(instance, CARD_GROUP_FIELDS):
+        cards.touch(group=instance)
+
+
+@receiver(pre_delete, sender=Group)
+def group_cards_dropped(sender, instance, **kwargs):
+    # После удаления group_id обнуляется через UPDATE, без сигналов Post.
+    cards.touch(group=instance)
+
+
+@receiver(post_save, sender=User)
+def user_created(sender, instance, created, **kwargs):
+    if created:
+        UserStats.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=Post)
+def post_counted(sender, instance, created, **kwargs):
+    if created:
+        counters.change_user_counter(instance.author_id, 'posts_count', 1)
+
+
+@receiver(post_delete, sender=Post)
+def post_uncounted(sender, instance, **kwargs):
+    counters.change_user_counter(instance.author_id, 'posts_count', -1)
+    counters.change_post_counts(instance.group_id, -1)
+
+
+@receiver(post_save, sender=Post)
+def post_rows_counted(sender, instance, created, **kwargs):
+    if created:
+        counters.change_post_counts(instance.group_id, 1)
+        return
+    previous = getattr(instance, '_previous', {})
+    if 'group_id' in previous and previous['group_id'] != instance.group_id:
+        if previous['group_id'] is not None:
+            counters.change_row_count(
+                counters.group_key(previous['group_id']), -1
+            )
+        if instance.group_id is not None:
+            counters.change_row_count(
+                counters.group_key(instance.group_id), 1
+            )
+
+
+@receiver(post_delete, sender=Group)
+def group_rows_dropped(sender, instance, **kwargs):
+    counters.drop_row_count(counters.group_key(instance.pk))
+
+
+@receiver(post_save, sender=Comment)
+def comment_counted(sender, instance, created, **kwargs):
+    if created:
+        counters.change_comment_count(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_uncounted(sender, instance, **kwargs):
+    counters.change_comment_count(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Comment)
+def comment_threaded(sender, instance, created, **kwargs):
+    if created and instance.parent_id:
+        threads.finish(instance)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_unthreaded(sender, instance, **kwargs):
+    if instance.parent_id:
+        threads.released(instance)
+
+
+@receiver(post_save, sender=Follow)
+def follow_counted(sender, instance, created, **kwargs):
+    if created:
+        counters.change_user_counter(instance.author_id, 'followers_count', 1)
+        counters.change_user_counter(instance.user_id, 'following_count', 1)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_uncounted(sender, instance, **kwargs):
+    counters.change_user_counter(instance.author_id, 'followers_count', -1)
+    counters.change_user_counter(instance.user_id, 'following_count', -1)
+
+
+@receiver(post_save, sender=Post)
+def post_image_saved(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and 'image' not in update_fields:
+        return
+    # Правка текста без новой картинки не пересоздаёт миниатюры.
+    previous = getattr(instance, '_previous', {}).get('image') or ''
+    if previous != (instance.image.name or ''):
+        thumbnails.schedule(instance.image)
+
+
+@receiver(pre_save, sender=Post)
+def post_changing(sender, instance, update_fields=None, **kwargs):
+    # Прежние картинка и группа нужны, чтобы отпустить ссылку на файл
+    # и поправить число постов в группах.
+    instance._previous = {}
+    if instance.pk is None:
+        return
+    if update_fields is not None and not {'image', 'group'} & set(
+        update_fields
+    ):
+        return
+    instance._previous = Post.objects.filter(pk=instance.pk).values(
+        'image', 'group_id'
+    ).first() or {}
+
+
+@receiver(post_save, sender=Post)
+def post_image_referenced(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and 'image' not in update_fields:
+        return
+    previous = getattr(instance, '_previous', {}).get('image') or ''
+    current = instance.image.name or ''
+    if previous != current:
+        storage.acquire(current, instance.image.storage)
+        storage.release(previous, instance.image.storage)
+
+
+@receiver(post_delete, sender=Post)
+def post_image_released(sender, instance, **kwargs):
+    storage.release(instance.image.name, instance.image.storage)
+
+
+@receiver(post_save, sender=Post)
+def post_indexed(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or 'text' in update_fields:
+        search.get_backend().index(instance)
+
+
+@receiver(post_delete, sender=Post)
+def post_unindexed(sender, instance, **kwargs):
+    search.get_backend().remove(instance.pk)
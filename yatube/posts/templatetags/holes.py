@@ -0,0 +1,12 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from posts import holes
+
+register = template.Library()
+
+
+@register.simple_tag
+def hole(name, *args):
+    """Метка персонального фрагмента; заполняется после рендеринга."""
+    return mark_safe(holes.marker(name, *args))
@@ -0,0 +1,51 @@
+from django import template
+
+register = template.Library()
+
+NUMBERED_PAGES = 3
+
+
+@register.simple_tag(takes_context=True)
+def page_query(context, cursor=None, number=None):
+    """Строка запроса для ссылки паджинатора с сохранением прочих параметров.
+
+    Номер страницы из старых ссылок отбрасывается: дальше навигация идёт
+    по курсору, а без курсора ссылка ведёт на страницу ``number`` или
+    на первую.
+    """
+    params = context['request'].GET.copy()
+    params.pop('page', None)
+    params.pop('cursor', None)
+    if cursor:
+        params['cursor'] = cursor
+    elif number and number > 1:
+        params['page'] = number
+    return params.urlencode()
+
+
+@register.simple_tag
+def elided_page_range(page_obj):
+    """Ссылки на соседние страницы: пары ``(номер, курсор)``, ``None`` —
+    пропуск.
+
+    По номеру (через OFFSET) ведут только первые ``NUMBERED_PAGES``
+    страниц, соседние с текущей открываются по её курсорам. Поэтому на
+    глубоких страницах ни одна ссылка не дороже курсорной, а дальние
+    страницы (и последняя) не показываются: их число только оценено.
+    """
+    number = page_obj.number
+    last = max(page_obj.last_number or number, number)
+    if not page_obj.next_cursor:
+        last = number
+    links = {n: None for n in range(1, min(NUMBERED_PAGES, last) + 1)}
+    links[number] = None
+    if page_obj.previous_cursor:
+        links[number - 1] = page_obj.previous_cursor
+    if page_obj.next_cursor:
+        links[number + 1] = page_obj.next_cursor
+    pages = []
+    for n in sorted(links):
+        if pages and n > pages[-1][0] + 1:
+            pages.append(None)
+        pages.append((n, links[n]))
+    return pages
@@ -0,0 +1,12 @@
+from django import template
+
+from posts import cards
+
+register = template.Library()
+
+
+@register.simple_tag
+def post_cards(posts):
+    """Готовые карточки постов страницы: кэш одним запросом, промахи
+    рендерятся на месте."""
+    return cards.render(posts)
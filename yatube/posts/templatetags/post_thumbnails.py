@@ -0,0 +1,13 @@
+from django import template
+
+from posts import thumbnails
+
+register = template.Library()
+
+
+@register.simple_tag
+def variant(image, name='feed'):
+    """Готовая миниатюра картинки или ``None``, если она ещё создаётся."""
+    if not image:
+        return None
+    return thumbnails.lookup(image, name)
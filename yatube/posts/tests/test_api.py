@@ -0,0 +1,131 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post, User
+
+
+class ApiTests(TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Author1')
+        cls.reader = User.objects.create_user(username='Reader')
+        cls.group = Group.objects.create(
+            title='Test group', slug='test-slug', description='Описание'
+        )
+        Post.objects.bulk_create(
+            Post(text=f'Post {number}', author=cls.author, group=cls.group)
+            for number in range(25)
+        )
+        cls.post = Post.objects.order_by('-pk').first()
+        Comment.objects.create(
+            post=cls.post, author=cls.reader, text='Comment'
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, name, params=None, **kwargs):
+        response = self.client.get(reverse(f'api_v1:{name}', **kwargs), params)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        return response
+
+    # проверяем листание ленты курсорами до конца
+    def test_cursor_pagination(self):
+        response = self.get('posts', {'limit': 10})
+        seen = []
+        while True:
+            data = response.json()
+            seen.extend(post['id'] for post in data['results'])
+            if data['next'] is None:
+                break
+            response = self.client.get(data['next'])
+        self.assertEqual(len(seen), Post.objects.count())
+        self.assertEqual(len(set(seen)), len(seen))
+        self.assertEqual(seen, sorted(seen, reverse=True))
+
+    def test_sparse_fields(self):
+        data = self.get('posts', {'fields': 'id,author'}).json()
+        self.assertEqual(set(data['results'][0]), {'id', 'author'})
+        self.assertEqual(data['results'][0]['author'], 'Author1')
+        response = self.get('posts', {'fields': 'id,password'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_invalid_cursor(self):
+        self.assertEqual(
+            self.get('posts', {'cursor': 'broken'}).status_code, 400
+        )
+
+    def test_resources(self):
+        post = self.get('post', kwargs={'post_id': self.post.pk}).json()
+        self.assertEqual(post['text'], self.post.text)
+        self.assertEqual(post['group'], 'test-slug')
+        self.assertEqual(post['comment_count'], 1)
+        comments = self.get(
+            'comments', kwargs={'post_id': self.post.pk}
+        ).json()['results']
+        self.assertEqual(
+            [(comment['author'], comment['text']) for comment in comments],
+            [('Reader', 'Comment')],
+        )
+        groups = self.get('groups').json()['results']
+        self.assertEqual(groups[0]['slug'], 'test-slug')
+        followers = self.get(
+            'followers', kwargs={'username': 'Author1'}
+        ).json()['results']
+        self.assertEqual([user['username'] for user in followers], ['Reader'])
+        self.assertEqual(
+            self.get('post', kwargs={'post_id': 0}).status_code, 404
+        )
+
+    def test_follow_feed_requires_login(self):
+        self.assertEqual(self.get('follow').status_code, 401)
+        self.client.force_login(self.reader)
+        self.assertEqual(len(self.get('follow').json()['results']), 20)
+
+    @mock.patch('django.db.transaction.on_commit', lambda func: func())
+    def test_conditional_get(self):
+        response = self.get('posts')
+        response = self.client.get(
+            reverse('api_v1:posts'), HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(response.status_code, 304)
+        etag = self.get('followers', kwargs={'username': 'Author1'})['ETag']
+        Follow.objects.create(user=self.author, author=self.reader)
+        Follow.objects.filter(user=self.reader).delete()
+        response = self.client.get(
+            reverse('api_v1:followers', kwargs={'username': 'Author1'}),
+            HTTP_IF_NONE_MATCH=etag,
+        )
+        self.assertEqual(response.status_code, 200)
+
+    # проверяем, что число запросов не зависит от размера страницы
+    def test_constant_queries(self):
+        lists = (
+            ('posts', {}),
+            ('group_posts', {'slug': 'test-slug'}),
+            ('user_posts', {'username': 'Author1'}),
+            ('comments', {'post_id': self.post.pk}),
+            ('followers', {'username': 'Author1'}),
+        )
+        for name, kwargs in lists:
+            with self.subTest(name=name):
+                counts = []
+                for limit in (1, 20):
+                    with CaptureQueriesContext(connection) as queries:
+                        self.get(name, {'limit': limit}, kwargs=kwargs)
+                    counts.append(len(queries))
+                self.assertEqual(counts[0], counts[1])
+                self.assertLessEqual(counts[0], 3)
+
+    def test_stdlib_json_fallback(self):
+        with mock.patch('posts.api.orjson', None):
+            data = self.get('post', kwargs={'post_id': self.post.pk}).json()
+        self.assertEqual(data['author'], 'Author1')
+        self.assertIsInstance(data['pub_date'], str)
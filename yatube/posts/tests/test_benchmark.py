@@ -0,0 +1,86 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from posts import benchmark, feed_cache
+from posts.models import Comment, Follow, Group, Post, User
+
+
+class BenchmarkTests(TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='Reader')
+        cls.author = User.objects.create_user(username='Author1')
+        cls.stranger = User.objects.create_user(username='Stranger')
+        cls.group = Group.objects.create(title='Test group', slug='test-slug')
+        cls.post = Post.objects.create(
+            text='Test post text', author=cls.author, group=cls.group
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(os.rmdir, directory)
+        self.path = os.path.join(directory, 'baseline.json')
+        self.addCleanup(
+            lambda: os.path.exists(self.path) and os.remove(self.path)
+        )
+
+    def benchmark(self, **options):
+        out = StringIO()
+        call_command(
+            'benchmark_posts', requests=3, concurrency=1, warmup=0,
+            stdout=out, **options
+        )
+        return out.getvalue()
+
+    # проверяем замер всех маршрутов и сохранение базиса без изменения данных
+    def test_saves_baseline_without_side_effects(self):
+        scopes = [
+            feed_cache.POSTS,
+            feed_cache.comments_scope(self.post.pk),
+            feed_cache.follow_scope(self.reader.pk),
+            feed_cache.followers_scope(self.author.pk),
+        ]
+        generations = feed_cache.generations(scopes)
+        out = self.benchmark(save=self.path)
+        with open(self.path, encoding='utf-8') as file:
+            routes = json.load(file)['routes']
+        self.assertEqual(set(routes), {
+            'index', 'group_list', 'profile', 'post_detail', 'follow_index',
+            'post_create', 'add_comment', 'profile_follow',
+            'profile_unfollow',
+        })
+        for name, result in routes.items():
+            with self.subTest(route=name):
+                self.assertIn(name, out)
+                self.assertEqual(result['requests'], 3)
+                self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+                self.assertGreater(result['queries'], 0)
+        self.assertEqual(Post.objects.count(), 1)
+        self.assertFalse(Comment.objects.exists())
+        self.assertEqual(Follow.objects.count(), 1)
+        self.assertEqual(feed_cache.generations(scopes), generations)
+
+    # проверяем, что рост задержки и числа запросов считается регрессией
+    def test_regression_fails(self):
+        self.benchmark(save=self.path, route=['index'])
+        with open(self.path, encoding='utf-8') as file:
+            data = json.load(file)
+        data['routes']['index'].update(p95_ms=0.001, queries=0)
+        with open(self.path, 'w', encoding='utf-8') as file:
+            json.dump(data, file)
+        with self.assertRaisesMessage(CommandError, 'index: p95'):
+            self.benchmark(baseline=self.path, route=['index'])
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(benchmark.percentile(values, 0.5), 50)
+        self.assertEqual(benchmark.percentile(values, 0.99), 99)
+        self.assertEqual(benchmark.percentile([7], 0.95), 7)
@@ -0,0 +1,87 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.test import TestCase
+from django.urls import reverse
+
+from posts import cards
+from posts.models import Group, Post, User
+
+
+class PostCardCacheTests(TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.user = User.objects.create_user(
+            username='Author1', first_name='Иван', last_name='Петров'
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание'
+        )
+        self.post = Post.objects.create(
+            text='Текст карточки', author=self.user, group=self.group
+        )
+
+    def get(self, name, **kwargs):
+        return self.client.get(reverse(name, kwargs=kwargs))
+
+    def rendered(self):
+        return mock.patch(
+            'posts.cards.render_to_string', wraps=render_to_string
+        )
+
+    # карточка, собранная для одной ленты, используется во всех
+    def test_card_shared_across_feeds(self):
+        with self.rendered() as render:
+            self.get('posts:index')
+        self.assertEqual(render.call_count, 1)
+        with self.rendered() as render:
+            group_page = self.get('posts:group_list', slug=self.group.slug)
+            profile_page = self.get(
+                'posts:profile', username=self.user.username
+            )
+        render.assert_not_called()
+        for response in (group_page, profile_page):
+            self.assertContains(response, 'Текст карточки')
+
+    def test_one_cache_read_per_page(self):
+        Post.objects.create(text='Второй', author=self.user)
+        self.get('posts:index')
+        cache.clear()
+        with mock.patch.object(
+            cards.cache, 'get_many', wraps=cards.cache.get_many
+        ) as get_many:
+            cards.render(Post.objects.for_feed())
+        get_many.assert_called_once()
+        self.assertEqual(len(get_many.call_args[0][0]), 2)
+
+    def test_edit_renders_new_card(self):
+        self.get('posts:index')
+        self.post.text = 'Новый текст'
+        self.post.save()
+        response = self.get('posts:group_list', slug=self.group.slug)
+        self.assertContains(response, 'Новый текст')
+        self.assertNotContains(response, 'Текст карточки')
+
+    @mock.patch('django.db.transaction.on_commit', lambda func: func())
+    def test_author_rename_expires_cards(self):
+        self.get('posts:index')
+        author = User.objects.get(pk=self.user.pk)
+        author.first_name = 'Пётр'
+        author.save()
+        self.assertContains(self.get('posts:index'), 'Пётр Петров')
+
+    @mock.patch('django.db.transaction.on_commit', lambda func: func())
+    def test_group_changes_expire_cards(self):
+        self.get('posts:index')
+        self.group.slug = 'renamed'
+        self.group.save()
+        self.assertContains(self.get('posts:index'), '/group/renamed/')
+        self.group.delete()
+        response = self.get('posts:index')
+        self.assertNotContains(response, '/group/renamed/')
+        self.assertContains(response, 'Текст карточки')
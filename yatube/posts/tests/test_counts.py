@@ -0,0 +1,127 @@
+import time
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from posts import counts
+from posts.counters import recount_all
+from posts.models import Group, Post, RowCount, User
+from posts.views import FIRST_TEN_POSTS
+
+
+def stored(scope):
+    return RowCount.objects.get(key=scope).value
+
+
+class RowCountTests(TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Author1')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание'
+        )
+        cls.other = Group.objects.create(
+            title='Другая', slug='other', description='Описание'
+        )
+
+    # сигналы поддерживают число постов всего и по группам
+    def test_signals_keep_counts(self):
+        post = Post.objects.create(
+            text='Пост', author=self.user, group=self.group
+        )
+        Post.objects.create(text='Без группы', author=self.user)
+        self.assertEqual(stored(counts.POSTS), 2)
+        self.assertEqual(stored(counts.group_scope(self.group.pk)), 1)
+        post.group = self.other
+        post.save()
+        self.assertEqual(stored(counts.group_scope(self.group.pk)), 0)
+        self.assertEqual(stored(counts.group_scope(self.other.pk)), 1)
+        post.delete()
+        self.assertEqual(stored(counts.POSTS), 1)
+        self.assertEqual(stored(counts.group_scope(self.other.pk)), 0)
+
+    # recount_all чинит разошедшиеся числа
+    def test_recount_repairs(self):
+        Post.objects.create(text='Пост', author=self.user, group=self.group)
+        RowCount.objects.filter(key=counts.POSTS).update(value=100)
+        RowCount.objects.filter(
+            key=counts.group_scope(self.group.pk)
+        ).delete()
+        recount_all()
+        self.assertEqual(stored(counts.POSTS), 1)
+        self.assertEqual(stored(counts.group_scope(self.group.pk)), 1)
+
+    @override_settings(POSTS_COUNT_STRATEGY='table')
+    def test_table_estimate(self):
+        Post.objects.create(text='Пост', author=self.user, group=self.group)
+        self.assertEqual(
+            counts.estimate(counts.group_scope(self.group.pk)),
+            counts.Estimate(1, True),
+        )
+
+    # кэш отдаёт старое число и пересчитывает его в фоне
+    @override_settings(
+        POSTS_COUNT_STRATEGY='cached', POSTS_COUNT_CACHE_MAX_AGE=60
+    )
+    def test_cached_estimate(self):
+        cache.clear()
+        strategy = counts.get_strategy()
+        Post.objects.create(text='Пост', author=self.user)
+        self.assertEqual(
+            counts.estimate(counts.POSTS), counts.Estimate(1, True)
+        )
+        Post.objects.create(text='Ещё пост', author=self.user)
+        self.assertEqual(counts.estimate(counts.POSTS).value, 1)
+        cache.set(
+            counts.CACHE_KEY.format(counts.POSTS), (1, time.time() - 120),
+            None,
+        )
+        with mock.patch.object(
+            strategy, 'refresh_later', side_effect=strategy.refresh
+        ) as refresh_later:
+            self.assertEqual(counts.estimate(counts.POSTS).value, 1)
+        refresh_later.assert_called_once_with(counts.POSTS)
+        self.assertEqual(
+            counts.estimate(counts.POSTS), counts.Estimate(2, False)
+        )
+
+
+class ElidedPaginatorTests(TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Author1')
+        Post.objects.bulk_create(
+            Post(text=f'Пост {i}', author=cls.user)
+            for i in range(FIRST_TEN_POSTS * 6 + 1)
+        )
+        # bulk_create обходит сигналы.
+        recount_all()
+
+    def setUp(self):
+        cache.clear()
+
+    # первые страницы по номеру, соседние по курсору, пропуск между ними
+    def test_page_range(self):
+        response = self.client.get(reverse('posts:index'), {'page': 6})
+        page = response.context['page_obj']
+        self.assertEqual(page.last_number, 7)
+        self.assertContains(response, 'Страниц: 7')
+        self.assertContains(response, '?page=3"')
+        self.assertNotContains(response, '?page=5"')
+        self.assertNotContains(response, '?page=7"')
+        self.assertContains(response, f'?cursor={page.previous_cursor}">5<')
+        self.assertContains(response, f'?cursor={page.next_cursor}">7<')
+        self.assertContains(response, '…')
+
+    def test_profile_total_from_stats(self):
+        response = self.client.get(
+            reverse('posts:profile', kwargs={'username': self.user.username})
+        )
+        page = response.context['page_obj']
+        self.assertEqual(page.total, counts.Estimate(61, True))
+        self.assertContains(response, f'?cursor={page.next_cursor}">2<')
+        self.assertContains(response, '?page=3"')
@@ -0,0 +1,94 @@
+import csv
+import json
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts import export
+from posts.models import Comment, Group, Post, User
+
+
+class ExportTests(TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Author1')
+        cls.reader = User.objects.create_user(username='Reader')
+        cls.group = Group.objects.create(
+            title='Test group', slug='test-slug', description='Описание'
+        )
+        cls.posts = [
+            Post.objects.create(
+                text=f'Пост {number}', author=cls.author,
+                group=cls.group if number % 2 else None,
+            )
+            for number in range(5)
+        ]
+        Post.objects.create(text='Чужой пост', author=cls.reader)
+        for post in cls.posts[1::2]:
+            Comment.objects.create(
+                post=post, author=cls.reader, text=f'К посту {post.pk}'
+            )
+
+    def get(self, user, **params):
+        self.client.force_login(user)
+        return self.client.get(
+            reverse('posts:profile_export', kwargs={'username': 'Author1'}),
+            params,
+        )
+
+    def test_jsonl_with_comments(self):
+        response = self.get(self.author, comments='1')
+        self.assertTrue(response.streaming)
+        self.assertIn('Author1.jsonl', response['Content-Disposition'])
+        records = [
+            json.loads(line) for line in
+            b''.join(response.streaming_content).decode().splitlines()
+        ]
+        self.assertEqual(
+            [record['id'] for record in records],
+            [post.pk for post in self.posts],
+        )
+        self.assertEqual(records[1]['group'], 'test-slug')
+        self.assertEqual(records[0]['comments'], [])
+        self.assertEqual(
+            [comment['text'] for comment in records[3]['comments']],
+            [f'К посту {self.posts[3].pk}'],
+        )
+        self.assertNotIn('image', records[0])
+
+    def test_csv(self):
+        response = self.get(self.author, format='csv', comments='1')
+        self.assertEqual(response['Content-Type'], export.FORMATS['csv'])
+        rows = list(csv.reader(
+            b''.join(response.streaming_content).decode().splitlines()
+        ))
+        self.assertEqual(tuple(rows[0]), export.CSV_COLUMNS)
+        self.assertEqual(
+            [row[0] for row in rows[1:]].count('comment'), 2
+        )
+
+    def test_only_author_or_staff(self):
+        response = self.get(self.reader)
+        self.assertRedirects(
+            response,
+            reverse('posts:profile', kwargs={'username': 'Author1'}),
+        )
+        self.reader.is_staff = True
+        self.reader.save()
+        self.assertEqual(self.get(self.reader).status_code, 200)
+
+    # число запросов не зависит от числа постов и комментариев
+    def test_constant_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            list(export.stream(self.author, comments=True, images=True))
+        self.assertEqual(len(queries), 2)
+
+    def test_command(self):
+        out = StringIO()
+        call_command('export_posts', 'Author1', format='csv', stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 6)
@@ -1,5 +1,6 @@
 import shutil
 import tempfile
+from io import BytesIO
 
 from django.test import TestCase, Client, override_settings
 from posts.models import Post, Group
@@ -7,6 +8,7 @@ from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.urls import reverse
+from PIL import Image
 
 User = get_user_model()
 
@@ -108,3 +110,61 @@ class PostCreatFormTests(TestCase):
             Post.objects.get(id=self.post.pk).text,
             form_data['text']
         )
+
+
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT,
+    POST_IMAGE_MAX_SIZE=500,
+    POST_IMAGE_FORMAT='JPEG',
+)
+class PostImageIngestTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='Author1')
+        self.client.force_login(self.user)
+
+    def upload(self, content, name='photo.jpg'):
+        return self.client.post(
+            reverse('posts:post_create'),
+            data={
+                'text': 'Пост с фото',
+                'image': SimpleUploadedFile(name, content, 'image/jpeg'),
+            },
+        )
+
+    @staticmethod
+    def jpeg(size, orientation=None):
+        image = Image.new('RGB', size, (200, 30, 30))
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera'
+        if orientation:
+            exif[0x0112] = orientation
+        buffer = BytesIO()
+        image.save(buffer, 'JPEG', exif=exif.tobytes())
+        return buffer.getvalue()
+
+    # большая картинка уменьшается, поворачивается по EXIF и теряет EXIF
+    def test_master_copy(self):
+        self.upload(self.jpeg((3000, 1000), orientation=6))
+        post = Post.objects.get(author=self.user)
+        self.assertTrue(post.image.name.endswith('.jpg'))
+        with Image.open(post.image.path) as stored:
+            self.assertEqual(stored.size, (167, 500))
+            self.assertEqual(len(stored.getexif()), 0)
+
+    @override_settings(POST_IMAGE_MAX_PIXELS=10_000)
+    def test_too_many_pixels(self):
+        response = self.upload(self.jpeg((200, 200)))
+        self.assertFormError(
+            response, 'form', 'image', 'Картинка слишком большая: 200×200.'
+        )
+        self.assertFalse(Post.objects.exists())
+
+    def test_not_an_image(self):
+        response = self.upload(b'not an image')
+        self.assertEqual(len(response.context['form'].errors['image']), 1)
+        self.assertFalse(Post.objects.exists())
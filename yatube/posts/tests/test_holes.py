@@ -0,0 +1,90 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from posts import cards
+from posts.models import Follow, Post, User
+
+
+class HolePunchingTests(TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Author1')
+        cls.reader = User.objects.create_user(username='Reader1')
+        cls.post = Post.objects.create(text='Общий текст', author=cls.author)
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def rendered_cards(self):
+        return mock.patch('posts.cards.render', wraps=cards.render)
+
+    # тело профиля рендерится один раз, кнопка — для каждого читателя
+    def test_profile_body_shared(self):
+        url = reverse('posts:profile', kwargs={'username': 'Author1'})
+        with self.rendered_cards() as render:
+            anonymous = self.client.get(url)
+            reader = self.reader_client.get(url)
+            author = self.author_client.get(url)
+        self.assertEqual(render.call_count, 1)
+        self.assertContains(anonymous, 'Подписаться')
+        self.assertContains(reader, 'Отписаться')
+        self.assertContains(author, 'Подписаться')
+        for response in (anonymous, reader, author):
+            self.assertContains(response, 'Общий текст')
+            self.assertNotContains(response, '<!--hole:')
+
+    def test_post_detail_fragments(self):
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        edit_url = reverse('posts:post_edit', kwargs={'post_id': self.post.pk})
+        anonymous = self.client.get(url)
+        reader = self.reader_client.get(url)
+        author = self.author_client.get(url)
+        self.assertNotContains(anonymous, 'id="comment-form"')
+        self.assertNotContains(anonymous, edit_url)
+        self.assertContains(reader, 'id="comment-form"')
+        self.assertContains(reader, 'csrfmiddlewaretoken')
+        self.assertNotContains(reader, edit_url)
+        self.assertContains(author, edit_url)
+
+    # ответ на комментарий не заводит отдельную копию тела страницы
+    def test_reply_to_shares_body(self):
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        responses = [
+            self.reader_client.get(url, {'reply_to': reply_to})
+            for reply_to in (1, 2)
+        ]
+        self.assertEqual(
+            responses[0].context['feed_cache_key'],
+            responses[1].context['feed_cache_key'],
+        )
+        self.assertContains(responses[0], 'href="#comment-1"')
+        self.assertContains(responses[1], 'href="#comment-2"')
+
+    def test_switcher_for_authenticated(self):
+        url = reverse('posts:index')
+        self.assertNotContains(self.client.get(url), 'Избранные авторы')
+        self.assertContains(self.reader_client.get(url), 'Избранные авторы')
+
+    # метку нельзя подсунуть текстом поста
+    def test_marker_in_text_is_escaped(self):
+        post = Post.objects.create(
+            text=f'<!--hole:edit_link:{self.post.pk}:{self.author.pk}-->',
+            author=self.reader,
+        )
+        response = self.author_client.get(
+            reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        )
+        self.assertNotContains(
+            response,
+            reverse('posts:post_edit', kwargs={'post_id': self.post.pk}),
+        )
+        self.assertContains(response, '&lt;!--hole:edit_link')
@@ -1,5 +1,19 @@
-from django.test import TestCase
-from posts.models import Post, Group
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from core.models import StoredFile
+from posts.models import Post, Group, Comment, Follow, UserStats
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
@@ -24,3 +38,181 @@ class PostModelTest(TestCase):
         """Проверяем, что у моделей корректно работает __str__."""
         self.assertEqual(self.post.text[:15], str(self.post))
         self.assertEqual(self.group.title, str(self.group))
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+
+    def stats(self, user):
+        return UserStats.objects.get(user=user)
+
+    def test_counters_follow_changes(self):
+        """Счётчики меняются вместе с постами, комментариями и подписками."""
+        post = Post.objects.create(author=self.author, text='Пост')
+        Comment.objects.create(post=post, author=self.reader, text='Да')
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        post.refresh_from_db()
+        self.assertEqual(self.stats(self.author).posts_count, 1)
+        self.assertEqual(self.stats(self.author).followers_count, 1)
+        self.assertEqual(self.stats(self.reader).following_count, 1)
+        self.assertEqual(post.comment_count, 1)
+
+        follow.delete()
+        post.delete()
+        self.assertEqual(self.stats(self.author).posts_count, 0)
+        self.assertEqual(self.stats(self.author).followers_count, 0)
+        self.assertEqual(self.stats(self.reader).following_count, 0)
+
+    def test_recount_counters_repairs_drift(self):
+        """Команда recount_counters исправляет разошедшиеся счётчики."""
+        post = Post.objects.create(author=self.author, text='Пост')
+        Comment.objects.create(post=post, author=self.reader, text='Да')
+        UserStats.objects.filter(user=self.author).update(posts_count=42)
+        UserStats.objects.filter(user=self.reader).delete()
+        Post.objects.filter(pk=post.pk).update(comment_count=0)
+
+        call_command('recount_counters', stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual(self.stats(self.author).posts_count, 1)
+        self.assertEqual(self.stats(self.reader).posts_count, 0)
+        self.assertEqual(post.comment_count, 1)
+
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_PIPELINE_WORKERS=0)
+class ContentAddressedImagesTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='auth')
+        self.storage = Post._meta.get_field('image').storage
+
+    def create(self, content=b'GIF89a-first'):
+        return Post.objects.create(
+            author=self.user,
+            text='Пост',
+            image=SimpleUploadedFile('small.gif', content, 'image/gif'),
+        )
+
+    # одинаковые загрузки хранятся один раз в каталогах по хешу
+    def test_deduplicated_and_sharded(self):
+        first, second = self.create(), self.create()
+        digest = hashlib.sha256(b'GIF89a-first').hexdigest()
+        self.assertEqual(
+            first.image.name,
+            f'posts/{digest[:2]}/{digest[2:4]}/{digest}.gif',
+        )
+        self.assertEqual(second.image.name, first.image.name)
+        self.assertTrue(self.storage.is_hashed(first.image.name))
+        self.assertEqual(
+            StoredFile.objects.get(name=first.image.name).refs, 2
+        )
+
+    @mock.patch('core.storage.transaction.on_commit', lambda func: func())
+    def test_file_removed_with_last_reference(self):
+        first, second = self.create(), self.create()
+        name = first.image.name
+        first.delete()
+        self.assertTrue(self.storage.exists(name))
+        second.image = SimpleUploadedFile('new.gif', b'GIF89a-second')
+        second.save()
+        self.assertFalse(self.storage.exists(name))
+        self.assertFalse(StoredFile.objects.filter(name=name).exists())
+        self.assertEqual(
+            StoredFile.objects.get(name=second.image.name).refs, 1
+        )
+
+    def test_upload_of_existing_file_refreshes_mtime(self):
+        name = self.create().image.name
+        os.utime(self.storage.path(name), (0, 0))
+        self.create()
+        self.assertGreater(os.path.getmtime(self.storage.path(name)), 0)
+
+    def test_file_uploaded_again_before_removal_is_kept(self):
+        name = self.create().image.name
+        with mock.patch('core.storage.transaction.on_commit') as on_commit:
+            Post.objects.get().delete()
+        [remove], _ = on_commit.call_args
+        os.utime(self.storage.path(name), (0, 0))
+        # Загрузка того же файла, чья ссылка ещё не зафиксирована.
+        self.storage.save('posts/again.gif', ContentFile(b'GIF89a-first'))
+        remove()
+        self.assertTrue(self.storage.exists(name))
+        os.utime(self.storage.path(name), (0, 0))
+        remove()
+        self.assertFalse(self.storage.exists(name))
+
+    def test_migrate_media(self):
+        post = Post.objects.create(author=self.user, text='Старый пост')
+        legacy = default_storage.save('posts/legacy.gif', ContentFile(b'old'))
+        Post.objects.filter(pk=post.pk).update(image=legacy)
+        out = StringIO()
+        call_command('migrate_media', workers=2, stdout=out)
+        post.refresh_from_db()
+        self.assertTrue(self.storage.is_hashed(post.image.name))
+        self.assertFalse(default_storage.exists(legacy))
+        self.assertEqual(post.image.read(), b'old')
+        self.assertEqual(
+            StoredFile.objects.get(name=post.image.name).refs, 1
+        )
+        self.assertIn('Перенесено: 1', out.getvalue())
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class GcMediaTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+        self.storage = Post._meta.get_field('image').storage
+        self.post = Post.objects.create(
+            author=User.objects.create_user(username='auth'),
+            text='Пост',
+            image=SimpleUploadedFile('kept.gif', b'GIF89a-kept'),
+        )
+        self.orphan = self.stale(
+            self.storage.save('posts/orphan.gif', ContentFile(b'orphan'))
+        )
+        self.thumbnail = self.stale(
+            default_storage.save('cache/ab/cd/thumb.jpg', ContentFile(b'x'))
+        )
+        self.fresh = default_storage.save(
+            'posts/fresh.gif', ContentFile(b'fresh')
+        )
+        self.stale(self.post.image.name)
+
+    def stale(self, name):
+        old = time.time() - 2 * 60 * 60
+        os.utime(self.storage.path(name), (old, old))
+        return name
+
+    def gc(self, **options):
+        out = StringIO()
+        call_command('gc_media', stdout=out, **options)
+        return out.getvalue()
+
+    def test_dry_run_keeps_files(self):
+        output = self.gc(dry_run=True)
+        self.assertIn('Будет удалено: 2', output)
+        self.assertTrue(self.storage.exists(self.orphan))
+        self.assertTrue(self.storage.exists(self.thumbnail))
+
+    def test_removes_only_old_orphans(self):
+        output = self.gc(partitions=3)
+        self.assertIn('Удалено: 2', output)
+        self.assertFalse(self.storage.exists(self.orphan))
+        self.assertFalse(self.storage.exists(self.thumbnail))
+        self.assertTrue(self.storage.exists(self.fresh))
+        self.assertTrue(self.storage.exists(self.post.image.name))
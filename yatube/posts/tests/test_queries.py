@@ -0,0 +1,120 @@
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+
+from posts.models import Post, Group, Follow, Comment
+
+User = get_user_model()
+
+SMALL_PAGE = 2
+LARGE_PAGE = 10
+
+
+class FeedQueryCountTests(TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='Reader')
+        cls.group = Group.objects.create(
+            title='Test group',
+            slug='test-slug',
+        )
+        cls.authors = [
+            User.objects.create_user(
+                username=f'Author{i}', first_name=f'Name{i}'
+            )
+            for i in range(LARGE_PAGE)
+        ]
+        for author in cls.authors:
+            Follow.objects.create(user=cls.reader, author=author)
+            post = Post.objects.create(
+                text=f'Post from {author.username}',
+                author=author,
+                group=cls.group,
+            )
+            Comment.objects.create(
+                text='Test comment', post=post, author=author
+            )
+        cls.post = post
+        for i in range(LARGE_PAGE - 1):
+            Post.objects.create(
+                text=f'Extra post {i}',
+                author=cls.authors[0],
+                group=cls.group,
+            )
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.reader)
+
+    def count_queries(self, url, page_size):
+        cache.clear()
+        with mock.patch('posts.views.FIRST_TEN_POSTS', page_size):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+        self.assertEqual(len(response.context['page_obj']), page_size)
+        return len(queries)
+
+    # проверяем, что число запросов не зависит от размера страницы
+    def test_feed_queries_do_not_grow_with_page_size(self):
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse(
+                'posts:profile',
+                kwargs={'username': self.authors[0].username}
+            ),
+            reverse('posts:follow_index'),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(
+                    self.count_queries(url, SMALL_PAGE),
+                    self.count_queries(url, LARGE_PAGE),
+                )
+
+    # проверяем, что комментарии не подгружают авторов по одному
+    @mock.patch('django.db.transaction.on_commit', lambda func: func())
+    def test_post_detail_queries_do_not_grow_with_comments(self):
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        with CaptureQueriesContext(connection) as before:
+            self.client.get(url)
+        for author in self.authors:
+            Comment.objects.create(
+                text='One more comment', post=self.post, author=author
+            )
+        with CaptureQueriesContext(connection) as after:
+            response = self.client.get(url)
+        self.assertEqual(response.context['post'].comment_count, 11)
+        self.assertEqual(len(before), len(after))
+
+    # проверяем, что ленты читаются по составным индексам
+    def test_explain_feeds_uses_indexes(self):
+        out = StringIO()
+        call_command('explain_feeds', stdout=out)
+        plans = out.getvalue()
+        for name in (
+            'posts:index',
+            'posts:follow_index',
+            'posts:profile',
+            'posts:post_detail (comments)',
+        ):
+            with self.subTest(name=name):
+                self.assertIn(name, plans)
+        if connection.vendor == 'sqlite':
+            for index in (
+                'post_pub_date_idx',
+                'post_author_pub_date_idx',
+                'post_group_pub_date_idx',
+                'comment_post_created_idx',
+                'comment_thread_path_idx',
+            ):
+                with self.subTest(index=index):
+                    self.assertIn(index, plans)
@@ -0,0 +1,87 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, Client, override_settings
+from django.urls import reverse
+
+from posts import search
+from posts.models import Post
+
+User = get_user_model()
+
+
+class SearchViewTests(TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Author1')
+
+    def setUp(self):
+        self.guest_client = Client()
+        self.cats = Post.objects.create(
+            text='Коты любят спать. Коты любят есть.', author=self.user
+        )
+        self.dogs = Post.objects.create(
+            text='Собаки любят гулять', author=self.user
+        )
+
+    def found(self, query, **params):
+        response = self.guest_client.get(
+            reverse('posts:search'), {'q': query, **params}
+        )
+        return response, list(response.context['page_obj'])
+
+    def check_search(self):
+        _, posts = self.found('коты')
+        self.assertEqual(posts, [self.cats])
+        _, posts = self.found('любят')
+        self.assertEqual(set(posts), {self.cats, self.dogs})
+        _, posts = self.found('любят гулять')
+        self.assertEqual(posts, [self.dogs])
+        _, posts = self.found('жирафы')
+        self.assertEqual(posts, [])
+
+    # проверяем поиск через индекс базы данных
+    def test_search_default_backend(self):
+        self.check_search()
+
+    # проверяем переносимый обратный индекс
+    @override_settings(POSTS_SEARCH_BACKEND='python')
+    def test_search_python_backend(self):
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.check_search()
+
+    # проверяем, что индекс следит за изменением и удалением постов
+    def test_index_follows_changes(self):
+        self.cats.text = 'Теперь про попугаев'
+        self.cats.save()
+        self.assertEqual(self.found('коты')[1], [])
+        self.assertEqual(self.found('попугаев')[1], [self.cats])
+        self.cats.delete()
+        self.assertEqual(self.found('попугаев')[1], [])
+
+    # проверяем ранжирование и постраничный вывод результатов
+    def test_ranked_and_paginated(self):
+        for i in range(10):
+            Post.objects.create(text=f'Коты номер {i}', author=self.user)
+        response, posts = self.found('коты')
+        self.assertEqual(posts[0], self.cats)
+        self.assertEqual(len(posts), 10)
+        next_cursor = response.context['page_obj'].next_cursor
+        self.assertContains(response, 'q=%D0%BA%D0%BE%D1%82%D1%8B')
+        _, rest = self.found('коты', cursor=next_cursor)
+        self.assertEqual(len(rest), 1)
+        self.assertFalse(set(posts) & set(rest))
+
+    def test_empty_query(self):
+        response = self.guest_client.get(reverse('posts:search'))
+        self.assertIsNone(response.context['page_obj'])
+
+    def test_backend_matches_database(self):
+        backend = search.get_backend()
+        if connection.vendor == 'sqlite':
+            self.assertIsInstance(backend, search.SQLiteFTSBackend)
+        elif connection.vendor == 'postgresql':
+            self.assertIsInstance(backend, search.PostgresBackend)
@@ -0,0 +1,81 @@
+import shutil
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db.models import Count, F
+from django.test import TestCase, override_settings
+
+from core.models import StoredFile
+from posts.counters import recount_all
+from posts.models import Comment, Follow, Group, Post, TimelineEntry, User
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class SeedCommandTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def seed(self, prefix, seed=1):
+        out = StringIO()
+        call_command(
+            'seed_yatube',
+            users=30,
+            groups=3,
+            posts_per_user=4,
+            follows_per_user=5,
+            comments_per_post=2,
+            image_ratio=0.2,
+            seed=seed,
+            prefix=prefix,
+            chunk_size=50,
+            stdout=out,
+        )
+        return out.getvalue()
+
+    def test_creates_consistent_data(self):
+        out = self.seed('first')
+        self.assertIn('строк/с', out)
+        self.assertEqual(User.objects.count(), 30)
+        self.assertEqual(Group.objects.count(), 3)
+        self.assertTrue(Post.objects.exists())
+        self.assertTrue(Post.objects.exclude(image='').exists())
+        self.assertTrue(Follow.objects.exists())
+        self.assertFalse(Follow.objects.filter(user=F('author')).exists())
+        self.assertTrue(Comment.objects.exists())
+        self.assertTrue(TimelineEntry.objects.exists())
+        self.assertFalse(Post.objects.filter(fanout=False).exists())
+        images = Post.objects.exclude(image='').values('image').annotate(
+            refs=Count('pk')
+        ).order_by()
+        self.assertEqual(
+            {row['image']: row['refs'] for row in images},
+            dict(StoredFile.objects.values_list('name', 'refs')),
+        )
+        # Сигналы не срабатывали, но счётчики уже пересчитаны.
+        self.assertFalse(any(recount_all().values()))
+
+    def test_same_seed_same_data(self):
+        self.seed('first', seed=7)
+        self.seed('second', seed=7)
+        first, second = (
+            list(Post.objects.filter(
+                author__username__startswith=f'{prefix}_'
+            ).order_by('pk').values_list('text', 'pub_date'))
+            for prefix in ('first', 'second')
+        )
+        self.assertEqual(len(first), len(second))
+        self.assertEqual(
+            [text for text, _ in first], [text for text, _ in second]
+        )
+
+    def test_prefix_must_be_new(self):
+        self.seed('first')
+        with self.assertRaises(CommandError):
+            self.seed('first')
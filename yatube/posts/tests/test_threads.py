@@ -0,0 +1,173 @@
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts import threads
+from posts.counters import recount_all
+from posts.models import Comment, Post, User
+
+
+class ThreadTests(TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Author1')
+        cls.post = Post.objects.create(text='Пост', author=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+        self.root = Comment.objects.create(
+            post=self.post, author=self.user, text='Корень'
+        )
+
+    def reply(self, parent, text='Ответ'):
+        self.client.post(
+            reverse('posts:add_comment', kwargs={'post_id': self.post.pk}),
+            {'text': text, 'parent': parent.pk},
+        )
+        return Comment.objects.order_by('-pk').first()
+
+    def detail(self, **params):
+        return self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+            params,
+        )
+
+    # ответы хранят путь и выводятся сразу под родителем
+    def test_paths_and_display_order(self):
+        first = self.reply(self.root, 'Первый')
+        self.reply(self.root, 'Второй')
+        nested = self.reply(first, 'Вложенный')
+        self.assertEqual(first.path, threads.segment(first.pk))
+        self.assertEqual(
+            nested.path, f'{first.path}/{threads.segment(nested.pk)}'
+        )
+        self.assertEqual((nested.depth, nested.thread_id), (2, self.root.pk))
+        self.root.refresh_from_db()
+        self.assertEqual(self.root.reply_count, 2)
+        root = self.detail().context['comments'][0]
+        self.assertEqual(
+            [comment.text for comment in root.thread_replies],
+            ['Первый', 'Вложенный', 'Второй'],
+        )
+        self.assertEqual(
+            [comment.pk for comment in threads.subtree(first)], [nested.pk]
+        )
+
+    # под корнем только первые ответы и ссылка на всю ветку
+    @override_settings(COMMENT_REPLIES_PREVIEW=2)
+    def test_replies_preview(self):
+        first = self.reply(self.root, 'Первый')
+        self.reply(first, 'Вложенный')
+        self.reply(self.root, 'Второй')
+        short = Comment.objects.create(
+            post=self.post, author=self.user, text='Короткая ветка'
+        )
+        self.reply(short, 'Единственный')
+        comments = {
+            root.pk: root for root in self.detail().context['comments']
+        }
+        root = comments[self.root.pk]
+        self.assertEqual(
+            [comment.text for comment in root.thread_replies],
+            ['Первый', 'Вложенный'],
+        )
+        self.assertTrue(root.more_replies)
+        self.assertFalse(comments[short.pk].more_replies)
+        url = reverse('posts:post_comments', kwargs={'post_id': self.post.pk})
+        response = self.detail()
+        self.assertContains(response, f'{url}?parent={self.root.pk}')
+        self.assertNotContains(response, f'{url}?parent={short.pk}')
+        response = self.client.get(url, {'parent': self.root.pk})
+        self.assertEqual(
+            [comment.text for comment in response.context['replies']],
+            ['Первый', 'Вложенный', 'Второй'],
+        )
+
+    # граница превью считается по корням, ответы читаются диапазоном
+    @override_settings(COMMENT_REPLIES_PREVIEW=1)
+    def test_replies_read_by_range(self):
+        self.reply(self.root, 'Первый')
+        self.reply(self.root, 'Второй')
+        roots = threads.with_preview(Comment.objects.filter(pk=self.root.pk))
+        with CaptureQueriesContext(connection) as queries:
+            roots = threads.replies(roots)
+        self.assertEqual(
+            [comment.text for comment in roots[0].thread_replies], ['Первый']
+        )
+        self.assertTrue(roots[0].more_replies)
+        found = queries.captured_queries[-1]['sql']
+        self.assertEqual(found.count('SELECT'), 1)
+        self.assertIn('"path" <', found)
+
+    @override_settings(COMMENT_MAX_DEPTH=1, COMMENT_MAX_REPLIES=1)
+    def test_limits(self):
+        child = self.reply(self.root)
+        self.assertEqual(self.reply(child), child)
+        self.assertEqual(self.reply(self.root), child)
+        self.assertEqual(Comment.objects.count(), 2)
+
+    # отклонённый ответ не пропадает молча: причина видна у формы
+    @override_settings(COMMENT_MAX_DEPTH=1)
+    def test_rejected_reply_shows_error(self):
+        child = self.reply(self.root)
+        # Первый ответ ставит CSRF-cookie, от которой зависит ETag.
+        self.detail()
+        etag = self.detail()['ETag']
+        self.client.post(
+            reverse('posts:add_comment', kwargs={'post_id': self.post.pk}),
+            {'text': 'Слишком глубоко', 'parent': child.pk},
+        )
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        # Страница не изменилась, но с уведомлением 304 не отдаётся.
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Слишком глубокая ветка ответов.')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_max_depth_fits_path(self):
+        with override_settings(COMMENT_MAX_DEPTH=8):
+            self.assertEqual(threads.max_depth(), 8)
+        with override_settings(COMMENT_MAX_DEPTH=9):
+            with self.assertRaises(ImproperlyConfigured):
+                threads.max_depth()
+
+    def test_delete_releases_and_cascades(self):
+        child = self.reply(self.root)
+        self.reply(child)
+        Comment.objects.filter(pk=child.pk).delete()
+        self.root.refresh_from_db()
+        self.assertEqual(self.root.reply_count, 0)
+        self.reply(self.root)
+        self.root.delete()
+        self.assertFalse(Comment.objects.exists())
+
+    # число запросов не зависит от числа и глубины ответов
+    def test_constant_queries(self):
+        with CaptureQueriesContext(connection) as before:
+            self.detail()
+        parent = self.root
+        for _ in range(threads.MAX_DEPTH):
+            parent = self.reply(parent)
+        cache.clear()
+        with CaptureQueriesContext(connection) as after:
+            self.detail()
+        self.assertEqual(len(before), len(after))
+
+    def test_subtree_fragment_and_recount(self):
+        child = self.reply(self.root)
+        nested = self.reply(child)
+        response = self.client.get(
+            reverse('posts:post_comments', kwargs={'post_id': self.post.pk}),
+            {'parent': child.pk},
+        )
+        self.assertEqual(
+            [comment.pk for comment in response.context['replies']],
+            [nested.pk],
+        )
+        Comment.objects.update(reply_count=0)
+        self.assertEqual(recount_all()['reply_count'], 2)
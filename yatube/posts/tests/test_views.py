@@ -1,16 +1,22 @@
 import shutil
 import tempfile
+import threading
+from concurrent.futures import Future
+from io import StringIO
+from unittest import mock
 
 from django.test import TestCase, Client, override_settings
-from posts.models import User, Post, Group, Follow, Comment
+from posts.models import User, Post, Group, Follow, Comment, TimelineEntry
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from django import forms
 from django.core.cache import cache
+from django.core.management import call_command
 
-from posts.views import FIRST_TEN_POSTS
+from posts import feed_cache, thumbnails, timeline
+from posts.views import COMMENTS_PER_PAGE, FIRST_TEN_POSTS
 
 User = get_user_model()
 
@@ -302,12 +308,66 @@ class PostsPagesTests(TestCase):
     # тестируем кэш
     def test_index_cash(self):
         response = self.guest_client.get(reverse('posts:index'))
-        Post.objects.get(pk=self.post.pk).delete()
+        Post.objects.filter(pk=self.post.pk).update(text='Changed silently')
         response_cash = self.guest_client.get(reverse('posts:index'))
         cache.clear()
         response_clear = self.guest_client.get(reverse('posts:index'))
         self.assertEqual(response.content, response_cash.content)
-        self.assertNotEqual(response, response_clear)
+        self.assertNotEqual(response.content, response_clear.content)
+
+    # проверяем, что удаление поста сразу сбрасывает кэш ленты
+    @mock.patch('django.db.transaction.on_commit', lambda func: func())
+    def test_index_cache_invalidated_on_delete(self):
+        response = self.guest_client.get(reverse('posts:index'))
+        self.assertContains(response, self.post.text)
+        Post.objects.get(pk=self.post.pk).delete()
+        response = self.guest_client.get(reverse('posts:index'))
+        self.assertNotContains(response, self.post.text)
+
+    # проверяем, что поколение ленты сдвигается только после коммита
+    def test_feed_generation_bumped_on_commit(self):
+        [before] = feed_cache.generations([feed_cache.POSTS])
+        with mock.patch('django.db.transaction.on_commit') as on_commit:
+            Post.objects.create(text='Новый пост', author=self.user)
+        self.assertEqual(feed_cache.generations([feed_cache.POSTS]), [before])
+        for (callback,), _ in on_commit.call_args_list:
+            callback()
+        [after] = feed_cache.generations([feed_cache.POSTS])
+        self.assertGreater(after, before)
+
+    # проверяем, что страницы ленты кэшируются раздельно
+    def test_index_cache_varies_on_page(self):
+        for i in range(FIRST_TEN_POSTS):
+            Post.objects.create(text=f'Filler {i}', author=self.user)
+        first_page = self.guest_client.get(reverse('posts:index'))
+        second_page = self.guest_client.get(
+            reverse('posts:index'),
+            {'cursor': first_page.context['page_obj'].next_cursor}
+        )
+        self.assertContains(second_page, self.post.text)
+        self.assertNotEqual(first_page.content, second_page.content)
+
+    # проверяем, что посторонние параметры не плодят копии фрагмента
+    def test_index_cache_ignores_other_params(self):
+        keys = {
+            self.guest_client.get(
+                reverse('posts:index'), params
+            ).context['feed_cache_key']
+            for params in ({}, {'x': 1}, {'x': 2, 'utm_source': 'mail'})
+        }
+        self.assertEqual(len(keys), 1)
+
+    # проверяем, что ленты подписок не делят кэш между пользователями
+    def test_follow_cache_is_personal(self):
+        Follow.objects.create(
+            user=self.user_for_authorized, author=self.user_for_following
+        )
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertContains(response, self.post_from_following.text)
+        response = self.authorized_client_2.get(
+            reverse('posts:follow_index')
+        )
+        self.assertNotContains(response, self.post_from_following.text)
 
 
 class PaginatorViewsTest(TestCase):
@@ -353,3 +413,364 @@ class PaginatorViewsTest(TestCase):
             with self.subTest(page=page):
                 response = self.guest_client.get(page)
                 self.assertEqual(len(response.context['page_obj']), count_post)
+
+    def test_cursor_navigation(self):
+        first_page = self.guest_client.get(reverse('posts:index'))
+        page_obj = first_page.context['page_obj']
+        self.assertIsNone(page_obj.previous_cursor)
+        self.assertIsNotNone(page_obj.next_cursor)
+
+        second_page = self.guest_client.get(
+            reverse('posts:index'), {'cursor': page_obj.next_cursor}
+        )
+        second_obj = second_page.context['page_obj']
+        self.assertEqual(len(second_obj), POSTS_IN_SECOND_PAGE)
+        self.assertEqual(second_obj.number, 2)
+        self.assertIsNone(second_obj.next_cursor)
+        self.assertFalse(set(page_obj) & set(second_obj))
+
+        back_page = self.guest_client.get(
+            reverse('posts:index'), {'cursor': second_obj.previous_cursor}
+        )
+        back_obj = back_page.context['page_obj']
+        self.assertEqual(list(back_obj), list(page_obj))
+        self.assertIsNone(back_obj.previous_cursor)
+
+    def test_page_number_compatibility(self):
+        response = self.guest_client.get(reverse('posts:index'), {'page': 2})
+        page_obj = response.context['page_obj']
+        by_cursor = self.guest_client.get(
+            reverse('posts:index'),
+            {'cursor': page_obj.previous_cursor},
+        )
+        self.assertEqual(by_cursor.context['page_obj'].number, 1)
+        self.assertEqual(
+            len(by_cursor.context['page_obj']), FIRST_TEN_POSTS
+        )
+
+    # номер страницы за концом ведёт на последнюю страницу по оценке
+    def test_out_of_range_page_number(self):
+        for number in ('99999999999999999999999', '50'):
+            with self.subTest(page=number):
+                response = self.guest_client.get(
+                    reverse('posts:index'), {'page': number}
+                )
+                page_obj = response.context['page_obj']
+                self.assertEqual(page_obj.number, 2)
+                self.assertEqual(len(page_obj), 3)
+                self.assertIsNotNone(page_obj.previous_cursor)
+
+    # без оценки числа страниц — первая страница
+    def test_out_of_range_page_without_estimate(self):
+        reader = User.objects.create_user(username='Reader')
+        Follow.objects.create(user=reader, author=self.user)
+        self.client.force_login(reader)
+        response = self.client.get(
+            reverse('posts:follow_index'),
+            {'page': '99999999999999999999999'},
+        )
+        page_obj = response.context['page_obj']
+        self.assertEqual(page_obj.number, 1)
+        self.assertEqual(len(page_obj), FIRST_TEN_POSTS)
+
+    def test_invalid_cursor_returns_first_page(self):
+        response = self.guest_client.get(
+            reverse('posts:index'), {'cursor': 'not-a-cursor'}
+        )
+        self.assertEqual(response.context['page_obj'].number, 1)
+        self.assertEqual(len(response.context['page_obj']), FIRST_TEN_POSTS)
+
+
+class TimelineTests(TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Author1')
+        cls.follower = User.objects.create_user(username='Follower')
+
+    def setUp(self):
+        self.follower_client = Client()
+        self.follower_client.force_login(self.follower)
+
+    def follow_index_posts(self):
+        response = self.follower_client.get(reverse('posts:follow_index'))
+        return list(response.context['page_obj'])
+
+    # проверяем, что пост раскладывается в ленту подписчика
+    def test_new_post_fanned_out(self):
+        Follow.objects.create(user=self.follower, author=self.author)
+        post = Post.objects.create(text='Fan out', author=self.author)
+        self.assertTrue(Post.objects.get(pk=post.pk).fanout)
+        self.assertTrue(
+            TimelineEntry.objects.filter(
+                user=self.follower, post=post
+            ).exists()
+        )
+        self.assertEqual(self.follow_index_posts(), [post])
+
+    # проверяем заполнение ленты при подписке и очистку при отписке
+    def test_backfill_and_remove(self):
+        post = Post.objects.create(text='Before follow', author=self.author)
+        self.follower_client.get(reverse(
+            'posts:profile_follow', kwargs={'username': self.author.username}
+        ))
+        self.assertEqual(self.follow_index_posts(), [post])
+        self.follower_client.get(reverse(
+            'posts:profile_unfollow',
+            kwargs={'username': self.author.username}
+        ))
+        self.assertFalse(
+            TimelineEntry.objects.filter(user=self.follower).exists()
+        )
+        self.assertEqual(self.follow_index_posts(), [])
+
+    # проверяем, что посты популярных авторов читаются без рассылки
+    @override_settings(TIMELINE_FANOUT_LIMIT=0)
+    def test_celebrity_fan_out_on_read(self):
+        Follow.objects.create(user=self.follower, author=self.author)
+        post = Post.objects.create(text='Celebrity', author=self.author)
+        self.assertFalse(Post.objects.get(pk=post.pk).fanout)
+        self.assertFalse(TimelineEntry.objects.exists())
+        self.assertEqual(self.follow_index_posts(), [post])
+
+    # проверяем слияние ленты с неразосланными постами по страницам
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_merged_pages_in_order(self):
+        celebrity = User.objects.create_user(username='Celebrity')
+        fan = User.objects.create_user(username='Fan')
+        Follow.objects.create(user=self.follower, author=self.author)
+        Follow.objects.create(user=self.follower, author=celebrity)
+        Follow.objects.create(user=fan, author=celebrity)
+        posts = [
+            Post.objects.create(
+                text=f'Post {i}', author=(self.author, celebrity)[i % 2]
+            )
+            for i in range(FIRST_TEN_POSTS + 3)
+        ]
+        self.assertEqual(
+            TimelineEntry.objects.count(), (len(posts) + 1) // 2
+        )
+        expected = sorted(
+            posts, key=lambda post: (post.pub_date, post.pk), reverse=True
+        )
+        first = self.follower_client.get(reverse('posts:follow_index'))
+        page = first.context['page_obj']
+        self.assertEqual(list(page), expected[:FIRST_TEN_POSTS])
+        second = self.follower_client.get(
+            reverse('posts:follow_index'), {'cursor': page.next_cursor}
+        )
+        self.assertEqual(
+            list(second.context['page_obj']), expected[FIRST_TEN_POSTS:]
+        )
+        by_number = self.follower_client.get(
+            reverse('posts:follow_index'), {'page': 2}
+        )
+        self.assertEqual(
+            list(by_number.context['page_obj']), expected[FIRST_TEN_POSTS:]
+        )
+
+    # проверяем рассылку постов, созданных в обход сигналов
+    def test_fan_out_pending(self):
+        Follow.objects.create(user=self.follower, author=self.author)
+        Post.objects.bulk_create([Post(text='Bulk', author=self.author)])
+        self.assertEqual(timeline.fan_out_pending(), 1)
+        self.assertEqual(
+            [post.text for post in self.follow_index_posts()], ['Bulk']
+        )
+        self.assertFalse(Post.objects.filter(fanout=False).exists())
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_PIPELINE_WORKERS=0)
+class ThumbnailPipelineTests(TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Author1')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        small_gif = (
+            b'\x47\x49\x46\x38\x39\x61\x02\x00'
+            b'\x01\x00\x80\x00\x00\x00\x00\x00'
+            b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+            b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+            b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+            b'\x0A\x00\x3B'
+        )
+        self.post = Post.objects.create(
+            text='Post with image',
+            author=self.user,
+            image=SimpleUploadedFile(
+                name='pipeline.gif',
+                content=small_gif,
+                content_type='image/gif'
+            ),
+        )
+
+    # проверяем заглушку до появления миниатюры и саму миниатюру после
+    @mock.patch('django.db.transaction.on_commit', lambda func: func())
+    def test_placeholder_until_thumbnail_ready(self):
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, 'data:image/gif;base64')
+        thumbnails.register_variants(
+            thumbnails.render_variants(self.post.image.name)
+        )
+        response = self.client.get(reverse('posts:index'))
+        thumbnail = thumbnails.lookup(self.post.image, 'feed')
+        self.assertIsNotNone(thumbnail)
+        self.assertEqual(list(thumbnail.size), [960, 339])
+        self.assertContains(response, thumbnail.url)
+
+    # миниатюры ставятся в очередь только при смене картинки
+    def test_thumbnails_scheduled_on_image_change(self):
+        with mock.patch.object(thumbnails, 'schedule') as schedule:
+            self.post.text = 'Новый текст'
+            self.post.save()
+            schedule.assert_not_called()
+            self.post.image = SimpleUploadedFile(
+                'other.gif', b'GIF89a-other', 'image/gif'
+            )
+            self.post.save()
+        schedule.assert_called_once_with(self.post.image)
+
+    # проверяем пакетное создание миниатюр в пуле процессов
+    def test_regenerate_thumbnails_command(self):
+        out = StringIO()
+        call_command('regenerate_thumbnails', workers=1, stdout=out)
+        self.assertIn('Картинок: 1, миниатюр: 1', out.getvalue())
+        self.assertIsNotNone(thumbnails.lookup(self.post.image, 'feed'))
+
+    # колбэк пула закрывает соединение своего потока, но не чужого
+    def test_callback_closes_own_connection(self):
+        future = Future()
+        future.set_result([])
+        with mock.patch.object(thumbnails, 'connection') as connection:
+            close = connection.close
+            thumbnails._on_rendered(threading.get_ident(), future)
+            close.assert_not_called()
+            thread = threading.Thread(
+                target=thumbnails._on_rendered, args=(-1, future)
+            )
+            thread.start()
+            thread.join()
+        close.assert_called_once_with()
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Author1')
+        cls.group = Group.objects.create(title='Test group', slug='test-slug')
+        cls.post = Post.objects.create(
+            text='Test post text', author=cls.user, group=cls.group
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user.username}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+        )
+
+    # проверяем ответ 304 без запроса ленты и рендеринга
+    def test_not_modified_without_rendering(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                with self.assertNumQueries(1):
+                    response = self.client.get(
+                        url, HTTP_IF_NONE_MATCH=response['ETag']
+                    )
+                self.assertEqual(response.status_code, 304)
+                self.assertIsNone(response.context)
+
+    def test_if_modified_since(self):
+        response = self.client.get(self.urls[0])
+        response = self.client.get(
+            self.urls[0], HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+        )
+        self.assertEqual(response.status_code, 304)
+
+    # проверяем, что новый пост и новый комментарий меняют ETag
+    @mock.patch('django.db.transaction.on_commit', lambda func: func())
+    def test_changes_invalidate_etag(self):
+        etags = [self.client.get(url)['ETag'] for url in self.urls]
+        Post.objects.create(
+            text='New post', author=self.user, group=self.group
+        )
+        for url, etag in zip(self.urls, etags):
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+        etag = self.client.get(self.urls[3])['ETag']
+        Comment.objects.create(
+            text='Comment', author=self.user, post=self.post
+        )
+        response = self.client.get(self.urls[3], HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_etag_varies_on_page_and_user(self):
+        anonymous = self.client.get(self.urls[0])
+        second_page = self.client.get(self.urls[0], {'page': 2})
+        self.client.force_login(self.user)
+        authorized = self.client.get(self.urls[0])
+        self.assertNotEqual(anonymous['ETag'], second_page['ETag'])
+        self.assertNotEqual(anonymous['ETag'], authorized['ETag'])
+
+    def test_cache_control(self):
+        response = self.client.get(self.urls[0])
+        self.assertIn('public', response['Cache-Control'])
+        self.assertIn('max-age=', response['Cache-Control'])
+        self.client.force_login(self.user)
+        response = self.client.get(self.urls[0])
+        self.assertIn('private', response['Cache-Control'])
+        self.assertIn('no-cache', response['Cache-Control'])
+
+
+class CommentPaginationTests(TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Author1')
+        cls.post = Post.objects.create(text='Пост', author=cls.author)
+        Comment.objects.bulk_create(
+            Comment(post=cls.post, author=cls.author, text=f'Комм {number}')
+            for number in range(COMMENTS_PER_PAGE + 5)
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    # на странице поста первая порция и ссылка на подгрузку остальных
+    def test_post_detail_first_page(self):
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        )
+        comments = response.context['comments']
+        self.assertEqual(len(comments), COMMENTS_PER_PAGE)
+        self.assertContains(response, 'data-comments-more')
+        self.assertIsNotNone(comments.next_cursor)
+
+    def test_fragment_and_json(self):
+        url = reverse('posts:post_comments', kwargs={'post_id': self.post.pk})
+        first = self.client.get(url)
+        cursor = first.context['comments'].next_cursor
+        response = self.client.get(url, {'cursor': cursor})
+        self.assertTemplateUsed(response, 'posts/includes/comments.html')
+        self.assertEqual(len(response.context['comments']), 5)
+        self.assertNotContains(response, 'data-comments-more')
+        seen = [comment.pk for comment in first.context['comments']]
+        seen += [comment.pk for comment in response.context['comments']]
+        self.assertEqual(len(set(seen)), COMMENTS_PER_PAGE + 5)
+        data = self.client.get(url, {'format': 'json'}).json()
+        self.assertEqual(len(data['results']), COMMENTS_PER_PAGE)
+        self.assertEqual(data['results'][0]['author'], 'Author1')
+        self.assertIn('cursor=', data['next'])
@@ -0,0 +1,180 @@
+"""Ветки ответов на комментарии в виде материализованных путей.
+
+Корневой комментарий — обычный комментарий к посту. У ответа есть
+``thread`` (корень ветки), ``depth`` и ``path``: id всех предков ниже
+корня и его собственный, каждый в base36 фиксированной ширины через ``/``.
+Сортировка по ``path`` — это порядок показа (ответы по времени, сразу под
+родителем), поэтому вся ветка или поддерево читаются одним диапазонным
+запросом по индексу ``(thread, path)`` без рекурсии. ``reply_count`` —
+число прямых ответов; проверка лимита и увеличение счётчика делаются
+одним условным ``UPDATE``.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import F, OuterRef, Q, Subquery
+
+from .models import Comment
+
+MAX_DEPTH = 4
+MAX_REPLIES = 100
+REPLIES_PREVIEW = 3
+SEGMENT_WIDTH = 7
+SEPARATOR = '/'
+# Следующий после SEPARATOR символ: верхняя граница диапазона поддерева.
+SEPARATOR_END = chr(ord(SEPARATOR) + 1)
+DIGITS = '0123456789abcdefghijklmnopqrstuvwxyz'
+FIELDS = (
+    'id', 'post', 'text', 'created', 'author', 'author__username',
+    'parent', 'thread', 'path', 'depth', 'reply_count',
+)
+
+
+class ReplyNotAllowed(Exception):
+    pass
+
+
+def max_depth():
+    """``COMMENT_MAX_DEPTH``; путь самого глубокого ответа должен
+    помещаться в ``Comment.path``."""
+    depth = getattr(settings, 'COMMENT_MAX_DEPTH', MAX_DEPTH)
+    length = depth * (SEGMENT_WIDTH + len(SEPARATOR)) - len(SEPARATOR)
+    limit = Comment._meta.get_field('path').max_length
+    if length > limit:
+        raise ImproperlyConfigured(
+            f'COMMENT_MAX_DEPTH={depth}: путь ответа займёт {length} '
+            f'символов, а в Comment.path помещается {limit}.'
+        )
+    return depth
+
+
+def max_replies():
+    return getattr(settings, 'COMMENT_MAX_REPLIES', MAX_REPLIES)
+
+
+def replies_preview():
+    return getattr(settings, 'COMMENT_REPLIES_PREVIEW', REPLIES_PREVIEW)
+
+
+def segment(pk):
+    """Id в base36 фиксированной ширины: строки сортируются как числа."""
+    digits = []
+    while pk:
+        pk, digit = divmod(pk, 36)
+        digits.append(DIGITS[digit])
+    return ''.join(reversed(digits)).rjust(SEGMENT_WIDTH, '0')
+
+
+def reply(comment, parent_id):
+    """Делает ``comment`` ответом на ``parent_id`` до сохранения.
+
+    Место в лимите ответов родителя занимается сразу, поэтому вызывать
+    нужно в одной транзакции с сохранением комментария.
+    """
+    try:
+        parent_id = int(parent_id)
+    except (TypeError, ValueError):
+        raise ReplyNotAllowed('Комментарий для ответа не найден.')
+    parent = Comment.objects.filter(
+        pk=parent_id, post_id=comment.post_id
+    ).only('id', 'thread', 'path', 'depth').first()
+    if parent is None:
+        raise ReplyNotAllowed('Комментарий для ответа не найден.')
+    if parent.depth >= max_depth():
+        raise ReplyNotAllowed('Слишком глубокая ветка ответов.')
+    reserved = Comment.objects.filter(
+        pk=parent.pk, reply_count__lt=max_replies()
+    ).update(reply_count=F('reply_count') + 1)
+    if not reserved:
+        raise ReplyNotAllowed('У комментария слишком много ответов.')
+    comment.parent = parent
+    comment.thread_id = parent.thread_id or parent.pk
+    comment.depth = parent.depth + 1
+    # Полный путь допишет finish(), когда у комментария появится id.
+    comment.path = parent.path
+
+
+def finish(comment):
+    """Дописывает в путь сохранённого ответа его собственный id."""
+    own = segment(comment.pk)
+    comment.path = f'{comment.path}{SEPARATOR}{own}' if comment.path else own
+    Comment.objects.filter(pk=comment.pk).update(path=comment.path)
+
+
+def released(comment):
+    """Ответ удалён: освобождаем место у родителя."""
+    Comment.objects.filter(
+        pk=comment.parent_id, reply_count__gt=0
+    ).update(reply_count=F('reply_count') - 1)
+
+
+def _mark(comments):
+    """Проставляет ``can_reply`` для шаблона."""
+    limit = max_depth()
+    for comment in comments:
+        comment.can_reply = comment.depth < limit
+    return comments
+
+
+def with_preview(roots):
+    """Корни с ``preview_boundary`` — путём первого ответа ветки, который
+    не попадает в превью (``None``, если ответов не больше
+    ``replies_preview()``).
+
+    Подзапрос считается один раз на корень и читает начало ветки по
+    индексу ``(thread, path)``.
+    """
+    limit = replies_preview()
+    return roots.annotate(preview_boundary=Subquery(
+        Comment.objects.filter(thread_id=OuterRef('pk')).order_by(
+            'path'
+        ).values('path')[limit:limit + 1]
+    ))
+
+
+def replies(roots):
+    """Первые ``replies_preview()`` ответов каждой ветки ``roots`` одним
+    запросом, в порядке показа; ``roots`` — из ``with_preview``.
+
+    Каждому корню проставляются ``thread_replies`` и ``more_replies`` —
+    есть ли в ветке ответы сверх показанных; их целиком отдаёт
+    ``subtree``. Ответы каждой ветки читаются диапазоном по пути до
+    границы превью.
+    """
+    roots = _mark(list(roots))
+    by_thread = defaultdict(list)
+    if roots:
+        condition = Q(thread_id__in=[
+            root.pk for root in roots if root.preview_boundary is None
+        ])
+        for root in roots:
+            if root.preview_boundary is not None:
+                condition |= Q(
+                    thread_id=root.pk, path__lt=root.preview_boundary
+                )
+        found = Comment.objects.filter(condition).select_related(
+            'author'
+        ).only(*FIELDS).order_by('thread', 'path')
+        for comment in _mark(found):
+            by_thread[comment.thread_id].append(comment)
+    for root in roots:
+        root.thread_replies = by_thread[root.pk]
+        root.more_replies = root.preview_boundary is not None
+    return roots
+
+
+def subtree(comment):
+    """Ответы ниже ``comment`` одним диапазонным запросом по пути."""
+    queryset = Comment.objects.select_related('author').only(
+        *FIELDS
+    ).order_by('path')
+    if comment.thread_id is None:
+        queryset = queryset.filter(thread_id=comment.pk)
+    else:
+        queryset = queryset.filter(
+            thread_id=comment.thread_id,
+            path__gt=comment.path + SEPARATOR,
+            path__lt=comment.path + SEPARATOR_END,
+        )
+    return _mark(list(queryset))
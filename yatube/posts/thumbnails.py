@@ -0,0 +1,194 @@
+"""Фоновая подготовка миниатюр для картинок постов.
+
+Миниатюры из ``THUMBNAIL_VARIANTS`` создаются сразу после сохранения поста
+в пуле процессов, чтобы декодирование и масштабирование Pillow не
+выполнялись внутри запроса первого читателя. Шаблоны берут готовую
+миниатюру из key-value хранилища sorl-thumbnail и до её появления
+показывают заглушку.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.db import connection, transaction
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import defaults as default_settings
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.images import ImageFile
+
+from . import feed_cache
+
+logger = logging.getLogger(__name__)
+
+VARIANTS = {
+    'feed': ('960x339', {'crop': 'center', 'upscale': True}),
+}
+WORKERS = 2
+
+_executor = None
+_executor_key = None
+
+
+def variants():
+    return getattr(settings, 'THUMBNAIL_VARIANTS', VARIANTS)
+
+
+def workers():
+    return getattr(settings, 'THUMBNAIL_PIPELINE_WORKERS', WORKERS)
+
+
+class PipelineBackend(ThumbnailBackend):
+    """Бэкенд sorl-thumbnail, в котором создание файла отделено от записи
+    в key-value хранилище: файл пишет дочерний процесс без доступа к базе,
+    а регистрирует его родительский процесс."""
+
+    def prepare(self, file_, geometry_string, **options):
+        source = ImageFile(file_)
+        if thumbnail_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(thumbnail_settings, attr)
+            if value != getattr(default_settings, attr):
+                options.setdefault(key, value)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return source, ImageFile(name, default.storage), options
+
+    def lookup(self, file_, geometry_string, **options):
+        """Готовая миниатюра или ``None``, без создания файла."""
+        _, thumbnail, _ = self.prepare(file_, geometry_string, **options)
+        return default.kvstore.get(thumbnail)
+
+    def render(self, file_, geometry_string, **options):
+        """Создаёт файл миниатюры, возвращает имена и размеры."""
+        source, thumbnail, options = self.prepare(
+            file_, geometry_string, **options
+        )
+        if not thumbnail.exists():
+            source_image = default.engine.get_image(source)
+            try:
+                options['image_info'] = default.engine.get_image_info(
+                    source_image
+                )
+                source.set_size(default.engine.get_image_size(source_image))
+                self._create_thumbnail(
+                    source_image, geometry_string, options, thumbnail
+                )
+            finally:
+                default.engine.cleanup(source_image)
+        else:
+            source.set_size()
+            thumbnail.set_size()
+        return source.name, source.size, thumbnail.name, thumbnail.size
+
+    def register(self, source_name, source_size, thumb_name, thumb_size):
+        source_file = source(source_name)
+        source_file.set_size(source_size)
+        thumbnail = ImageFile(thumb_name, default.storage)
+        thumbnail.set_size(thumb_size)
+        default.kvstore.get_or_set(source_file)
+        default.kvstore.set(thumbnail, source_file)
+        return thumbnail
+
+
+backend = PipelineBackend()
+
+
+def source(name):
+    """Картинка поста в хранилище поля ``Post.image``.
+
+    Ключи sorl-thumbnail зависят от хранилища, поэтому и создание, и поиск
+    миниатюр должны видеть исходник в одном и том же хранилище.
+    """
+    # Модуль импортируют дочерние процессы до django.setup().
+    from .models import Post
+
+    return ImageFile(name, Post._meta.get_field('image').storage)
+
+
+def render_variants(name):
+    """Работает в дочернем процессе: создаёт все варианты одной картинки."""
+    rendered = []
+    for geometry, options in variants().values():
+        try:
+            rendered.append(
+                backend.render(source(name), geometry, **options)
+            )
+        except Exception:
+            logger.exception('Не удалось создать миниатюру %s', name)
+    return rendered
+
+
+def register_variants(rendered, invalidate=True):
+    for result in rendered:
+        backend.register(*result)
+    if rendered and invalidate:
+        feed_cache.bump(feed_cache.POSTS)
+
+
+def lookup(image, variant):
+    geometry, options = variants()[variant]
+    return backend.lookup(image, geometry, **options)
+
+
+def _init_worker(settings_module, media_root):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    import django
+    django.setup()
+    settings.MEDIA_ROOT = media_root
+
+
+def make_executor(max_workers):
+    return ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_init_worker,
+        initargs=(settings.SETTINGS_MODULE, settings.MEDIA_ROOT),
+    )
+
+
+def executor():
+    """Общий пул процессов; пересоздаётся, если изменились настройки."""
+    global _executor, _executor_key
+    key = (workers(), settings.MEDIA_ROOT)
+    if _executor is None or _executor_key != key:
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+        _executor = make_executor(workers())
+        _executor_key = key
+    return _executor
+
+
+def _on_rendered(submitter, future):
+    try:
+        register_variants(future.result())
+    except Exception:
+        logger.exception('Не удалось зарегистрировать миниатюры')
+    finally:
+        # Обычно колбэк идёт в служебном потоке пула, и его соединение с
+        # базой само не закроется. Уже готовый future вызывает колбэк сразу
+        # в потоке запроса: его соединение закроет Django.
+        if threading.get_ident() != submitter:
+            connection.close()
+
+
+def schedule(image):
+    """Ставит в очередь создание миниатюр после фиксации транзакции."""
+    if not image:
+        return
+    name = image.name
+
+    def submit():
+        if not workers():
+            register_variants(render_variants(name))
+            return
+        executor().submit(render_variants, name).add_done_callback(
+            partial(_on_rendered, threading.get_ident())
+        )
+    transaction.on_commit(submit)
@@ -0,0 +1,171 @@
+"""Материализованные ленты подписок (fan-out on write).
+
+Новый пост сразу раскладывается в ленты подписчиков автора, и страница
+``/follow/`` читает готовый список вместо соединения Follow и Post.
+Записи ленты хранят ``pub_date`` поста, поэтому страница читается по
+индексу ``(user, -pub_date)`` без сортировки. Посты авторов, у которых
+подписчиков больше ``TIMELINE_FANOUT_LIMIT``, не раскладываются
+(``Post.fanout`` остаётся ``False``); они читаются по индексу
+``(author, -pub_date)`` и сливаются со страницей ленты.
+"""
+from django.conf import settings
+from django.db import transaction
+
+from . import counters
+from .models import Follow, Post, TimelineEntry
+from .utils import CursorPaginator
+
+ORDERING = ('-pub_date', '-pk')
+
+FANOUT_LIMIT = 1000
+BATCH_SIZE = 1000
+
+
+def fanout_limit():
+    return getattr(settings, 'TIMELINE_FANOUT_LIMIT', FANOUT_LIMIT)
+
+
+def _bulk_insert(entries):
+    batch = []
+    for entry in entries:
+        batch.append(entry)
+        if len(batch) >= BATCH_SIZE:
+            TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def fan_out_post(post):
+    """Раскладывает новый пост в ленты подписчиков автора."""
+    if counters.followers_count(post.author_id) > fanout_limit():
+        return
+    followers = Follow.objects.filter(author_id=post.author_id)
+    with transaction.atomic():
+        _bulk_insert(
+            TimelineEntry(
+                user_id=user_id, post_id=post.pk, pub_date=post.pub_date
+            )
+            for user_id in followers.values_list(
+                'user_id', flat=True
+            ).iterator()
+        )
+        Post.objects.filter(pk=post.pk).update(fanout=True)
+    post.fanout = True
+
+
+def backfill(follow):
+    """Добавляет в ленту подписчика уже разосланные посты автора."""
+    posts = Post.objects.filter(author_id=follow.author_id, fanout=True)
+    _bulk_insert(
+        TimelineEntry(
+            user_id=follow.user_id, post_id=post_id, pub_date=pub_date
+        )
+        for post_id, pub_date in posts.values_list(
+            'pk', 'pub_date'
+        ).iterator()
+    )
+
+
+def remove(follow):
+    """Убирает посты автора из ленты отписавшегося пользователя."""
+    TimelineEntry.objects.filter(
+        user_id=follow.user_id, post__author_id=follow.author_id
+    ).delete()
+
+
+def fan_out_pending():
+    """Раскладывает ещё не разосланные посты авторов ниже лимита.
+
+    Нужна после ``bulk_create``, который не шлёт сигналов.
+    """
+    limit = fanout_limit()
+    authors = Post.objects.filter(fanout=False).exclude(
+        author__stats__followers_count__gt=limit
+    ).values_list('author_id', flat=True).distinct().order_by()
+    written = 0
+    for author_id in authors.iterator():
+        posts = list(Post.objects.filter(
+            author_id=author_id, fanout=False
+        ).values_list('pk', 'pub_date'))
+        followers = list(Follow.objects.filter(
+            author_id=author_id
+        ).values_list('user_id', flat=True))
+        with transaction.atomic():
+            _bulk_insert(
+                TimelineEntry(user_id=user_id, post_id=pk, pub_date=pub_date)
+                for pk, pub_date in posts
+                for user_id in followers
+            )
+            Post.objects.filter(
+                author_id=author_id, fanout=False
+            ).update(fanout=True)
+        written += len(posts) * len(followers)
+    return written
+
+
+class TimelinePaginator(CursorPaginator):
+    """Лента подписок по курсору ``(pub_date, id поста)``.
+
+    Страница собирается из двух запросов по индексам, каждый не длиннее
+    страницы: записи ``TimelineEntry`` читателя и неразосланные посты его
+    авторов. Ключи сливаются, и посты грузятся одним запросом по id.
+    """
+
+    def __init__(self, user, per_page, posts=None):
+        self.user = user
+        if posts is None:
+            posts = Post.objects.for_feed()
+        super().__init__(posts, per_page, ORDERING)
+        self.entries = CursorPaginator(
+            TimelineEntry.objects.filter(user=user).values_list(
+                'pub_date', 'post_id'
+            ),
+            per_page,
+            ('-pub_date', '-post_id'),
+        )
+        followed = Follow.objects.filter(user=user).values('author_id')
+        self.pending = CursorPaginator(
+            Post.objects.filter(
+                fanout=False, author_id__in=followed
+            ).values_list('pub_date', 'pk'),
+            per_page,
+            ORDERING,
+        )
+
+    def parts(self, values=None, reverse=False):
+        return [
+            self.entries.page_queryset(values, reverse),
+            self.pending.page_queryset(values, reverse),
+        ]
+
+    def _merge(self, parts, reverse, limit):
+        keys = sorted({key for part in parts for key in part})
+        if not reverse:
+            keys.reverse()
+        keys = keys[:limit]
+        found = self.object_list.in_bulk([pk for _, pk in keys])
+        return [found[pk] for _, pk in keys if pk in found], len(keys)
+
+    def _fetch(self, values=None, reverse=False):
+        rows, fetched = self._merge(
+            self.parts(values, reverse), reverse, self.per_page + 1
+        )
+        has_more = fetched > self.per_page
+        rows = rows[:self.per_page]
+        if reverse:
+            rows.reverse()
+        return rows, has_more
+
+    def number_page(self, number):
+        end = number * self.per_page + 1
+        parts = [
+            paginator.object_list[:end]
+            for paginator in (self.entries, self.pending)
+        ]
+        rows, fetched = self._merge(parts, False, end)
+        offset = (number - 1) * self.per_page
+        return self._build_page(
+            rows[offset:offset + self.per_page], number, number > 1,
+            fetched > offset + self.per_page,
+        )
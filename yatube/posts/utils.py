@@ -1,8 +1,192 @@
-from django.core.paginator import Paginator
+import base64
+import binascii
+import json
+import math
+from datetime import datetime
 
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
 
-def paginator(request, posts, count_obj):
-    paginator = Paginator(posts, count_obj)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    return page_obj
+CURSOR_PARAM = 'cursor'
+PAGE_PARAM = 'page'
+NEXT = 'next'
+PREVIOUS = 'prev'
+# Дальше этой страницы старые ссылки ``?page=N`` не ведут.
+MAX_PAGE_NUMBER = 1000
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class CursorPaginator(Paginator):
+    """Постраничная навигация по ключу сортировки вместо OFFSET.
+
+    Страница выбирается условием ``(pub_date, id) < (последний на
+    предыдущей странице)``, поэтому стоимость запроса не растёт с номером
+    страницы и не требует ``COUNT(*)``. Курсоры непрозрачны для клиента:
+    это base64 от значений ключа, направления и номера страницы.
+    """
+
+    def __init__(self, object_list, per_page, ordering=('-pub_date', '-pk')):
+        self.ordering = tuple(ordering)
+        self.fields = tuple(name.lstrip('-') for name in self.ordering)
+        super().__init__(object_list.order_by(*self.ordering), per_page)
+
+    def encode_cursor(self, obj, direction, number):
+        values = [_dump_value(getattr(obj, name)) for name in self.fields]
+        raw = json.dumps({'v': values, 'd': direction, 'n': number})
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            values, direction = data['v'], data['d']
+            number = int(data['n'])
+        except (binascii.Error, ValueError, TypeError, KeyError):
+            raise InvalidCursor(cursor)
+        if (
+            direction not in (NEXT, PREVIOUS)
+            or not isinstance(values, list)
+            or len(values) != len(self.fields)
+            or number < 1
+        ):
+            raise InvalidCursor(cursor)
+        try:
+            values = [
+                self._to_python(name, value)
+                for name, value in zip(self.fields, values)
+            ]
+        except ValidationError:
+            raise InvalidCursor(cursor)
+        return values, direction, number
+
+    def _to_python(self, name, value):
+        opts = self.object_list.model._meta
+        if name == 'pk':
+            return opts.pk.to_python(value)
+        try:
+            return opts.get_field(name).to_python(value)
+        except FieldDoesNotExist:
+            # Аннотация (например, релевантность поиска) хранится как есть.
+            return value
+
+    def cursor_page(self, cursor=None):
+        """Страница после (или до) позиции, записанной в курсоре."""
+        if not cursor:
+            rows, has_next = self._fetch()
+            return self._build_page(rows, 1, False, has_next)
+        values, direction, number = self.decode_cursor(cursor)
+        if direction == NEXT:
+            rows, has_next = self._fetch(values)
+            return self._build_page(rows, number, True, has_next)
+        rows, has_previous = self._fetch(values, reverse=True)
+        return self._build_page(rows, number, has_previous, True)
+
+    def number_page(self, number):
+        """Совместимость со старыми ссылками вида ``?page=N``.
+
+        Первая страница по номеру всё ещё выбирается через OFFSET,
+        но дальнейшие ссылки уже ведут по курсорам.
+        """
+        offset = (number - 1) * self.per_page
+        rows = list(self.object_list[offset:offset + self.per_page + 1])
+        has_next = len(rows) > self.per_page
+        return self._build_page(
+            rows[:self.per_page], number, number > 1, has_next
+        )
+
+    def page_queryset(self, values=None, reverse=False):
+        """Запрос страницы с лишней строкой для проверки продолжения."""
+        queryset = self.object_list
+        if reverse:
+            queryset = queryset.reverse()
+        if values is not None:
+            queryset = queryset.filter(self._seek(values, reverse))
+        return queryset[:self.per_page + 1]
+
+    def _fetch(self, values=None, reverse=False):
+        rows = list(self.page_queryset(values, reverse))
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if reverse:
+            rows.reverse()
+        return rows, has_more
+
+    def _seek(self, values, reverse):
+        condition = Q()
+        for index, ordering in enumerate(self.ordering):
+            descending = ordering.startswith('-') != reverse
+            lookup = 'lt' if descending else 'gt'
+            step = Q(**{f'{self.fields[index]}__{lookup}': values[index]})
+            for name, value in zip(self.fields[:index], values[:index]):
+                step &= Q(**{name: value})
+            condition |= step
+        return condition
+
+    def _build_page(self, rows, number, has_previous, has_next):
+        page = Page(rows, number, self)
+        page.next_cursor = None
+        page.previous_cursor = None
+        if rows and has_next:
+            page.next_cursor = self.encode_cursor(rows[-1], NEXT, number + 1)
+        if rows and has_previous:
+            page.previous_cursor = self.encode_cursor(
+                rows[0], PREVIOUS, number - 1
+            )
+        return page
+
+
+def _dump_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def paginator(request, posts, count_obj, ordering=('-pub_date', '-pk'),
+              total=None):
+    """Страница по курсору или номеру.
+
+    ``total`` — оценка числа строк из ``posts.counts``: по ней шаблон
+    показывает номера соседних страниц и примерное их число.
+    """
+    return paginate(
+        request, CursorPaginator(posts, count_obj, ordering), total
+    )
+
+
+def paginate(request, cursor_paginator, total=None):
+    """То же, что ``paginator``, для готового ``CursorPaginator``."""
+    last_number = None
+    if total is not None:
+        last_number = max(
+            math.ceil(total.value / cursor_paginator.per_page), 1
+        )
+    page = _page(request, cursor_paginator, last_number)
+    page.total = total
+    page.last_number = last_number
+    return page
+
+
+def _page(request, paginator, last_number=None):
+    cursor = request.GET.get(CURSOR_PARAM)
+    if cursor:
+        try:
+            return paginator.cursor_page(cursor)
+        except InvalidCursor:
+            return paginator.cursor_page()
+    try:
+        page_number = int(request.GET.get(PAGE_PARAM, 1))
+    except (TypeError, ValueError):
+        page_number = 1
+    # Номер уходит в OFFSET: ограничиваем его оценкой числа страниц или
+    # MAX_PAGE_NUMBER, как это делал Paginator.get_page.
+    page_number = min(page_number, last_number or MAX_PAGE_NUMBER)
+    if page_number > 1:
+        page = paginator.number_page(page_number)
+        if page.object_list:
+            return page
+    # Страницы за концом (оценка устарела или её нет) — первая страница.
+    return paginator.cursor_page()
@@ -1,68 +1,194 @@
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.utils.functional import SimpleLazyObject
 from django.shortcuts import render, get_object_or_404
 from django.shortcuts import redirect
-from .models import Post, Group, User, Follow
+from .models import Comment, Post, Group, User, Follow
 from .forms import PostForm, CommentForm
+from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from .utils import paginator
+from .utils import (
+    CURSOR_PARAM, CursorPaginator, InvalidCursor, paginate, paginator,
+)
+from . import (
+    api, counters, counts, export, feed_cache, holes, http_cache, search,
+    threads, timeline,
+)
 
 
 FIRST_TEN_POSTS = 10
+COMMENTS_PER_PAGE = 20
+COMMENT_ORDERING = ('-created', '-pk')
 
 
+@http_cache.conditional_page(http_cache.index_state)
+@holes.filled
 def index(request):
-    posts = Post.objects.all()
-    page_obj = paginator(request, posts, FIRST_TEN_POSTS)
+    posts = Post.objects.for_feed()
+    page_obj = paginator(
+        request, posts, FIRST_TEN_POSTS, total=counts.estimate(counts.POSTS)
+    )
     context = {
         'page_obj': page_obj,
+        **feed_cache.fragment_context('index', request, feed_cache.POSTS),
     }
     return render(request, 'posts/index.html', context)
 
 
+@http_cache.conditional_page(http_cache.group_state)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all()
-    page_obj = paginator(request, posts, FIRST_TEN_POSTS)
+    posts = Post.objects.for_feed().filter(group=group)
+    page_obj = paginator(
+        request, posts, FIRST_TEN_POSTS,
+        total=counts.estimate(counts.group_scope(group.pk)),
+    )
     context = {
         'group': group,
-        'posts': posts,
-        'page_obj': page_obj
+        'page_obj': page_obj,
+        **feed_cache.fragment_context(
+            f'group:{group.pk}', request, feed_cache.POSTS
+        ),
     }
     return render(request, 'posts/group_list.html', context)
 
 
+@http_cache.conditional_page(http_cache.profile_state)
+@holes.filled
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    posts = author.posts.all()
-    page_obj = paginator(request, posts, FIRST_TEN_POSTS)
-    post_count = posts.count()
-    following = False
-    if request.user.is_authenticated:
-        following = Follow.objects.filter(
-            user=request.user, author=author
-        ).exists()
+    author = get_object_or_404(
+        User.objects.select_related('stats'), username=username
+    )
+    posts = Post.objects.for_feed().filter(author=author)
+    stats = counters.stats_for(author)
+    page_obj = paginator(
+        request, posts, FIRST_TEN_POSTS,
+        total=counts.Estimate(stats.posts_count, True),
+    )
+    # Кнопку подписки подставляет holes: тело страницы общее для всех.
     context = {
         'author': author,
-        'post_count': post_count,
+        'post_count': stats.posts_count,
+        'stats': stats,
         'page_obj': page_obj,
-        'following': following,
+        **feed_cache.fragment_context(
+            f'profile:{author.pk}',
+            request,
+            feed_cache.POSTS,
+            feed_cache.followers_scope(author.pk),
+            feed_cache.follow_scope(author.pk),
+        ),
     }
     return render(request, 'posts/profile.html', context)
 
 
+def comments_paginator(post_id):
+    """Корни веток поста по курсору на ``(created, id)``."""
+    comments = threads.with_preview(Comment.objects.filter(
+        post_id=post_id, parent__isnull=True
+    ).select_related('author').only(*threads.FIELDS))
+    return CursorPaginator(
+        comments, COMMENTS_PER_PAGE, ordering=COMMENT_ORDERING
+    )
+
+
+def comments_page(post_id, cursor=None):
+    """Страница веток: корни по курсору, под каждым первые ответы ветки;
+    всего два запроса."""
+    paginator = comments_paginator(post_id)
+    try:
+        page = paginator.cursor_page(cursor)
+    except InvalidCursor:
+        page = paginator.cursor_page()
+    threads.replies(page)
+    return page
+
+
+@http_cache.conditional_page(http_cache.post_state)
+@holes.filled
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
-    posts_count = post.author.posts.all().count()
-    form = CommentForm()
-    comments = post.comments.all()
+    post = get_object_or_404(Post.objects.for_detail(), pk=post_id)
+    posts_count = counters.stats_for(post.author).posts_count
+    # Запрос выполнится, только если тело страницы не в кэше. Ссылку
+    # «редактировать» и форму комментария подставляет holes.
+    comments = SimpleLazyObject(
+        lambda: comments_page(post.pk, request.GET.get(CURSOR_PARAM))
+    )
     context = {
         'post': post,
         'posts_count': posts_count,
-        'form': form,
+        'form': CommentForm(),
         'comments': comments,
+        **feed_cache.fragment_context(
+            f'post:{post.pk}',
+            request,
+            feed_cache.POSTS,
+            feed_cache.comments_scope(post.pk),
+        ),
     }
     return render(request, 'posts/post_detail.html', context)
 
 
+@http_cache.conditional_page(http_cache.post_state)
+def post_comments(request, post_id):
+    """Следующая порция веток: HTML-фрагмент или JSON.
+
+    С ``?parent=<id>`` вместо порции корней отдаёт поддерево ответов
+    под этим комментарием.
+    """
+    post = get_object_or_404(Post.objects.only('pk'), pk=post_id)
+    parent_id = request.GET.get('parent', '')
+    if parent_id.isdigit():
+        parent = get_object_or_404(
+            Comment.objects.only('id', 'thread', 'path'),
+            pk=parent_id,
+            post=post,
+        )
+        return render(request, 'posts/includes/comment_replies.html', {
+            'post': post,
+            'replies': threads.subtree(parent),
+        })
+    comments = comments_page(post.pk, request.GET.get(CURSOR_PARAM))
+    if request.GET.get('format') == 'json':
+        fields = api.COMMENT_FIELDS.items()
+        next_url = None
+        if comments.next_cursor:
+            next_url = api.link(request, comments.next_cursor)
+        return api.json_response({
+            'results': [
+                {
+                    **api.serialize(root, fields),
+                    'replies': [
+                        api.serialize(comment, fields)
+                        for comment in root.thread_replies
+                    ],
+                    'more_replies': root.more_replies,
+                }
+                for root in comments
+            ],
+            'next': next_url,
+        })
+    return render(request, 'posts/includes/comments.html', {
+        'post': post,
+        'comments': comments,
+    })
+
+
+def search_posts(request):
+    query = request.GET.get('q', '').strip()
+    page_obj = None
+    if query:
+        posts = search.get_backend().search(Post.objects.for_feed(), query)
+        page_obj = paginator(
+            request, posts, FIRST_TEN_POSTS, ordering=search.ORDERING
+        )
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+    }
+    return render(request, 'posts/search.html', context)
+
+
 @login_required
 def post_create(request):
     template = 'posts/create_post.html'
@@ -83,7 +209,7 @@ def post_create(request):
 def post_edit(request, post_id):
     template = 'posts/create_post.html'
     post = get_object_or_404(Post, pk=post_id)
-    if post.author != request.user:
+    if post.author_id != request.user.pk:
         return redirect("posts:post_detail", post_id=post_id)
 
     form = PostForm(
@@ -105,24 +231,66 @@ def post_edit(request, post_id):
 
 @login_required
 def add_comment(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
+    post = get_object_or_404(Post.objects.only('pk'), pk=post_id)
     form = CommentForm(request.POST or None)
     if form.is_valid():
         comment = form.save(commit=False)
         comment.author = request.user
         comment.post = post
-        comment.save()
+        parent_id = request.POST.get('parent')
+        try:
+            with transaction.atomic():
+                if parent_id:
+                    threads.reply(comment, parent_id)
+                comment.save()
+        except threads.ReplyNotAllowed as error:
+            # Текст ошибки покажет форма комментария на странице поста.
+            messages.error(request, str(error))
     return redirect('posts:post_detail', post_id=post_id)
 
 
 @login_required
+@holes.filled
 def follow_index(request):
-    posts = Post.objects.filter(author__following__user=request.user)
-    page_obj = paginator(request, posts, FIRST_TEN_POSTS)
-    context = {'page_obj': page_obj}
+    page_obj = paginate(
+        request, timeline.TimelinePaginator(request.user, FIRST_TEN_POSTS)
+    )
+    context = {
+        'page_obj': page_obj,
+        **feed_cache.fragment_context(
+            f'follow:{request.user.pk}',
+            request,
+            feed_cache.POSTS,
+            feed_cache.follow_scope(request.user.pk),
+        ),
+    }
     return render(request, 'posts/follow.html', context)
 
 
+@login_required
+def profile_export(request, username):
+    author = get_object_or_404(User, username=username)
+    if request.user != author and not request.user.is_staff:
+        return redirect('posts:profile', username=username)
+    export_format = request.GET.get('format', export.JSONL)
+    if export_format not in export.FORMATS:
+        export_format = export.JSONL
+    response = StreamingHttpResponse(
+        export.stream(
+            author,
+            export_format,
+            images='images' in request.GET,
+            comments='comments' in request.GET,
+            absolute_url=request.build_absolute_uri,
+        ),
+        content_type=export.FORMATS[export_format],
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename="{author.username}.{export_format}"'
+    )
+    return response
+
+
 @login_required
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
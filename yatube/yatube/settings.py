@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
 import os
+import tempfile
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -52,6 +53,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -60,6 +62,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'debug_toolbar.middleware.DebugToolbarMiddleware',
+    'core.middleware.ProfilerMiddleware',
 ]
 
 INTERNAL_IPS = [
@@ -70,7 +73,7 @@ ROOT_URLCONF = 'yatube.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'core.metrics.TimedDjangoTemplates',
         'DIRS': [os.path.join(BASE_DIR, 'templates')],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -151,8 +154,82 @@ CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Локальный LRU каждого воркера перед общим хранилищем. Для memcached
+# или redis достаточно заменить BACKEND и LOCATION у 'shared'. Каталог
+# файлового кэша свой у каждой копии проекта, его можно задать через
+# YATUBE_CACHE_DIR.
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+        'BACKEND': 'core.cache.TwoTierCache',
+        'OPTIONS': {
+            'SHARED': 'shared',
+            'LOCAL_MAX_ENTRIES': 1000,
+            'LOCAL_TIMEOUT': 5,
+            'SYNC_INTERVAL': 1,
+        },
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get(
+            'YATUBE_CACHE_DIR', os.path.join(BASE_DIR, 'cache')
+        ),
+    },
+}
+
+# manage.py test подменяет общее хранилище кэшем в памяти.
+TEST_RUNNER = 'core.runner.TestRunner'
+
+# Авторы с большим числом подписчиков не раскладывают посты по лентам,
+# их посты подмешиваются в /follow/ при чтении.
+TIMELINE_FANOUT_LIMIT = 1000
+
+# Фрагменты лент сбрасываются сигналами, TTL лишь ограничивает их возраст.
+FEED_CACHE_TIMEOUT = 60 * 5
+
+# Токен для /metrics/ (заголовок Authorization: Bearer <токен>); staff
+# видит метрики и без него.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# SQL-запросы дольше порога попадают в журнал медленных запросов
+# (админка, «Медленные запросы»); None отключает журнал.
+SLOW_QUERY_THRESHOLD_MS = 100
+SLOW_QUERY_TOP = 50
+
+# Профили запросов (админка, /admin/profiles/): каталог, сколько хранить
+# и случайная выборка 1 из N запросов к перечисленным view (0 — выключена).
+PROFILER_DIR = os.path.join(tempfile.gettempdir(), 'yatube_profiles')
+PROFILER_KEEP = 50
+PROFILER_SAMPLE_RATE = 0
+PROFILER_SAMPLE_VIEWS = ('posts:profile', 'posts:post_detail')
+
+# Сколько секунд прокси может отдавать анонимам сохранённую страницу.
+PAGE_CACHE_MAX_AGE = 60
+
+# Миниатюры, которые создаются в фоне сразу после загрузки картинки.
+THUMBNAIL_VARIANTS = {
+    'feed': ('960x339', {'crop': 'center', 'upscale': True}),
 }
+# 0 — создавать миниатюры в том же процессе сразу после сохранения поста.
+THUMBNAIL_PIPELINE_WORKERS = 2
+
+# Загруженные файлы всегда пишутся во временный файл, а не в память.
+FILE_UPLOAD_HANDLERS = [
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+# Мастер-копия картинки поста: длинная сторона, предел пикселей оригинала
+# (проверяется по заголовку), размер файла, формат (WEBP, если Pillow его
+# поддерживает, иначе JPEG) и качество.
+POST_IMAGE_MAX_SIZE = 2048
+POST_IMAGE_MAX_PIXELS = 50_000_000
+POST_IMAGE_MAX_BYTES = 20 * 1024 * 1024
+POST_IMAGE_FORMAT = 'WEBP'
+POST_IMAGE_QUALITY = 85
+
+# auto: FTS5 на SQLite, tsvector на PostgreSQL, иначе индекс SearchTerm.
+POSTS_SEARCH_BACKEND = 'auto'
+
+# Оценка числа постов для номеров страниц. auto: статистика планировщика
+# на PostgreSQL, таблица RowCount на SQLite; cached — COUNT(*) из кэша,
+# пересчитываемый в фоне раз в POSTS_COUNT_CACHE_MAX_AGE секунд.
+POSTS_COUNT_STRATEGY = 'auto'
+POSTS_COUNT_CACHE_MAX_AGE = 60 * 5